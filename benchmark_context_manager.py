@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+智能上下文管理器性能基准
+验证 add_context 的去重检查为O(1)、持久化为追加日志，批量插入总耗时随条目数线性增长；
+对比 json 与 sqlite 存储后端的选择、统计耗时；统计通过 add_context 添加的上下文项在渲染前后的内存占用与大快照加载耗时
+"""
+
+import os
+import sys
+import contextlib
+import time
+import json
+import shutil
+import tracemalloc
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.context_manager import SmartContextManager, ContextItem, ContextPriority, ContextType
+
+
+def _insert_items(manager: SmartContextManager, start: int, count: int, stages: list) -> float:
+    """插入一段上下文项并返回耗时，屏蔽逐条日志避免打印开销掩盖真实耗时"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        begin = time.perf_counter()
+        for i in range(start, start + count):
+            manager.add_context(
+                key=f"item_{i}",
+                value=f"第{i}条上下文内容：接口设计、数据模型与部署说明",
+                priority=ContextPriority.MEDIUM,
+                context_type=ContextType.IMPLEMENTATION,
+                stage=stages[i % len(stages)]
+            )
+        return time.perf_counter() - begin
+
+
+def benchmark_add_context(total: int = 50000, checkpoint: int = 10000):
+    """插入 total 个上下文项，每 checkpoint 个输出一次分段耗时"""
+    print(f"=== add_context 插入基准 ({total:,} 项) ===\n")
+    project_dir = tempfile.mkdtemp(prefix="bench_context_")
+    try:
+        manager = SmartContextManager(project_dir)
+        stages = list(manager.stage_dependencies.keys())
+        segment_times = []
+        for start in range(0, total, checkpoint):
+            segment_times.append(_insert_items(manager, start, checkpoint, stages))
+            print(f"   {start + checkpoint:>6,} 项: 本段 {segment_times[-1]:.3f} 秒, 累计 {sum(segment_times):.3f} 秒")
+        total_time = sum(segment_times)
+
+        # 线性增长时各分段耗时应基本持平，二次增长时末段约为首段的 (total/checkpoint) 倍
+        ratio = segment_times[-1] / segment_times[0] if segment_times[0] > 0 else 0
+        print(f"\n   总耗时: {total_time:.3f} 秒, 平均 {total_time / total * 1e6:.1f} 微秒/项")
+        print(f"   末段/首段耗时比: {ratio:.2f}")
+        manager.flush()
+        disk_bytes = sum(
+            os.path.getsize(path) for path in (manager.snapshot_file, manager.journal_file) if os.path.exists(path)
+        )
+        print(f"   快照+日志大小: {disk_bytes / 1024:.1f} KB")
+        return total_time, ratio
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+
+def benchmark_storage_backends(total: int = 20000, repeat: int = 20):
+    """对比两种存储后端的插入、上下文选择、统计和重新加载耗时"""
+    print(f"\n=== 存储后端对比 ({total:,} 项) ===\n")
+    for storage in ("json", "sqlite"):
+        project_dir = tempfile.mkdtemp(prefix=f"bench_{storage}_")
+        try:
+            manager = SmartContextManager(project_dir, storage=storage)
+            stages = list(manager.stage_dependencies.keys())
+            insert_time = _insert_items(manager, 0, total, stages)
+            manager.flush()
+            dependencies = manager.stage_dependencies["testing"]
+            
+            begin = time.perf_counter()
+            for _ in range(repeat):
+                manager._select_relevant_items("testing", "qa_engineer", dependencies)
+            select_time = (time.perf_counter() - begin) / repeat
+            
+            begin = time.perf_counter()
+            for _ in range(repeat):
+                manager.get_context_stats()
+            stats_time = (time.perf_counter() - begin) / repeat
+            
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                begin = time.perf_counter()
+                SmartContextManager(project_dir, storage=storage)
+                load_time = time.perf_counter() - begin
+            print(f"   {storage:>6}: 插入 {insert_time:.3f} 秒, 选择 {select_time * 1000:.2f} 毫秒, "
+                  f"统计 {stats_time * 1000:.2f} 毫秒, 加载 {load_time:.3f} 秒")
+        finally:
+            shutil.rmtree(project_dir, ignore_errors=True)
+
+
+def _markdown_doc(i: int) -> str:
+    """多章节Markdown文档，模拟阶段共识文档"""
+    sections = "\n\n".join(
+        f"## 第{j}部分\n" + "\n".join(f"- 第{i}号文档第{j}节要点{k}：接口、数据模型与部署约束" for k in range(6))
+        for j in range(8)
+    )
+    return f"# 文档{i}\n\n{sections}"
+
+def _manager_memory(values: list, stages: list) -> tuple:
+    """
+    通过 add_context 添加上下文项，返回 (添加后, 全部装箱渲染后) 管理器新增的内存字节数
+    语义索引矩阵按容量翻倍预分配，与条目结构无关，单独扣除
+    """
+    project_dir = tempfile.mkdtemp(prefix="bench_memory_")
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            manager = SmartContextManager(project_dir)
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            for i, value in enumerate(values):
+                manager.add_context(key=f"item_{i}", value=value, priority=ContextPriority.MEDIUM,
+                                    context_type=ContextType.IMPLEMENTATION, stage=stages[i % len(stages)])
+            index_bytes = manager.semantic_index._matrix.nbytes
+            added = tracemalloc.get_traced_memory()[0] - before - index_bytes
+            # 预算足够大时每项都升级到 full，三种粒度都被渲染过
+            manager._pack_items(list(manager.context_items.values()), budget=10 ** 12)
+            rendered = tracemalloc.get_traced_memory()[0] - before - index_bytes
+            tracemalloc.stop()
+        return added, rendered
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+def benchmark_item_memory(count: int = 10000, doc_count: int = 1000, snapshot_items: int = 50000):
+    """通过 add_context 添加上下文项的内存占用（添加后与首次装箱渲染后），以及加载大 smart_context.json 的耗时"""
+    print(f"\n=== 上下文项内存与加载 ===\n")
+    stages = ["requirement_analysis", "technical_design", "frontend_development", "backend_development"]
+    for label, values in ((f"{count:,} 项短文本", [f"第{i}条上下文内容：接口设计、数据模型与部署说明" for i in range(count)]),
+                          (f"{doc_count:,} 项Markdown文档", [_markdown_doc(i) for i in range(doc_count)])):
+        value_bytes = sum(sys.getsizeof(value) for value in values)
+        added, rendered = _manager_memory(values, stages)
+        print(f"   {label}（不含语义索引）: 添加后 {added / 1024 / 1024:.2f} MB，装箱渲染后 {rendered / 1024 / 1024:.2f} MB"
+              f"（值本身 {value_bytes / 1024 / 1024:.2f} MB）")
+    
+    project_dir = tempfile.mkdtemp(prefix="bench_load_")
+    try:
+        manager = SmartContextManager(project_dir)
+        data = {"items": {}}
+        for i in range(snapshot_items):
+            item = ContextItem(key=f"item_{i}", value=f"第{i}条上下文内容：接口设计、数据模型与部署说明",
+                               priority=ContextPriority.MEDIUM, context_type=ContextType.IMPLEMENTATION,
+                               stage=stages[i % len(stages)], timestamp=time.time())
+            data["items"][item.key] = manager._item_to_dict(item)
+        with open(manager.snapshot_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            begin = time.perf_counter()
+            SmartContextManager(project_dir)
+            load_time = time.perf_counter() - begin
+        print(f"   加载 {snapshot_items:,} 项快照 ({os.path.getsize(manager.snapshot_file) / 1024 / 1024:.1f} MB): {load_time:.3f} 秒")
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    benchmark_add_context()
+    benchmark_storage_backends()
+    benchmark_item_memory()
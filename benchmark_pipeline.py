@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+完整流程离线基准
+使用本地模拟LLM（config/fake_llm.yaml）离线执行一次完整的 AiTeamCrew.kickoff，
+按阶段统计耗时中等待LLM的时间与框架自身的时间（上下文构建、代码提取、进度写入、自动执行等）、Token和写入的文件；
+可与保存的基线比较，框架耗时超出容差或阶段先于其依赖开始时以非零退出码结束，用作CI回归门禁
+
+    python benchmark_pipeline.py --save bench_baseline.json
+    python benchmark_pipeline.py --baseline bench_baseline.json --tolerance 0.3
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import statistics
+import tempfile
+import contextlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import typer
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+BENCHMARK_REQUIREMENTS = "员工请假审批小程序：员工提交请假申请，主管审批，HR查看统计报表"
+# 框架耗时的绝对容差（秒），避免耗时很短时的计时抖动误报
+ABSOLUTE_SLACK = 0.5
+# 唯一没有前置依赖的阶段；其他阶段依赖为空时会与它并发执行
+ROOT_STAGES = ("requirement_analysis",)
+# 阶段起止时间保留到毫秒，比较先后时允许的舍入误差（秒）
+ORDER_SLACK = 0.001
+
+
+def _union_seconds(intervals: List[Tuple[float, float]]) -> float:
+    """区间并集的总长度：并发的LLM调用只计一次等待时间"""
+    total, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _written_files(project_dir: str) -> Tuple[int, int]:
+    count, size = 0, 0
+    for root, _, files in os.walk(project_dir):
+        for name in files:
+            count += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return count, size
+
+
+def run_pipeline(latency: float, keep_dir: bool = False) -> Dict[str, Any]:
+    """离线执行一次完整流程，返回总体与各阶段的耗时拆分"""
+    from src.crew import AiTeamCrew, ProgressManager
+
+    project_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        crew = AiTeamCrew(project_id="benchmark", project_dir=project_dir)
+        with open(os.path.join(project_dir, "benchmark_output.log"), 'w', encoding='utf-8') as log, \
+                contextlib.redirect_stdout(log):
+            begin = time.time()
+            crew.kickoff({"project_name": "benchmark", "requirements": BENCHMARK_REQUIREMENTS})
+            wall_time = time.time() - begin
+
+        calls = _read_jsonl(os.path.join(project_dir, "llm_calls.jsonl"))
+        with open(os.path.join(project_dir, "usage.json"), 'r', encoding='utf-8') as f:
+            usage = json.load(f)
+        intervals = [(c["started"], c["started"] + c.get("duration", 0)) for c in calls if "started" in c]
+        llm_wait = _union_seconds(intervals)
+        dependencies = crew._stage_dependencies()
+        stages = {}
+        for stage, duration in crew.stage_durations.items():
+            stage_calls = [c for c in calls if c.get("stage") == stage]
+            stage_wait = _union_seconds([(c["started"], c["started"] + c.get("duration", 0)) for c in stage_calls])
+            stage_usage = usage.get("by_stage", {}).get(stage, {})
+            stages[stage] = {
+                "wall_time": round(duration, 3),
+                "llm_wait": round(stage_wait, 3),
+                "framework_time": round(max(0.0, duration - stage_wait), 3),
+                "calls": len(stage_calls),
+                "tokens": stage_usage.get("prompt_tokens", 0) + stage_usage.get("completion_tokens", 0),
+                # 相对 kickoff 开始的起止时间，门禁据此检查阶段顺序
+                "started": round(crew.stage_spans[stage][0] - begin, 3),
+                "finished": round(crew.stage_spans[stage][1] - begin, 3),
+                "dependencies": [dep for dep in dependencies.get(stage, []) if dep in dependencies],
+            }
+        files, size = _written_files(project_dir)
+        progress = ProgressManager(project_dir).get_progress_summary()
+        return {
+            "latency": latency,
+            "wall_time": round(wall_time, 3),
+            "llm_wait": round(llm_wait, 3),
+            "framework_time": round(max(0.0, wall_time - llm_wait), 3),
+            "calls": len(calls),
+            "failed_calls": sum(1 for c in calls if c.get("status") != "ok"),
+            "prompt_tokens": usage["project"]["prompt_tokens"],
+            "completion_tokens": usage["project"]["completion_tokens"],
+            "files": files,
+            "bytes": size,
+            "stages_completed": f"{progress['completed']}/{progress['total']}",
+            "all_completed": progress["completed"] == progress["total"],
+            "stages": stages,
+            "project_dir": project_dir if keep_dir else None,
+        }
+    finally:
+        if not keep_dir:
+            shutil.rmtree(project_dir, ignore_errors=True)
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"{'阶段':<24}{'开始':>8}{'总耗时':>10}{'LLM等待':>10}{'框架':>10}{'调用':>6}{'Tokens':>10}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<24}{s['started']:>8.3f}{s['wall_time']:>10.3f}{s['llm_wait']:>10.3f}{s['framework_time']:>10.3f}"
+              f"{s['calls']:>6}{s['tokens']:>10}")
+    print(f"\n   总耗时 {result['wall_time']:.3f} 秒 = LLM等待 {result['llm_wait']:.3f} 秒 + 框架 {result['framework_time']:.3f} 秒"
+          f"（模拟延迟 {result['latency']} 秒/次）")
+    print(f"   LLM调用 {result['calls']} 次（失败 {result['failed_calls']}），输入 {result['prompt_tokens']} tokens，"
+          f"输出 {result['completion_tokens']} tokens")
+    print(f"   写入文件 {result['files']} 个，共 {result['bytes'] / 1024:.1f} KB，完成阶段 {result['stages_completed']}")
+
+
+def check_stage_order(stages: Dict[str, Dict[str, Any]]) -> List[str]:
+    """每个阶段都应在其声明的依赖完成之后才开始；除需求分析外，每个阶段都应声明依赖"""
+    failures = []
+    for stage, s in stages.items():
+        if not s["dependencies"] and stage not in ROOT_STAGES:
+            failures.append(f"阶段 {stage} 没有声明依赖，会在流程开始时与 {'/'.join(ROOT_STAGES)} 并发执行")
+        for dep in s["dependencies"]:
+            if dep not in stages:
+                failures.append(f"阶段 {stage} 的依赖 {dep} 未执行")
+            elif s["started"] < stages[dep]["finished"] - ORDER_SLACK:
+                failures.append(f"阶段 {stage} 在 {s['started']:.3f} 秒开始，早于依赖 {dep} 完成的 "
+                                f"{stages[dep]['finished']:.3f} 秒")
+    return failures
+
+
+def check_regression(result: Dict[str, Any], baseline: Optional[Dict[str, Any]], tolerance: float,
+                     max_framework: Optional[float]) -> List[str]:
+    """返回门禁失败原因，空列表表示通过"""
+    failures = []
+    if not result["all_completed"]:
+        failures.append(f"流程未全部完成：{result['stages_completed']}")
+    failures.extend(check_stage_order(result["stages"]))
+    if result["failed_calls"]:
+        failures.append(f"{result['failed_calls']} 次LLM调用失败")
+    if max_framework is not None and result["framework_time"] > max_framework:
+        failures.append(f"框架耗时 {result['framework_time']:.3f} 秒超过上限 {max_framework} 秒")
+    if baseline:
+        limit = baseline["framework_time"] * (1 + tolerance) + ABSOLUTE_SLACK
+        if result["framework_time"] > limit:
+            failures.append(f"框架耗时 {result['framework_time']:.3f} 秒超过基线 {baseline['framework_time']:.3f} 秒"
+                            f"的容差上限 {limit:.3f} 秒")
+        if result["prompt_tokens"] > baseline["prompt_tokens"] * (1 + tolerance):
+            failures.append(f"输入Token {result['prompt_tokens']} 超过基线 {baseline['prompt_tokens']} 的容差")
+    return failures
+
+
+def main(
+    latency: float = typer.Option(0.05, "--latency", help="模拟LLM每次调用的延迟秒数"),
+    runs: int = typer.Option(3, "--runs", help="执行次数，取框架耗时的中位数"),
+    baseline: Optional[str] = typer.Option(None, "--baseline", help="基线结果文件，超出容差时返回非零退出码"),
+    tolerance: float = typer.Option(0.3, "--tolerance", help="相对基线允许增加的比例"),
+    max_framework: Optional[float] = typer.Option(None, "--max-framework-seconds", help="框架耗时的绝对上限"),
+    save: Optional[str] = typer.Option(None, "--save", help="保存本次结果（可作为基线）"),
+    keep: bool = typer.Option(False, "--keep", help="保留最后一次运行的项目目录")
+):
+    """离线执行完整流程并拆分LLM等待与框架耗时"""
+    os.environ.update({
+        "AI_TEAM_LLM_PROVIDER": "fake",
+        "AI_TEAM_FAKE_LATENCY": str(latency),
+        "AI_TEAM_LLM_STREAM": "off",
+        "AI_TEAM_LLM_CACHE": "off",
+    })
+    for name in ("AI_TEAM_BUDGET_SOFT", "AI_TEAM_BUDGET_HARD", "AI_TEAM_FAKE_429_RATE"):
+        os.environ.pop(name, None)
+
+    print(f"=== 完整流程离线基准（{runs} 次，模拟延迟 {latency} 秒） ===\n")
+    results = []
+    for i in range(runs):
+        results.append(run_pipeline(latency, keep_dir=keep and i == runs - 1))
+        print(f"   第{i + 1}次: 总耗时 {results[-1]['wall_time']:.3f} 秒，框架 {results[-1]['framework_time']:.3f} 秒")
+    median = statistics.median(r["framework_time"] for r in results)
+    result = min(results, key=lambda r: abs(r["framework_time"] - median))
+    print()
+    print_report(result)
+    if result["project_dir"]:
+        print(f"   项目目录: {result['project_dir']}")
+
+    if save:
+        with open(save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"   结果已保存: {save}")
+
+    baseline_result = None
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            baseline_result = json.load(f)
+    failures = check_regression(result, baseline_result, tolerance, max_framework)
+    if failures:
+        print("\n[基准门禁] 未通过:")
+        for reason in failures:
+            print(f"   - {reason}")
+        raise typer.Exit(1)
+    if baseline_result or max_framework is not None:
+        print("\n[基准门禁] 通过")
+
+
+if __name__ == "__main__":
+    typer.run(main)
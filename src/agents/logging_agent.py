@@ -2,9 +2,14 @@ import os
 import sys
 import datetime
 import json as _json
+import threading
 from crewai import Agent, Task
 from pydantic import PrivateAttr
 from typing import Optional
+from ..blob_store import get_blob_store
+
+# 多个Agent并发执行时串行写入同一个日志文件
+_LOG_LOCK = threading.Lock()
 
 class LoggingAgent(Agent):
     """
@@ -51,15 +56,16 @@ class LoggingAgent(Agent):
         print(f"【输出Result】\n{result}")
         print(f"============================================\n")
         sys.stdout.flush()
-        # 日志落盘
+        # 日志落盘，长文本写入 blobs/ 只记录引用
         if self._project_dir:
             log_path = os.path.join(self._project_dir, 'llm_log.txt')
-            with open(log_path, 'a', encoding='utf-8') as f:
+            blobs = get_blob_store(self._project_dir)
+            with _LOG_LOCK, open(log_path, 'a', encoding='utf-8') as f:
                 f.write(f"[{now}] 角色: {role} 任务: {task_name}\n")
-                f.write(f"【输入Prompt】\n{task_prompt}\n")
+                f.write(f"【输入Prompt】\n{blobs.log_text(task_prompt)}\n")
                 if context:
-                    f.write(f"【上下文】\n{context}\n")
-                f.write(f"【输出Result】\n{result}\n")
+                    f.write(f"【上下文】\n{blobs.log_text(context)}\n")
+                f.write(f"【输出Result】\n{blobs.log_text(str(result))}\n")
                 f.write(f"--------------------------------------------\n")
         # === 自动产出落盘机制（结构化产出） ===
         if self._project_dir and isinstance(self._project_dir, str) and self._project_dir.strip() != "" and task_name:
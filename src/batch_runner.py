@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import traceback
+import multiprocessing
+from contextlib import redirect_stderr, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+from .rate_limiter import connect_shared_scheduler, start_shared_scheduler
+from .usage_meter import get_usage_meter
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cost")
+
+def load_manifest(path: str) -> List[Dict[str, str]]:
+    """
+    读取批量清单（YAML 或 JSON），格式为项目列表或 {"projects": [...]}，每项包含 project_name 和 requirements
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or []
+    entries = data.get("projects", []) if isinstance(data, dict) else data
+    projects, seen = [], set()
+    for index, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict) or not entry.get("project_name") or not entry.get("requirements"):
+            raise ValueError(f"清单第{index}项缺少 project_name 或 requirements")
+        name = str(entry["project_name"]).strip()
+        if name in seen:
+            raise ValueError(f"清单中项目名重复: {name}")
+        seen.add(name)
+        projects.append({"project_name": name, "requirements": str(entry["requirements"])})
+    return projects
+
+def _project_usage(project_dir: str) -> Dict[str, float]:
+    usage_file = os.path.join(project_dir, 'usage.json')
+    try:
+        with open(usage_file, 'r', encoding='utf-8') as f:
+            project = json.load(f).get("project", {})
+    except (OSError, ValueError):
+        project = {}
+    return {field: project.get(field, 0) for field in USAGE_FIELDS}
+
+def run_project(project_name: str, requirements: str, projects_root: str, log_dir: str) -> Dict[str, Any]:
+    """
+    在工作进程中执行一个项目，输出写入 <log_dir>/<项目名>.log，返回状态、耗时和本次运行的用量
+    用量取 usage.json 运行前后的差值（重跑的项目在已有用量上累加）
+    """
+    from .crew import AiTeamCrew, ProgressManager
+
+    project_dir = os.path.join(projects_root, project_name)
+    os.makedirs(project_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    usage_before = _project_usage(project_dir)
+    summary = {"project_name": project_name, "project_dir": project_dir, "status": "failed", "error": None}
+    started = time.time()
+    with open(os.path.join(log_dir, f"{project_name.replace(' ', '_')}.log"), 'w', encoding='utf-8') as log, \
+            redirect_stdout(log), redirect_stderr(log):
+        try:
+            crew = AiTeamCrew(project_dir=project_dir)
+            crew.kickoff({"project_name": project_name, "requirements": requirements})
+        except Exception as e:
+            summary["error"] = str(e)
+            traceback.print_exc()
+        finally:
+            # 用量按时间间隔批量写盘，读取前落盘本次运行未写入的部分
+            get_usage_meter(project_dir).flush()
+    summary["wall_time"] = round(time.time() - started, 1)
+    progress = ProgressManager(project_dir).get_progress_summary()
+    summary["stages"] = f"{progress['completed']}/{progress['total']}"
+    if summary["error"] is None:
+        summary["status"] = "completed" if progress["completed"] == progress["total"] else "partial"
+    usage_after = _project_usage(project_dir)
+    summary.update({field: round(usage_after[field] - usage_before[field], 6) for field in USAGE_FIELDS})
+    return summary
+
+def run_batch(projects: List[Dict[str, str]], workers: int, projects_root: str, log_dir: str,
+              on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    按进程池并发执行多个项目：
+    - 每个项目在独立进程中运行，互不共享 Agent 状态
+    - 所有工作进程的LLM请求经主进程托管的同一个调度器排队，合计不超过模型限额
+    返回汇总 {"projects": [...], "totals": {...}}，项目按清单顺序排列
+    """
+    # 父进程可能已有后台线程，fork 后的子进程可能死锁，统一使用 spawn
+    ctx = multiprocessing.get_context("spawn")
+    manager = start_shared_scheduler(ctx)
+    authkey = bytes(multiprocessing.current_process().authkey)
+    results: Dict[str, Dict[str, Any]] = {}
+    started = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=ctx, initializer=connect_shared_scheduler,
+                                 initargs=(manager.address, authkey)) as pool:
+            futures = {pool.submit(run_project, p["project_name"], p["requirements"], projects_root, log_dir): p
+                       for p in projects}
+            for future in as_completed(futures):
+                name = futures[future]["project_name"]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 工作进程异常退出
+                    result = {"project_name": name, "status": "failed", "error": str(e), "wall_time": None}
+                results[name] = result
+                if on_result:
+                    on_result(result)
+        scheduler_summary = manager.scheduler().summary()
+    finally:
+        manager.shutdown()
+    ordered = [results[p["project_name"]] for p in projects]
+    totals = {field: round(sum(r.get(field) or 0 for r in ordered), 6) for field in USAGE_FIELDS}
+    totals.update({
+        "projects": len(ordered),
+        "completed": sum(1 for r in ordered if r["status"] == "completed"),
+        "failed": sum(1 for r in ordered if r["status"] == "failed"),
+        "wall_time": round(time.time() - started, 1),
+        "workers": workers,
+        "scheduler": scheduler_summary,
+    })
+    return {"projects": ordered, "totals": totals}
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = [f"{'项目':<24}{'状态':<10}{'阶段':<8}{'耗时(秒)':>10}{'Tokens':>12}{'费用($)':>10}"]
+    for r in summary["projects"]:
+        tokens = (r.get("prompt_tokens") or 0) + (r.get("completion_tokens") or 0)
+        wall_time = f"{r['wall_time']:.1f}" if r.get("wall_time") is not None else "-"
+        lines.append(f"{r['project_name']:<24}{r['status']:<10}{r.get('stages', '-'):<8}"
+                     f"{wall_time:>10}{tokens:>12}{r.get('cost') or 0:>10.4f}")
+    totals = summary["totals"]
+    lines.append(f"共 {totals['projects']} 个项目，完成 {totals['completed']}，失败 {totals['failed']}，"
+                 f"总耗时 {totals['wall_time']:.1f} 秒（并发 {totals['workers']}），"
+                 f"Tokens {totals['prompt_tokens'] + totals['completion_tokens']}，费用 ${totals['cost']:.4f}")
+    lines.append(f"LLM请求调度: {totals['scheduler']}")
+    return "\n".join(lines)
@@ -0,0 +1,152 @@
+import os
+import re
+import zlib
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, Optional, Set
+
+# 状态文件中的引用格式：{"$blob": "<摘要>"}；日志中的引用格式：<blob:<摘要> N字符>
+BLOB_REF_KEY = "$blob"
+BLOB_DIR = "blobs"
+# 在项目文件中查找引用，JSON（快照、日志、进度、SQLite行）与文本日志两种格式
+_REF_PATTERN = re.compile(rb'(?:"\$blob":\s*"|<blob:)([0-9a-f]{32})')
+
+class BlobStore:
+    """
+    内容寻址的大文本存储：摘要 -> 压缩内容，存放在 <项目目录>/blobs/ 下
+    - 相同内容只存一份，上下文、进度文件、讨论断点和日志中只保存引用
+    - 摘要相同即内容相同，可直接用于相等性判断
+    - collect_garbage 删除项目中已没有任何文件引用的内容
+    """
+
+    def __init__(self, root: str, min_size: int = 1024):
+        self.root = root
+        # 短于该长度的字符串直接内联，避免产生大量小文件
+        self.min_size = min_size
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, text: str) -> str:
+        """写入文本并返回摘要，已存在时不重复写入"""
+        digest = self.digest(text)
+        path = self._path(digest)
+        if os.path.exists(path):
+            # 刷新修改时间，垃圾回收的宽限期从最近一次写入算起
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(text.encode('utf-8')))
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> str:
+        with open(self._path(digest), 'rb') as f:
+            return zlib.decompress(f.read()).decode('utf-8')
+
+    def ref(self, text: str) -> Dict[str, str]:
+        return {BLOB_REF_KEY: self.put(text)}
+
+    @staticmethod
+    def ref_digest(value: Any) -> Optional[str]:
+        """value 为引用时返回摘要，否则返回None"""
+        if isinstance(value, dict) and len(value) == 1 and BLOB_REF_KEY in value:
+            return value[BLOB_REF_KEY]
+        return None
+
+    def pack(self, value: Any) -> Any:
+        """把嵌套结构中的长字符串替换为引用"""
+        if isinstance(value, str):
+            return self.ref(value) if len(value) >= self.min_size else value
+        if isinstance(value, dict):
+            return {k: self.pack(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.pack(v) for v in value]
+        return value
+
+    def unpack(self, value: Any) -> Any:
+        """把嵌套结构中的引用还原为原文"""
+        if isinstance(value, str):
+            return value
+        digest = self.ref_digest(value)
+        if digest is not None:
+            return self.get(digest)
+        if isinstance(value, dict):
+            return {k: self.unpack(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.unpack(v) for v in value]
+        return value
+
+    def log_text(self, text: str, excerpt_chars: int = 200) -> str:
+        """写入文本日志时，长文本替换为引用和开头摘录"""
+        if len(text) < self.min_size:
+            return text
+        return f"<blob:{self.put(text)} {len(text)}字符> {text[:excerpt_chars]}..."
+
+    def stored_digests(self) -> Set[str]:
+        digests = set()
+        if not os.path.isdir(self.root):
+            return digests
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if os.path.isdir(directory):
+                digests.update(prefix + name for name in os.listdir(directory) if not name.endswith(".tmp"))
+        return digests
+
+    @staticmethod
+    def referenced_digests(paths: Iterable[str]) -> Set[str]:
+        """扫描文件中出现的引用"""
+        digests = set()
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    digests.update(match.decode('ascii') for match in _REF_PATTERN.findall(f.read()))
+            except OSError:
+                continue
+        return digests
+
+    def collect_garbage(self, project_dir: str, grace_seconds: float = 300.0) -> int:
+        """
+        按可达性回收：扫描项目目录下（blobs/ 之外）所有文件中的引用，删除不再被引用的内容，返回删除数
+        最近 grace_seconds 秒内写入的内容不回收，避免删掉引用尚未落盘的新内容；调用前应先落盘缓冲的状态
+        """
+        root = os.path.abspath(self.root)
+        paths = []
+        for directory, dirnames, filenames in os.walk(project_dir):
+            if os.path.abspath(directory) == root:
+                dirnames[:] = []
+                continue
+            dirnames[:] = [d for d in dirnames if os.path.abspath(os.path.join(directory, d)) != root]
+            paths.extend(os.path.join(directory, name) for name in filenames)
+        live = self.referenced_digests(paths)
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for digest in self.stored_digests() - live:
+            path = self._path(digest)
+            try:
+                if os.path.getmtime(path) <= cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+_stores: Dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+def get_blob_store(project_dir: str) -> BlobStore:
+    """项目共享的内容寻址存储：<项目目录>/blobs/"""
+    root = os.path.abspath(os.path.join(project_dir, BLOB_DIR))
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = BlobStore(root)
+        return store
@@ -0,0 +1,146 @@
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .context_index import HashingEmbedder
+
+# 要求Agent在发言末尾附上的投票块
+VOTE_INSTRUCTIONS = """请在发言最后附上投票块（格式固定，每项一行，多项用"；"分隔，没有写"无"）：
+【投票】
+立场: 同意 / 反对 / 保留
+共识点: 你认可的结论
+分歧点: 你仍不同意的地方
+待澄清: 需要其他角色回答的问题"""
+
+VOTE_MARKER = "【投票】"
+_VOTE_FIELD_PATTERN = re.compile(r'^[ \t\-*]*(立场|共识点|分歧点|待澄清)[ \t]*[:：][ \t]*(.*)$', re.MULTILINE)
+_ITEM_SPLIT_PATTERN = re.compile(r'[；;]')
+_EMPTY_ITEMS = {"", "无", "暂无", "没有", "none", "n/a"}
+
+STANCE_AGREE = "同意"
+STANCE_OBJECT = "反对"
+STANCE_ABSTAIN = "保留"
+STANCE_MISSING = "未投票"
+
+class Vote(NamedTuple):
+    stance: str
+    agreed: List[str]
+    disagreed: List[str]
+    unclear: List[str]
+
+def _normalize_stance(text: str) -> str:
+    if any(word in text for word in ("不同意", "反对", "不支持")):
+        return STANCE_OBJECT
+    if any(word in text for word in ("同意", "支持", "赞成", "认可")):
+        return STANCE_AGREE
+    return STANCE_ABSTAIN
+
+def _split_items(text: str) -> List[str]:
+    return [item.strip() for item in _ITEM_SPLIT_PATTERN.split(text) if item.strip().lower() not in _EMPTY_ITEMS]
+
+def parse_vote(text: str) -> Vote:
+    """解析发言末尾的投票块，没有投票块时立场为“未投票”"""
+    start = text.rfind(VOTE_MARKER)
+    if start < 0:
+        return Vote(STANCE_MISSING, [], [], [])
+    fields = {name: value.strip() for name, value in _VOTE_FIELD_PATTERN.findall(text, start)}
+    if "立场" not in fields:
+        return Vote(STANCE_MISSING, [], [], [])
+    return Vote(_normalize_stance(fields["立场"]),
+                _split_items(fields.get("共识点", "")),
+                _split_items(fields.get("分歧点", "")),
+                _split_items(fields.get("待澄清", "")))
+
+def strip_vote(text: str) -> str:
+    """去掉投票块，只保留发言正文"""
+    start = text.rfind(VOTE_MARKER)
+    return text[:start].rstrip() if start >= 0 else text
+
+
+class ConsensusTracker:
+    """
+    多轮讨论的共识判定：
+    - 投票一致：所有Agent都投了“同意”且没有分歧点
+    - 收敛停滞：各Agent本轮与上一轮发言正文的平均相似度连续 patience 轮不低于 plateau_similarity，
+      说明观点已不再变化，继续讨论没有收益
+    每轮的投票分布、一致率和收敛度记录在 metrics 中
+    """
+
+    def __init__(self, plateau_similarity: float = 0.92, patience: int = 1, participants: Optional[int] = None,
+                 embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None):
+        # 参与讨论的Agent数，发言异常的Agent按未投票计算
+        self.participants = participants
+        self.plateau_similarity = plateau_similarity
+        self.patience = patience
+        self.embed_fn = embed_fn or HashingEmbedder()
+        self.metrics: List[Dict] = []
+        self.votes: Dict[str, Vote] = {}
+        self.stop_reason: Optional[str] = None
+        self._previous: Dict[str, np.ndarray] = {}
+        self._plateau_rounds = 0
+
+    def observe(self, round_num: int, statements: List[Tuple[str, str]]) -> Dict:
+        """记录一轮发言（(角色, 发言) 列表），返回本轮指标并更新停止原因"""
+        self.votes = {role: parse_vote(text) for role, text in statements}
+        vectors = self.embed_fn([strip_vote(text) for _, text in statements]) if statements else []
+        current = {role: vector for (role, _), vector in zip(statements, vectors)}
+        similarities = [float(np.dot(vector, self._previous[role])) for role, vector in current.items() if role in self._previous]
+        convergence = sum(similarities) / len(similarities) if similarities else None
+        self._previous = current
+
+        participants = max(self.participants or 0, len(statements))
+        stances = [vote.stance for vote in self.votes.values()]
+        stances += [STANCE_MISSING] * (participants - len(stances))
+        distribution = {stance: stances.count(stance)
+                        for stance in (STANCE_AGREE, STANCE_OBJECT, STANCE_ABSTAIN, STANCE_MISSING)}
+        disagreements = sum(len(vote.disagreed) for vote in self.votes.values())
+        agreement = distribution[STANCE_AGREE] / len(stances) if stances else 0.0
+
+        if convergence is not None and convergence >= self.plateau_similarity:
+            self._plateau_rounds += 1
+        else:
+            self._plateau_rounds = 0
+
+        if participants < 2:
+            self.stop_reason = "单Agent发言"
+        elif agreement == 1.0 and disagreements == 0:
+            self.stop_reason = "投票一致"
+        elif self._plateau_rounds >= self.patience:
+            self.stop_reason = "观点收敛"
+        else:
+            self.stop_reason = None
+
+        metrics = {
+            "round": round_num,
+            "votes": distribution,
+            "agreement": round(agreement, 3),
+            "disagreements": disagreements,
+            "convergence": round(convergence, 3) if convergence is not None else None,
+            "stop_reason": self.stop_reason
+        }
+        self.metrics.append(metrics)
+        return metrics
+
+    @property
+    def agreed(self) -> bool:
+        return self.stop_reason in ("投票一致", "单Agent发言")
+
+    def status(self) -> Dict[str, List[str]]:
+        """汇总最近一轮投票中的共识点、分歧点和待澄清问题（按出现顺序去重）"""
+        status = {"agreed_points": [], "disagreed_points": [], "unclear_points": []}
+        for vote in self.votes.values():
+            for name, items in (("agreed_points", vote.agreed), ("disagreed_points", vote.disagreed),
+                                ("unclear_points", vote.unclear)):
+                for item in items:
+                    if item not in status[name]:
+                        status[name].append(item)
+        # 仍有人提出分歧的点不算共识
+        status["agreed_points"] = [p for p in status["agreed_points"] if p not in status["disagreed_points"]]
+        return status
+
+    @staticmethod
+    def describe(metrics: Dict) -> str:
+        votes = "/".join(f"{stance}{count}" for stance, count in metrics["votes"].items() if count)
+        convergence = "-" if metrics["convergence"] is None else f"{metrics['convergence']:.2f}"
+        return f"投票 {votes}，一致率 {metrics['agreement']:.0%}，分歧点 {metrics['disagreements']}，收敛度 {convergence}"
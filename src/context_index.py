@@ -0,0 +1,99 @@
+import re
+import zlib
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+_WORD_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9_\-\.]+|\d+')
+_CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+')
+
+class HashingEmbedder:
+    """
+    本地哈希向量化：中文按单字+相邻双字、英文按单词做特征哈希，L2归一化。
+    无需下载模型，适合在写入上下文时同步计算；需要更高质量时可替换为BGE等句向量模型
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        features = [w.lower() for w in _WORD_PATTERN.findall(text)]
+        for run in _CJK_PATTERN.findall(text):
+            features.extend(run)
+            features.extend(run[i:i + 2] for i in range(len(run) - 1))
+        return features
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                vectors[row, zlib.crc32(feature.encode('utf-8')) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SemanticIndex:
+    """上下文项的内存向量索引：写入时向量化一次，查询时一次矩阵乘法得到全部相似度"""
+
+    def __init__(self, embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None, dim: int = 512):
+        self.embed_fn = embed_fn or HashingEmbedder(dim)
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._pending: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._pending)
+
+    def add(self, key: str, text: str, defer: bool = False) -> None:
+        """写入或替换一个上下文项的向量；defer=True 时延迟到下次查询批量向量化"""
+        self.remove(key)
+        if defer:
+            self._pending[key] = text
+        else:
+            self._insert([key], self.embed_fn([text]))
+
+    def remove(self, key: str) -> None:
+        """删除向量：用最后一行覆盖被删行，保持矩阵紧凑"""
+        self._pending.pop(key, None)
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self._keys) - 1
+        if row != last:
+            moved = self._keys[last]
+            self._keys[row] = moved
+            self._matrix[row] = self._matrix[last]
+            self._rows[moved] = row
+        self._keys.pop()
+
+    def _insert(self, keys: List[str], vectors: np.ndarray) -> None:
+        count = len(self._keys)
+        needed = count + len(keys)
+        if self._matrix is None:
+            self._matrix = np.zeros((max(needed, 64), vectors.shape[1]), dtype=np.float32)
+        elif needed > self._matrix.shape[0]:
+            grown = np.zeros((max(needed, self._matrix.shape[0] * 2), self._matrix.shape[1]), dtype=np.float32)
+            grown[:count] = self._matrix[:count]
+            self._matrix = grown
+        self._matrix[count:needed] = vectors
+        for offset, key in enumerate(keys):
+            self._rows[key] = count + offset
+            self._keys.append(key)
+
+    def _flush_pending(self) -> None:
+        if self._pending:
+            keys = list(self._pending)
+            vectors = self.embed_fn([self._pending[k] for k in keys])
+            self._pending.clear()
+            self._insert(keys, vectors)
+
+    def similarities(self, query: str) -> Dict[str, float]:
+        """计算查询与全部上下文项的余弦相似度"""
+        self._flush_pending()
+        if not self._keys:
+            return {}
+        query_vector = self.embed_fn([query])[0]
+        scores = self._matrix[:len(self._keys)] @ query_vector
+        return dict(zip(self._keys, scores.tolist()))
@@ -1,12 +1,23 @@
 import json
 import hashlib
 import re
-from typing import Dict, List, Any, Optional, Set
-from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Set, Tuple, Callable
 from enum import Enum
 import os
+import sys
+import time
+import atexit
+import weakref
+import functools
+import threading
 from datetime import datetime
 
+from .utils.token_utils import count_tokens
+from .context_summarizer import ContextSummarizer, RESOLUTIONS
+from .context_index import SemanticIndex
+from .context_store import SQLiteContextStore
+from .blob_store import get_blob_store
+
 class ContextPriority(Enum):
     """上下文优先级"""
     CRITICAL = 1    # 关键信息：项目需求、核心决策
@@ -23,39 +34,188 @@ class ContextType(Enum):
     LOG = "log"                     # 日志信息
     TEMP = "temp"                   # 临时信息
 
-@dataclass
+def _synchronized(method):
+    """公开方法加实例锁，支持多个Agent并发读写上下文"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+# 渲染行Token数元组中各粒度的位置
+_RESOLUTION_INDEX = {resolution: index for index, resolution in enumerate(RESOLUTIONS)}
+
+# 反序列化时直接查表，避免逐项调用 Enum 构造
+_PRIORITY_BY_VALUE = {p.value: p for p in ContextPriority}
+_TYPE_BY_VALUE = {t.value: t for t in ContextType}
+
+# 进程退出时需要落盘的管理器；弱引用不延长实例生命周期，整个进程只注册一次退出回调
+_live_managers: "weakref.WeakSet[SmartContextManager]" = weakref.WeakSet()
+
+@atexit.register
+def _flush_live_managers() -> None:
+    for manager in list(_live_managers):
+        try:
+            manager.flush()
+        except Exception as e:
+            print(f"[上下文管理] 退出时保存上下文失败: {e}")
+
 class ContextItem:
-    """上下文项"""
-    key: str
-    value: Any
-    priority: ContextPriority
-    context_type: ContextType
-    stage: str
-    timestamp: float
-    hash: str = field(init=False)
-    size: int = field(init=False)
-    
-    def __post_init__(self):
-        self.hash = self._calculate_hash()
-        self.size = self._calculate_size()
+    """
+    上下文项
+    紧凑表示：使用 __slots__ 不带实例字典；阶段名驻留为同一字符串对象；
+    内容哈希和大小延迟计算，从磁盘加载时直接复用已持久化的值
+    """
+    __slots__ = ("key", "value", "priority", "context_type", "stage", "timestamp",
+                 "_hash", "_size", "renderings", "render_tokens")
+    
+    def __init__(self, key: str, value: Any, priority: ContextPriority, context_type: ContextType,
+                 stage: str, timestamp: float, hash: Optional[str] = None, size: Optional[int] = None):
+        self.key = key
+        self.value = value
+        self.priority = priority
+        self.context_type = context_type
+        self.stage = sys.intern(stage)
+        self.timestamp = timestamp
+        self._hash = hash
+        self._size = size
+        # 首次装箱时生成一次（内容不可变）：medium/short 两种粒度中与原文不同的渲染文本（full 即原文，不另存；都相同时为None），
+        # 以及按 RESOLUTIONS 顺序的三种粒度渲染行Token数
+        self.renderings: Optional[Dict[str, str]] = None
+        self.render_tokens: Optional[Tuple[int, int, int]] = None
+    
+    @property
+    def hash(self) -> str:
+        """内容的哈希值，用于去重"""
+        if self._hash is None:
+            self._hash = self._calculate_hash()
+        return self._hash
+    
+    @property
+    def size(self) -> int:
+        """内容大小（字符数）"""
+        if self._size is None:
+            self._size = self._calculate_size()
+        return self._size
     
     def _calculate_hash(self) -> str:
-        """计算内容的哈希值，用于去重"""
         content = f"{self.key}:{str(self.value)}"
-        return hashlib.md5(content.encode()).hexdigest()
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
     
     def _calculate_size(self) -> int:
-        """估算内容大小（字符数）"""
         return len(str(self.value))
+    
+    def __repr__(self) -> str:
+        return (f"ContextItem(key={self.key!r}, priority={self.priority.name}, "
+                f"context_type={self.context_type.value}, stage={self.stage!r}, size={self.size})")
 
 class SmartContextManager:
     """智能上下文管理器"""
     
-    def __init__(self, project_dir: str, max_context_size: int = 8000):
+    # 各角色关注的上下文类型
+    ROLE_CONTEXT_MAP: Dict[str, List[ContextType]] = {
+        "product_manager": [ContextType.REQUIREMENT, ContextType.DESIGN],
+        "tech_lead": [ContextType.DESIGN, ContextType.IMPLEMENTATION],
+        "frontend_dev": [ContextType.IMPLEMENTATION, ContextType.CONFIGURATION],
+        "backend_dev": [ContextType.IMPLEMENTATION, ContextType.CONFIGURATION],
+        "ui_designer": [ContextType.DESIGN],
+        "qa_engineer": [ContextType.IMPLEMENTATION],
+        "devops_engineer": [ContextType.CONFIGURATION],
+        "data_analyst": [ContextType.REQUIREMENT, ContextType.IMPLEMENTATION],
+        "algorithm_engineer": [ContextType.DESIGN, ContextType.IMPLEMENTATION],
+        "secretary": [ContextType.REQUIREMENT, ContextType.LOG],
+        "boss": [ContextType.REQUIREMENT]
+    }
+    
+    # Agent使用中文角色名，讨论阶段使用中文阶段名，统一映射到内部标识
+    ROLE_NAME_ALIASES: Dict[str, str] = {
+        "项目总监": "boss",
+        "产品经理": "product_manager",
+        "技术总监": "tech_lead",
+        "算法工程师": "algorithm_engineer",
+        "UI设计师": "ui_designer",
+        "前端开发工程师": "frontend_dev",
+        "后端开发工程师": "backend_dev",
+        "数据分析师": "data_analyst",
+        "测试工程师": "qa_engineer",
+        "DevOps工程师": "devops_engineer",
+        "项目文员": "secretary"
+    }
+    STAGE_NAME_ALIASES: Dict[str, str] = {
+        "需求分析": "requirement_analysis",
+        "技术设计": "technical_design",
+        "UI设计": "ui_design",
+        "前端开发": "frontend_development",
+        "后端开发": "backend_development",
+        "验收": "acceptance"
+    }
+    
+    # 相关性排序：优先级权重与语义相似度加权融合
+    PRIORITY_WEIGHTS: Dict[ContextPriority, float] = {
+        ContextPriority.CRITICAL: 1.0,
+        ContextPriority.HIGH: 0.75,
+        ContextPriority.MEDIUM: 0.5,
+        ContextPriority.LOW: 0.25
+    }
+    SEMANTIC_WEIGHT = 0.4
+    # 指定查询时，依赖阶段之外相似度达到该阈值的项也纳入候选
+    SEMANTIC_THRESHOLD = 0.35
+    
+    # 每个分组标题（含空行）预留的Token数
+    SECTION_TOKEN_OVERHEAD = 8
+    
+    def __init__(self, project_dir: str, max_context_size: int = 8000,
+                 journal_flush_items: int = 100, journal_flush_bytes: int = 256 * 1024,
+                 journal_flush_interval: float = 5.0, compact_threshold: int = 1000,
+                 abstract_fn: Optional[Callable[[str], str]] = None,
+                 embed_fn: Optional[Callable[[List[str]], Any]] = None,
+                 storage: Optional[str] = None):
         self.project_dir = project_dir
+        self._lock = threading.RLock()
+        # 上下文预算，单位为Token
         self.max_context_size = max_context_size
+        # 持久化：smart_context.json 为快照，变更先写入追加式日志，按条数/字节/时间批量落盘
+        self.snapshot_file = os.path.join(project_dir, 'smart_context.json')
+        self.journal_file = os.path.join(project_dir, 'smart_context.journal.jsonl')
+        self.journal_flush_items = journal_flush_items
+        self.journal_flush_bytes = journal_flush_bytes
+        self.journal_flush_interval = journal_flush_interval
+        self.compact_threshold = compact_threshold
+        # 长文本值写入内容寻址存储，快照/日志/数据库中只保存引用
+        self.blobs = get_blob_store(project_dir)
+        # 存储后端：json（快照+日志，默认）或 sqlite（WAL，增量写入，统计和过期清理按索引查询，支持多进程读取）；
+        # 两者启动时都把全部上下文项载入内存，选择上下文都在内存中进行
+        self.storage = storage or os.getenv("AI_TEAM_CONTEXT_STORAGE", "json")
+        self.store: Optional[SQLiteContextStore] = None
+        if self.storage == "sqlite":
+            os.makedirs(project_dir, exist_ok=True)
+            self.store = SQLiteContextStore(os.path.join(project_dir, 'smart_context.db'))
+        self._journal_buffer: List[str] = []
+        self._journal_buffer_bytes = 0
+        self._journal_records = 0
+        self._last_flush = time.monotonic()
         self.context_items: Dict[str, ContextItem] = {}
-        self.context_cache: Dict[str, str] = {}
+        # 内容哈希 -> key 索引，与 context_items 同步维护，去重检查为O(1)
+        self._hash_index: Dict[str, str] = {}
+        # 每个 阶段+角色 一个缓存项，记录生成时所依赖的版本号，依赖的阶段/类型有变更时才失效
+        # 缓存值为 (依赖版本, 上下文字符串, 选中项 key -> (内容哈希, 渲染粒度))；按查询重排生成的项依赖版本为None
+        self.context_cache: Dict[str, Tuple[Tuple, str, Dict[str, Tuple[str, str]]]] = {}
+        self._stage_versions: Dict[str, int] = {}
+        self._type_versions: Dict[ContextType, int] = {}
+        self._critical_version = 0
+        # 语义索引：写入时向量化一次，默认使用本地哈希向量，可传入句向量模型
+        self.semantic_index = SemanticIndex(embed_fn)
+        self.cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        # 多粒度摘要，可选传入LLM摘要函数（结果缓存在 context_summaries/）
+        self.summarizer = ContextSummarizer(
+            cache_dir=os.path.join(project_dir, 'context_summaries'),
+            abstract_fn=abstract_fn
+        )
+        # 每个阶段/角色实际发送的上下文Token数与预算
+        self.token_usage: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # 多轮讨论的增量上下文：(角色, 阶段) 已发送过的上下文项，以及每轮节省的Token
+        self._seen_context: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.delta_usage: Dict[str, Dict[int, Dict[str, int]]] = {}
         self.stage_dependencies: Dict[str, List[str]] = {
             "requirement_analysis": [],
             "technical_design": ["requirement_analysis"],
@@ -71,7 +231,9 @@ class SmartContextManager:
         
         # 加载持久化的上下文
         self._load_persistent_context()
+        _live_managers.add(self)
     
+    @_synchronized
     def add_context(self, key: str, value: Any, priority: ContextPriority, 
                    context_type: ContextType, stage: str) -> None:
         """添加上下文项"""
@@ -85,35 +247,186 @@ class SmartContextManager:
         )
         
         # 检查是否已存在相同内容
-        if item.hash in [existing.hash for existing in self.context_items.values()]:
+        if item.hash in self._hash_index:
             print(f"[上下文管理] 检测到重复内容，跳过: {key}")
             return
         
-        self.context_items[key] = item
-        self._save_persistent_context()
+        self._put_item(item)
+        if self.store:
+            self.store.put(self._item_to_dict(item))
+            self._maybe_flush(self.store.pending, 0)
+        else:
+            self._journal_append({"op": "put", "item": self._item_to_dict(item)})
         print(f"[上下文管理] 添加上下文: {key} (优先级:{priority.name}, 类型:{context_type.value})")
     
-    def get_context_for_stage(self, stage: str, agent_role: Optional[str] = None) -> str:
-        """为指定阶段生成优化的上下文"""
-        cache_key = f"{stage}_{agent_role}"
-        if cache_key in self.context_cache:
-            return self.context_cache[cache_key]
+    def _put_item(self, item: ContextItem, loading: bool = False) -> None:
+        """
+        写入上下文项并同步哈希索引和语义索引，替换同名key时先移除旧哈希
+        loading: 从磁盘加载时延迟向量化，且此时缓存为空无需递增版本号
+        """
+        old = self.context_items.get(item.key)
+        if old is not None:
+            if self._hash_index.get(old.hash) == item.key:
+                del self._hash_index[old.hash]
+            if not loading:
+                self._bump_versions(old)
+        self.context_items[item.key] = item
+        self._hash_index[item.hash] = item.key
+        self.semantic_index.add(item.key, self._index_text(item), defer=loading)
+        if not loading:
+            self._bump_versions(item)
+    
+    def _remove_item(self, key: str) -> None:
+        """删除上下文项并同步哈希索引"""
+        item = self.context_items.pop(key)
+        if self._hash_index.get(item.hash) == key:
+            del self._hash_index[item.hash]
+        self.semantic_index.remove(key)
+        self._bump_versions(item)
+    
+    def _bump_versions(self, item: ContextItem) -> None:
+        """上下文项变更时递增其所属阶段、类型（以及关键信息）的版本号"""
+        self._stage_versions[item.stage] = self._stage_versions.get(item.stage, 0) + 1
+        self._type_versions[item.context_type] = self._type_versions.get(item.context_type, 0) + 1
+        if item.priority == ContextPriority.CRITICAL:
+            self._critical_version += 1
+    
+    def _cache_signature(self, stage: str, agent_role: Optional[str], dependencies: List[str]) -> Tuple:
+        """缓存项的依赖版本：本阶段及依赖阶段、角色关注的类型、关键信息"""
+        return (
+            tuple(self._stage_versions.get(s, 0) for s in [stage] + dependencies),
+            tuple(self._type_versions.get(t, 0) for t in self._role_context_types(agent_role)),
+            self._critical_version
+        )
+    
+    @staticmethod
+    def _cache_key(stage: str, agent_role: Optional[str]) -> str:
+        return f"{stage}_{agent_role}"
+    
+    def _normalize_role(self, agent_role: Optional[str]) -> Optional[str]:
+        """中文角色名映射为内部角色标识"""
+        return self.ROLE_NAME_ALIASES.get(agent_role, agent_role) if agent_role else agent_role
+    
+    def _normalize_stage(self, stage: str) -> str:
+        """中文阶段名映射为内部阶段标识"""
+        return self.STAGE_NAME_ALIASES.get(stage, stage)
+    
+    @staticmethod
+    def _index_text(item: ContextItem) -> str:
+        """用于向量化的文本"""
+        value = item.value if isinstance(item.value, str) else json.dumps(item.value, ensure_ascii=False, default=str)
+        return f"{item.key}\n{value[:4000]}"
+    
+    @_synchronized
+    def get_context_for_stage(self, stage: str, agent_role: Optional[str] = None, query: Optional[str] = None) -> str:
+        """
+        为指定阶段生成优化的上下文
+        query: 当前任务提示词，传入时按语义相似度召回并排序相关上下文；
+               重排在缓存之外进行，选中的内容与缓存项相同时复用渲染结果
+        """
+        cache_key = self._cache_key(stage, agent_role)
+        stage_key = self._normalize_stage(stage)
+        role_key = self._normalize_role(agent_role)
         
         # 获取依赖阶段
-        dependencies = self.stage_dependencies.get(stage, [])
+        dependencies = self.stage_dependencies.get(stage_key, [])
+        signature = self._cache_signature(stage_key, role_key, dependencies)
+        cached = self.context_cache.get(cache_key)
+        if cached is not None and not query:
+            if cached[0] == signature:
+                self.cache_stats["hits"] += 1
+                return cached[1]
+            self.cache_stats["invalidations"] += 1
         
-        # 根据阶段和角色选择相关上下文
-        relevant_items = self._select_relevant_items(stage, agent_role, dependencies)
+        # 根据阶段和角色选择相关上下文，并在Token预算内装箱
+        similarities = self.semantic_index.similarities(query or self._profile_text(stage_key, role_key))
+        candidates = self._select_relevant_items(stage_key, role_key, dependencies)
+        if query:
+            selected_keys = {item.key for item in candidates}
+            candidates.extend(
+                self.context_items[key] for key, sim in similarities.items()
+                if sim >= self.SEMANTIC_THRESHOLD and key not in selected_keys
+            )
+        scores = {
+            item.key: self.PRIORITY_WEIGHTS[item.priority] * (1 - self.SEMANTIC_WEIGHT)
+            + max(similarities.get(item.key, 0.0), 0.0) * self.SEMANTIC_WEIGHT
+            for item in candidates
+        }
+        header = self._context_header(stage, agent_role)
+        budget = self.max_context_size - count_tokens(header) - self.SECTION_TOKEN_OVERHEAD * (len(ContextType) + 1)
+        resolutions = self._pack_items(candidates, budget, scores)
+        relevant_items = [item for item in candidates if item.key in resolutions]
+        selection = {item.key: (item.hash, resolutions[item.key]) for item in relevant_items}
+        if query and cached is not None and list(cached[2].items()) == list(selection.items()):
+            # 渲染结果只取决于阶段、角色和按顺序选中的内容及粒度
+            self.cache_stats["hits"] += 1
+            return cached[1]
+        self.cache_stats["misses"] += 1
         
         # 生成结构化上下文
-        context_str = self._generate_structured_context(relevant_items, stage, agent_role)
+        context_str = self._generate_structured_context(relevant_items, stage, agent_role, resolutions)
+        
+        # 记录实际Token用量
+        tokens = count_tokens(context_str)
+        self.token_usage.setdefault(stage, {})[str(agent_role)] = {
+            "tokens": tokens,
+            "budget": self.max_context_size,
+            "items": len(relevant_items),
+            "skipped": len(candidates) - len(relevant_items)
+        }
+        print(f"[上下文管理] 阶段 {stage} ({agent_role}) 上下文 {tokens}/{self.max_context_size} tokens, "
+              f"选中 {len(relevant_items)} 项, 跳过 {len(candidates) - len(relevant_items)} 项")
         
         # 缓存结果
-        self.context_cache[cache_key] = context_str
+        self.context_cache[cache_key] = (None if query else signature, context_str, selection)
         return context_str
     
+    @_synchronized
+    def get_delta_context_for_stage(self, stage: str, agent_role: Optional[str], round_num: int,
+                                    query: Optional[str] = None) -> str:
+        """
+        多轮讨论的增量上下文：第一轮发送完整上下文并记录该角色已看到的内容；
+        之后的轮次只完整发送新增或更新的项，未变化的项仅列出精简提纲并注明与第N轮相同
+        """
+        full_context = self.get_context_for_stage(stage, agent_role, query)
+        selection = self.context_cache[self._cache_key(stage, agent_role)][2]
+        seen_key = (str(agent_role), stage)
+        seen = self._seen_context.get(seen_key)
+        if round_num <= 1 or seen is None:
+            self._seen_context[seen_key] = {"round": round_num, "items": {k: h for k, (h, _) in selection.items()}}
+            return full_context
+        
+        unchanged = [key for key, (item_hash, _) in selection.items() if seen["items"].get(key) == item_hash]
+        changed = [key for key in selection if key not in unchanged]
+        # 未变化的项也始终列出提纲，发言者不必依赖早先轮次的消息即可知道有哪些上下文
+        parts = [self._context_header(stage, agent_role)]
+        if unchanged:
+            parts.append(f"【与第{seen['round']}轮相同】以下 {len(unchanged)} 项未变化，仅列提纲：")
+            parts.extend(self._item_line(self.context_items[key], "short") for key in unchanged)
+        if changed:
+            if unchanged:
+                parts.append("")
+            parts.append("【新增或更新】")
+            parts.extend(self._item_line(self.context_items[key], selection[key][1]) for key in changed)
+        delta_context = "\n".join(parts)
+        seen["items"].update({key: selection[key][0] for key in changed})
+        seen["round"] = round_num
+        
+        full_tokens = count_tokens(full_context)
+        sent_tokens = min(count_tokens(delta_context), full_tokens)
+        usage = self.delta_usage.setdefault(stage, {}).setdefault(round_num, {"full": 0, "sent": 0, "saved": 0})
+        usage["full"] += full_tokens
+        usage["sent"] += sent_tokens
+        usage["saved"] += full_tokens - sent_tokens
+        return delta_context if sent_tokens < full_tokens else full_context
+    
+    @_synchronized
+    def get_delta_savings(self, stage: str, round_num: int) -> Dict[str, int]:
+        """某阶段某一轮增量上下文的Token节省情况"""
+        return self.delta_usage.get(stage, {}).get(round_num, {"full": 0, "sent": 0, "saved": 0})
+    
     def _select_relevant_items(self, stage: str, agent_role: Optional[str], dependencies: List[str]) -> List[ContextItem]:
-        """选择相关的上下文项"""
+        """选择相关的上下文项；两种存储后端都在内存中选择（上下文项已全部载入，比查询数据库更快）"""
         relevant_items = []
         
         for item in self.context_items.values():
@@ -133,42 +446,85 @@ class SmartContextManager:
                 relevant_items.append(item)
                 continue
         
-        # 按优先级和大小排序
-        relevant_items.sort(key=lambda x: (x.priority.value, x.size))
+        return relevant_items
+    
+    def _ensure_renderings(self, item: ContextItem) -> None:
+        """首次装箱时生成各粒度的渲染文本和Token数；与原文相同的粒度不保存副本"""
+        if item.render_tokens is None:
+            texts = self.summarizer.render(item.value)
+            full = texts["full"]
+            item.renderings = {res: texts[res] for res in ("medium", "short") if texts[res] != full} or None
+            item.render_tokens = tuple(count_tokens(self._format_line(item.key, texts[res])) + 1  # 含换行
+                                       for res in RESOLUTIONS)
+    
+    @staticmethod
+    def _format_line(key: str, text: str) -> str:
+        return f"• {key}: {text}"
+    
+    def _item_line(self, item: ContextItem, resolution: str = "medium") -> str:
+        """上下文项指定粒度的渲染行，full 及与原文相同的粒度按原文拼接"""
+        self._ensure_renderings(item)
+        text = item.renderings.get(resolution) if item.renderings else None
+        if text is None:
+            text = self.summarizer.full_text(item.value)
+        return self._format_line(item.key, text)
+    
+    def _item_tokens(self, item: ContextItem, resolution: str = "medium") -> int:
+        """上下文项指定粒度渲染后的Token数"""
+        self._ensure_renderings(item)
+        return item.render_tokens[_RESOLUTION_INDEX[resolution]]
+    
+    def _pack_items(self, items: List[ContextItem], budget: int, scores: Optional[Dict[str, float]] = None) -> Dict[str, str]:
+        """
+        在Token预算内装箱，返回 key -> 选中的渲染粒度：
+        1. 按相关性得分（未提供时按优先级）、再按Token数从小到大，以最精简粒度贪心装入，放不下的跳过而不是终止
+        2. 剩余预算按同样顺序依次把已装入的项升级到更详细的粒度
+        """
+        items = [item for item in items if item.context_type != ContextType.TEMP]  # 临时信息不渲染
+        if scores:
+            items.sort(key=lambda x: (-scores.get(x.key, 0.0), self._item_tokens(x, "short")))
+        else:
+            items.sort(key=lambda x: (x.priority.value, self._item_tokens(x, "short")))
         
-        # 控制总大小
-        total_size = 0
-        selected_items = []
-        for item in relevant_items:
-            if total_size + item.size <= self.max_context_size:
-                selected_items.append(item)
-                total_size += item.size
-            else:
-                break
+        total_tokens = 0
+        selected: Dict[str, str] = {}
+        for item in items:
+            item_tokens = self._item_tokens(item, "short")
+            if total_tokens + item_tokens <= budget:
+                selected[item.key] = "short"
+                total_tokens += item_tokens
         
-        return selected_items
+        for resolution in ("medium", "full"):
+            for item in items:
+                current = selected.get(item.key)
+                if current is None or RESOLUTIONS.index(current) <= RESOLUTIONS.index(resolution):
+                    continue
+                extra = self._item_tokens(item, resolution) - self._item_tokens(item, current)
+                if total_tokens + extra <= budget:
+                    selected[item.key] = resolution
+                    total_tokens += extra
+        
+        return selected
+    
+    def _profile_text(self, stage: str, agent_role: Optional[str]) -> str:
+        """未指定查询时，用阶段和角色描述作为相似度排序的查询"""
+        type_names = " ".join(t.value for t in self._role_context_types(agent_role))
+        return f"{stage.replace('_', ' ')} {agent_role or ''} {type_names}"
+    
+    def _role_context_types(self, agent_role: Optional[str]) -> List[ContextType]:
+        """角色关注的上下文类型"""
+        return self.ROLE_CONTEXT_MAP.get(agent_role, []) if agent_role else []
     
     def _is_role_relevant(self, item: ContextItem, agent_role: str) -> bool:
         """判断上下文项是否与角色相关"""
-        role_context_map = {
-            "product_manager": [ContextType.REQUIREMENT, ContextType.DESIGN],
-            "tech_lead": [ContextType.DESIGN, ContextType.IMPLEMENTATION],
-            "frontend_dev": [ContextType.IMPLEMENTATION, ContextType.CONFIGURATION],
-            "backend_dev": [ContextType.IMPLEMENTATION, ContextType.CONFIGURATION],
-            "ui_designer": [ContextType.DESIGN],
-            "qa_engineer": [ContextType.IMPLEMENTATION],
-            "devops_engineer": [ContextType.CONFIGURATION],
-            "data_analyst": [ContextType.REQUIREMENT, ContextType.IMPLEMENTATION],
-            "boss": [ContextType.REQUIREMENT]
-        }
-        
-        relevant_types = role_context_map.get(agent_role, [])
-        return item.context_type in relevant_types
+        return item.context_type in self._role_context_types(self._normalize_role(agent_role))
     
-    def _generate_structured_context(self, items: List[ContextItem], stage: str, agent_role: Optional[str]) -> str:
+    def _generate_structured_context(self, items: List[ContextItem], stage: str, agent_role: Optional[str],
+                                     resolutions: Optional[Dict[str, str]] = None) -> str:
         """生成结构化的上下文字符串"""
         if not items:
             return "无相关上下文信息"
+        resolutions = resolutions or {}
         
         # 按类型分组
         grouped_items = {}
@@ -179,14 +535,14 @@ class SmartContextManager:
         
         # 生成结构化内容
         context_parts = []
-        context_parts.append(f"=== 项目上下文 (阶段: {stage}, 角色: {agent_role}) ===\n")
+        context_parts.append(self._context_header(stage, agent_role))
         
         # 1. 关键信息（始终在最前面）
         critical_items = [item for item in items if item.priority == ContextPriority.CRITICAL]
         if critical_items:
             context_parts.append("【关键信息】")
             for item in critical_items:
-                context_parts.append(f"• {item.key}: {self._compress_value(item.value)}")
+                context_parts.append(self._item_line(item, resolutions.get(item.key, "medium")))
             context_parts.append("")
         
         # 2. 按类型组织其他信息
@@ -205,47 +561,44 @@ class SmartContextManager:
             context_parts.append(f"【{type_names.get(context_type, context_type.value)}】")
             for item in type_items:
                 if item.priority != ContextPriority.CRITICAL:  # 避免重复
-                    context_parts.append(f"• {item.key}: {self._compress_value(item.value)}")
+                    context_parts.append(self._item_line(item, resolutions.get(item.key, "medium")))
             context_parts.append("")
         
         return "\n".join(context_parts)
     
-    def _compress_value(self, value: Any) -> str:
-        """压缩值，减少Token使用"""
-        if isinstance(value, str):
-            # 如果字符串太长，进行摘要
-            if len(value) > 500:
-                # 提取关键信息
-                lines = value.split('\n')
-                if len(lines) > 10:
-                    summary_lines = lines[:5] + ["..."] + lines[-5:]
-                    return "\n".join(summary_lines)
-                else:
-                    return value[:500] + "..." if len(value) > 500 else value
-            return value
-        elif isinstance(value, dict):
-            # 只保留关键字段
-            key_fields = ['requirements', 'project_name', 'stage', 'result']
-            compressed = {}
-            for key in key_fields:
-                if key in value:
-                    compressed[key] = self._compress_value(value[key])
-            return str(compressed)
-        else:
-            return str(value)[:200] + "..." if len(str(value)) > 200 else str(value)
+    def _context_header(self, stage: str, agent_role: Optional[str]) -> str:
+        """上下文标题行"""
+        return f"=== 项目上下文 (阶段: {stage}, 角色: {agent_role}) ===\n"
     
+    @_synchronized
     def clear_cache(self) -> None:
         """清除上下文缓存"""
         self.context_cache.clear()
     
+    @_synchronized
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取上下文缓存命中/未命中/失效统计"""
+        lookups = self.cache_stats["hits"] + self.cache_stats["misses"]
+        return {
+            **self.cache_stats,
+            "entries": len(self.context_cache),
+            "hit_rate": round(self.cache_stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+    
+    @_synchronized
     def get_context_stats(self) -> Dict[str, Any]:
         """获取上下文统计信息"""
+        if self.store:
+            return self._store_context_stats()
         stats = {
             "total_items": len(self.context_items),
             "total_size": sum(item.size for item in self.context_items.values()),
             "by_priority": {},
             "by_type": {},
-            "by_stage": {}
+            "by_stage": {},
+            "cache": self.get_cache_stats(),
+            "token_usage": self.token_usage,
+            "delta_usage": self.delta_usage
         }
         
         for item in self.context_items.values():
@@ -271,67 +624,211 @@ class SmartContextManager:
         
         return stats
     
+    def _store_context_stats(self) -> Dict[str, Any]:
+        """SQLite后端：统计信息由分组聚合查询得到"""
+        total_items, total_size = self.store.totals()
+        by_column = {
+            column: {
+                (ContextPriority(name).name if column == "priority" else name): {"count": count, "size": size}
+                for name, count, size in self.store.aggregate(column)
+            }
+            for column in ("priority", "context_type", "stage")
+        }
+        return {
+            "total_items": total_items,
+            "total_size": total_size,
+            "by_priority": by_column["priority"],
+            "by_type": by_column["context_type"],
+            "by_stage": by_column["stage"],
+            "cache": self.get_cache_stats(),
+            "token_usage": self.token_usage,
+            "delta_usage": self.delta_usage
+        }
+    
+    def _item_to_dict(self, item: ContextItem) -> Dict[str, Any]:
+        """序列化上下文项"""
+        return {
+            "key": item.key,
+            "value": self.blobs.pack(item.value),
+            "priority": item.priority.value,
+            "context_type": item.context_type.value,
+            "stage": item.stage,
+            "timestamp": item.timestamp,
+            "hash": item.hash,
+            "size": item.size
+        }
+    
+    def _item_from_dict(self, item_data: Dict[str, Any]) -> ContextItem:
+        """反序列化上下文项"""
+        return ContextItem(
+            key=item_data["key"],
+            value=self.blobs.unpack(item_data["value"]),
+            priority=_PRIORITY_BY_VALUE[item_data["priority"]],
+            context_type=_TYPE_BY_VALUE[item_data["context_type"]],
+            stage=item_data["stage"],
+            timestamp=item_data["timestamp"],
+            hash=item_data.get("hash"),
+            size=item_data.get("size")
+        )
+    
+    def _journal_append(self, record: Dict[str, Any]) -> None:
+        """记录一条上下文变更，达到条数/字节/时间阈值时批量写盘"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._journal_buffer.append(line)
+        self._journal_buffer_bytes += len(line)
+        self._maybe_flush(len(self._journal_buffer), self._journal_buffer_bytes)
+    
+    def _maybe_flush(self, pending_items: int, pending_bytes: int) -> None:
+        """未落盘的变更达到条数/字节/时间阈值时批量写盘"""
+        if (pending_items >= self.journal_flush_items
+                or pending_bytes >= self.journal_flush_bytes
+                or time.monotonic() - self._last_flush >= self.journal_flush_interval):
+            self.flush()
+    
+    @_synchronized
+    def flush(self) -> None:
+        """把缓冲的变更追加写入日志文件（SQLite后端为提交事务）；日志过长时压缩为快照。阶段结束时应调用"""
+        self._last_flush = time.monotonic()
+        if self.store:
+            try:
+                self.store.commit()
+            except Exception as e:
+                print(f"[上下文管理] 提交上下文失败: {e}")
+            return
+        if not self._journal_buffer or not os.path.isdir(self.project_dir):
+            return
+        try:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.writelines(self._journal_buffer)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_records += len(self._journal_buffer)
+            self._journal_buffer.clear()
+            self._journal_buffer_bytes = 0
+        except Exception as e:
+            print(f"[上下文管理] 写入上下文日志失败: {e}")
+            return
+        # 日志条数超过快照规模时再压缩，保证摊还写盘量与单条数据大小成正比
+        if self._journal_records >= max(self.compact_threshold, len(self.context_items)):
+            self._save_persistent_context()
+    
     def _save_persistent_context(self) -> None:
-        """保存上下文到文件"""
+        """把全部上下文原子写入快照文件，并清空已合并的日志"""
         try:
-            context_file = os.path.join(self.project_dir, 'smart_context.json')
             data = {
                 "items": {
-                    key: {
-                        "key": item.key,
-                        "value": item.value,
-                        "priority": item.priority.value,
-                        "context_type": item.context_type.value,
-                        "stage": item.stage,
-                        "timestamp": item.timestamp,
-                        "hash": item.hash,
-                        "size": item.size
-                    }
+                    key: self._item_to_dict(item)
                     for key, item in self.context_items.items()
                 }
             }
-            with open(context_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            tmp_file = self.snapshot_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+            # 快照已包含全部变更；若在此处崩溃，重放日志也是幂等的
+            with open(self.journal_file, 'w', encoding='utf-8'):
+                pass
+            self._journal_buffer.clear()
+            self._journal_buffer_bytes = 0
+            self._journal_records = 0
         except Exception as e:
             print(f"[上下文管理] 保存上下文失败: {e}")
     
     def _load_persistent_context(self) -> None:
-        """从文件加载上下文"""
+        """从快照加载上下文，再重放日志中的后续变更"""
+        if self.store:
+            self._load_from_store()
+            return
         try:
-            context_file = os.path.join(self.project_dir, 'smart_context.json')
-            if os.path.exists(context_file):
-                with open(context_file, 'r', encoding='utf-8') as f:
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                 
                 for key, item_data in data.get("items", {}).items():
-                    item = ContextItem(
-                        key=item_data["key"],
-                        value=item_data["value"],
-                        priority=ContextPriority(item_data["priority"]),
-                        context_type=ContextType(item_data["context_type"]),
-                        stage=item_data["stage"],
-                        timestamp=item_data["timestamp"]
-                    )
-                    self.context_items[key] = item
-                
-                print(f"[上下文管理] 加载了 {len(self.context_items)} 个上下文项")
+                    self._put_item(self._item_from_dict(item_data), loading=True)
         except Exception as e:
             print(f"[上下文管理] 加载上下文失败: {e}")
+        
+        try:
+            if os.path.exists(self.journal_file):
+                valid_bytes, torn, missing_newline = 0, False, False
+                with open(self.journal_file, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # 崩溃时最后一行可能写了一半，之后的内容不可信
+                            torn = True
+                            break
+                        if record.get("op") == "put":
+                            self._put_item(self._item_from_dict(record["item"]), loading=True)
+                        elif record.get("op") == "del" and record.get("key") in self.context_items:
+                            self._remove_item(record["key"])
+                        self._journal_records += 1
+                        valid_bytes += len(line)
+                        missing_newline = not line.endswith(b"\n")
+                if torn or missing_newline:
+                    # 截掉不完整的部分并补齐换行，之后追加的记录才不会拼接到坏行上
+                    with open(self.journal_file, 'r+b') as f:
+                        f.truncate(valid_bytes)
+                        if missing_newline:
+                            f.seek(valid_bytes)
+                            f.write(b"\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                    if torn:
+                        print("[上下文管理] 上下文日志末尾不完整，已截断")
+        except Exception as e:
+            print(f"[上下文管理] 重放上下文日志失败: {e}")
+        
+        if self.context_items:
+            print(f"[上下文管理] 加载了 {len(self.context_items)} 个上下文项")
     
+    def _load_from_store(self) -> None:
+        """SQLite后端加载；数据库为空而存在旧的JSON快照/日志时，先一次性迁移"""
+        try:
+            if self.store.is_empty() and (os.path.exists(self.snapshot_file) or os.path.exists(self.journal_file)):
+                store, self.store = self.store, None
+                self._load_persistent_context()
+                self.store = store
+                for item in self.context_items.values():
+                    self.store.put(self._item_to_dict(item))
+                self.store.commit()
+                print(f"[上下文管理] 已将 {len(self.context_items)} 个上下文项迁移到SQLite")
+                return
+            else:
+                for item_data in self.store.load_items():
+                    self._put_item(self._item_from_dict(item_data), loading=True)
+        except Exception as e:
+            print(f"[上下文管理] 加载上下文失败: {e}")
+        
+        if self.context_items:
+            print(f"[上下文管理] 加载了 {len(self.context_items)} 个上下文项")
+    
+    @_synchronized
     def cleanup_old_context(self, max_age_hours: int = 24) -> None:
         """清理过期的上下文"""
         current_time = datetime.now().timestamp()
         max_age_seconds = max_age_hours * 3600
         
-        items_to_remove = []
-        for key, item in self.context_items.items():
-            if current_time - item.timestamp > max_age_seconds:
-                items_to_remove.append(key)
-        
-        for key in items_to_remove:
-            del self.context_items[key]
+        if self.store:
+            items_to_remove = self.store.delete_older_than(current_time - max_age_seconds)
+            for key in items_to_remove:
+                if key in self.context_items:
+                    self._remove_item(key)
+        else:
+            items_to_remove = []
+            for key, item in self.context_items.items():
+                if current_time - item.timestamp > max_age_seconds:
+                    items_to_remove.append(key)
+            
+            for key in items_to_remove:
+                self._remove_item(key)
+                self._journal_append({"op": "del", "key": key})
         
         if items_to_remove:
             print(f"[上下文管理] 清理了 {len(items_to_remove)} 个过期上下文项")
-            self._save_persistent_context()
+            self.flush()
             self.clear_cache() 
\ No newline at end of file
@@ -0,0 +1,100 @@
+import json
+import sqlite3
+from typing import Any, Dict, Iterator, List, Sequence
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS context_items (
+    key TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    context_type TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_context_stage ON context_items(stage, size);
+CREATE INDEX IF NOT EXISTS idx_context_type ON context_items(context_type, size);
+CREATE INDEX IF NOT EXISTS idx_context_priority ON context_items(priority, size);
+CREATE INDEX IF NOT EXISTS idx_context_timestamp ON context_items(timestamp);
+CREATE INDEX IF NOT EXISTS idx_context_hash ON context_items(hash);
+"""
+
+class SQLiteContextStore:
+    """
+    上下文的SQLite存储（WAL模式，支持多进程并发读）
+    - 元数据列建索引，统计和过期清理为SQL查询；选择上下文不经过本存储，由 SmartContextManager 在内存中完成
+    - 大文本在写入前已由 BlobStore 换成引用，值列只保存引用或小值
+    - 写入在同一连接上立即执行，由 commit() 批量提交
+    启动时仍由 SmartContextManager 把全部上下文项载入内存，本存储不减少内存占用
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self.pending = 0
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM context_items LIMIT 1").fetchone() is None
+
+    def put(self, record: Dict[str, Any]) -> None:
+        """写入或替换一个上下文项（record 为序列化后的上下文项）"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO context_items (key, priority, context_type, stage, timestamp, hash, size, value) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (record["key"], record["priority"], record["context_type"], record["stage"],
+             record["timestamp"], record["hash"], record["size"], json.dumps(record["value"], ensure_ascii=False))
+        )
+        self.pending += 1
+
+    def delete(self, keys: Sequence[str]) -> None:
+        self.conn.executemany("DELETE FROM context_items WHERE key = ?", [(key,) for key in keys])
+        self.pending += len(keys)
+
+    def commit(self) -> None:
+        if self.pending:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
+
+    def load_items(self) -> Iterator[Dict[str, Any]]:
+        """按写入顺序读取全部上下文项"""
+        cursor = self.conn.execute(
+            "SELECT key, priority, context_type, stage, timestamp, hash, size, value FROM context_items ORDER BY rowid"
+        )
+        for key, priority, context_type, stage, timestamp, item_hash, size, value in cursor:
+            yield {
+                "key": key,
+                "value": json.loads(value),
+                "priority": priority,
+                "context_type": context_type,
+                "stage": stage,
+                "timestamp": timestamp,
+                "hash": item_hash,
+                "size": size
+            }
+
+    def aggregate(self, column: str) -> List[tuple]:
+        """按指定列分组统计条数和大小"""
+        if column not in ("priority", "context_type", "stage"):
+            raise ValueError(f"不支持的统计列: {column}")
+        return self.conn.execute(
+            f"SELECT {column}, COUNT(*), COALESCE(SUM(size), 0) FROM context_items GROUP BY {column}"
+        ).fetchall()
+
+    def totals(self) -> tuple:
+        return self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM context_items").fetchone()
+
+    def delete_older_than(self, cutoff: float) -> List[str]:
+        """删除早于 cutoff 的上下文项，返回被删除的key"""
+        keys = [row[0] for row in self.conn.execute("SELECT key FROM context_items WHERE timestamp < ?", (cutoff,))]
+        self.conn.execute("DELETE FROM context_items WHERE timestamp < ?", (cutoff,))
+        self.pending += len(keys)
+        return keys
@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+# 渲染粒度，从详细到精简
+RESOLUTIONS = ("full", "medium", "short")
+
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+
+class ContextSummarizer:
+    """
+    上下文多粒度摘要器：在写入上下文时一次性生成 full / medium / short 三种渲染
+    - full: 原文
+    - medium: 按Markdown章节保留标题和每节开头几行，长文档中间章节不再丢失
+    - short: 章节标题提纲（可选使用LLM生成的摘要，按内容哈希缓存到磁盘）
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None,
+                 abstract_fn: Optional[Callable[[str], str]] = None,
+                 section_lines: int = 3, short_chars: int = 200, abstract_min_chars: int = 2000):
+        self.cache_dir = cache_dir
+        self.abstract_fn = abstract_fn
+        self.section_lines = section_lines
+        self.short_chars = short_chars
+        self.abstract_min_chars = abstract_min_chars
+
+    @staticmethod
+    def full_text(value: Any) -> str:
+        """full 粒度的文本：字符串原样返回，字典序列化为JSON，其他类型转为字符串"""
+        if isinstance(value, dict):
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return value if isinstance(value, str) else str(value)
+
+    def render(self, value: Any) -> Dict[str, str]:
+        """生成三种粒度的渲染文本"""
+        if isinstance(value, dict):
+            return self._render_dict(value)
+        text = self.full_text(value)
+        sections = self._split_sections(text)
+        if len(sections) > 1 or sections[0][0]:
+            medium = self._render_sections(sections)
+            short = " / ".join(title for title, _ in sections if title) or self._first_chars(text)
+        else:
+            medium = self._render_plain(text)
+            short = self._first_chars(text)
+        abstract = self._abstract(text)
+        if abstract:
+            short = abstract
+        # 保证粒度单调：粗粒度不应比细粒度更长
+        if len(medium) > len(text):
+            medium = text
+        if len(short) > len(medium):
+            short = medium
+        return {"full": text, "medium": medium, "short": short}
+
+    def _render_dict(self, value: Dict[str, Any]) -> Dict[str, str]:
+        full = self.full_text(value)
+        medium = "; ".join(f"{k}: {self._first_chars(self._to_text(v))}" for k, v in value.items())
+        short = "字段: " + ", ".join(str(k) for k in value.keys())
+        if len(medium) > len(full):
+            medium = full
+        if len(short) > len(medium):
+            short = medium
+        return {"full": full, "medium": medium, "short": short}
+
+    @staticmethod
+    def _to_text(value: Any) -> str:
+        if isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _split_sections(text: str) -> List[tuple]:
+        """按Markdown标题切分为 (标题, 正文行) 列表，标题前的内容标题为空"""
+        sections = [("", [])]
+        in_code = False
+        for line in text.split('\n'):
+            if line.strip().startswith('```'):
+                in_code = not in_code
+            match = None if in_code else _HEADING_PATTERN.match(line)
+            if match:
+                sections.append((match.group(2).strip(), []))
+            else:
+                sections[-1][1].append(line)
+        if not sections[0][1] or not any(l.strip() for l in sections[0][1]):
+            if len(sections) > 1:
+                sections.pop(0)
+        return sections
+
+    def _render_sections(self, sections: List[tuple]) -> str:
+        parts = []
+        for title, lines in sections:
+            content = [l.strip() for l in lines if l.strip() and not l.strip().startswith('```')][:self.section_lines]
+            if title:
+                parts.append(f"[{title}]")
+            parts.extend(content)
+        return "\n".join(parts)
+
+    def _render_plain(self, text: str) -> str:
+        lines = [l for l in text.split('\n') if l.strip()]
+        if len(lines) > 10:
+            return "\n".join(lines[:5] + ["..."] + lines[-5:])
+        if len(text) > 500:
+            return text[:500] + "..."
+        return text
+
+    def _first_chars(self, text: str) -> str:
+        text = " ".join(text.split())
+        return text[:self.short_chars] + "..." if len(text) > self.short_chars else text
+
+    def _abstract(self, text: str) -> Optional[str]:
+        """可选的LLM摘要，按内容哈希缓存到磁盘，避免重复调用"""
+        if not self.abstract_fn or len(text) < self.abstract_min_chars:
+            return None
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        cache_path = os.path.join(self.cache_dir, f"{digest}.txt") if self.cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        try:
+            abstract = self.abstract_fn(text)
+        except Exception as e:
+            print(f"[上下文摘要] 生成摘要失败，使用提纲: {e}")
+            return None
+        if abstract and cache_path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(abstract)
+        return abstract
@@ -3,13 +3,20 @@ import sys
 import datetime
 import time
 import json
+import shutil
 import traceback
 import re
 import subprocess
-from typing import List, Dict, Any, Optional
+import threading
+import contextvars
+import uuid
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import PrivateAttr
-from crewai import Agent, Task, Crew
+from crewai import Agent, Task
+from crewai.agents.tools_handler import ToolsHandler
+from crewai.agents.agent_builder.utilities.base_token_process import TokenProcess
 from crewai.tools import BaseTool
 from litellm import completion
 
@@ -19,31 +26,114 @@ sys.path.insert(0, str(project_root))
 
 from .tools.mcp_tool import MCPTool
 from .context_manager import SmartContextManager, ContextPriority, ContextType
+from .blob_store import get_blob_store
+from .stage_scheduler import StageGraph
+from .llm_cache import LLMCacheMiss, LLMResponseCache, get_llm_cache
+from .llm_gateway import build_llm
+from .usage_meter import BudgetExceeded, get_usage_meter, usage_scope
+from .rate_limiter import get_request_scheduler
+from .llm_errors import LLMCallFailed
+from .deadline import DeadlineExceeded, check_deadline, deadline_scope, get_call_monitor, remaining_seconds
+from .discussion_summary import RollingSummary
+from .consensus import ConsensusTracker, VOTE_INSTRUCTIONS, strip_vote
+from .discussion_checkpoint import CHECKPOINT_DIR, DiscussionCheckpoint, parse_resume_point
+from .utils.token_utils import count_tokens
 from mcp_server import MCPServer
 
+# 讨论轮内并发发言的Agent数上限
+DISCUSSION_MAX_WORKERS = int(os.getenv("AI_TEAM_DISCUSSION_WORKERS", "4"))
+# 同时执行的阶段数上限
+STAGE_MAX_WORKERS = int(os.getenv("AI_TEAM_STAGE_WORKERS", "3"))
+# 讨论滚动摘要的Token预算，后续轮次和共识文档只使用摘要+最近一轮原文
+DISCUSSION_SUMMARY_TOKENS = int(os.getenv("AI_TEAM_DISCUSSION_SUMMARY_TOKENS", "1500"))
+# 相邻两轮发言的平均相似度达到该值即视为观点收敛，提前结束讨论
+DISCUSSION_PLATEAU_SIMILARITY = float(os.getenv("AI_TEAM_DISCUSSION_PLATEAU", "0.92"))
+# 花费达到预算软上限后，讨论最多进行的轮次
+SOFT_BUDGET_MAX_ROUNDS = 2
+# 单个阶段的时限（秒），到期后取消进行中的LLM调用并暂停，0表示不限制
+STAGE_TIMEOUT = float(os.getenv("AI_TEAM_STAGE_TIMEOUT", "0")) or None
+# Agent执行异常和共识文档生成失败时返回的结果前缀，这类结果不保存为阶段产出
+FAILED_RESULT_PREFIXES = ("任务执行失败", "共识文档生成失败")
+
+class StageFailed(RuntimeError):
+    """阶段没有得到可用结果，不保存进度，重新运行时再次执行"""
+
 class LoggingAgent(Agent):
     _project_id: 'str' = PrivateAttr(default="")
     _project_dir: 'str' = PrivateAttr(default="")
+    # 同一个Agent可能被并发阶段同时使用，执行器状态不可重入，逐个执行
+    _execution_lock: Any = PrivateAttr(default_factory=threading.Lock)
     def __init__(self, *args, project_id: str = "", project_dir: str = "", **kwargs):
         super().__init__(*args, **kwargs)
         self._project_id = project_id or ""
         self._project_dir = project_dir or ""
 
+    def for_run(self, project_id: str = "", project_dir: str = "") -> "LoggingAgent":
+        """
+        从原型复制一次运行使用的Agent（浅复制，微秒级）：
+        角色、提示词、LLM和工具与原型共享，项目目录和执行状态（执行器、工具调用记录、Token统计）各自独立
+        """
+        agent = self.model_copy(update={
+            "id": uuid.uuid4(),
+            "agent_executor": None,
+            "crew": None,
+            "tools_handler": ToolsHandler(),
+            "tools_results": [],
+        })
+        agent._project_id = project_id or ""
+        agent._project_dir = project_dir or ""
+        agent._execution_lock = threading.Lock()
+        agent._token_process = TokenProcess()
+        agent._tool_failures = []
+        agent._last_messages = []
+        agent._times_executed = 0
+        return agent
+
     def execute_task(self, task, context=None, tools=None):
-        """重写execute_task方法，添加代码落地机制"""
+        """
+        重写execute_task方法，添加响应缓存和代码落地机制
+        所属阶段超时（DeadlineExceeded）和LLM调用失败（LLMCallFailed）直接抛出，不作为结果返回
+        """
         try:
-            # 执行原始任务
-            result = super().execute_task(task, context, tools)
+            check_deadline(f"{self.role} 执行 {task.name}")
+            # 开启LLM缓存时，相同的调用直接复用上次结果
+            cache = get_llm_cache(self._project_dir)
+            cache_key = self._cache_key(task, context, tools) if cache else None
+            result = cache.get(cache_key) if cache else None
+            if result is None:
+                # 执行原始任务
+                with self._execution_lock:
+                    result = super().execute_task(task, context, tools)
+                if cache and isinstance(result, str) and not result.startswith("任务执行失败"):
+                    cache.put(cache_key, result, {"role": self.role, "task": task.name})
             
             # 代码落地机制：自动提取并保存代码块
             if result and self._project_dir and task.name:
                 self._extract_and_save_code(result, task.name)
             
             return result
+        except (DeadlineExceeded, LLMCallFailed):
+            raise
         except Exception as e:
             print(f"[LoggingAgent] 任务执行异常: {e}")
             return f"任务执行失败: {str(e)}"
 
+    def _cache_key(self, task, context, tools) -> str:
+        """缓存键：模型、角色设定、任务描述、上下文和工具集合"""
+        # 开启模型路由时按任务实际使用的模型计算
+        model_for = getattr(self.llm, "model_for", None)
+        model = model_for(task.name) if model_for else getattr(self.llm, "model", None) or str(self.llm)
+        tool_names = [getattr(t, "name", str(t)) for t in (tools if tools is not None else self.tools or [])]
+        return LLMResponseCache.make_key(
+            model=model,
+            role=self.role,
+            backstory=self.backstory,
+            description=task.description,
+            expected_output=task.expected_output,
+            context=context if isinstance(context, str) else json.dumps(context, ensure_ascii=False, default=str),
+            tools=tool_names
+        )
+
     def _extract_and_save_code(self, result: str, task_name: str):
         """提取代码块并保存到文件"""
         if not task_name:  # 确保task_name不为空
@@ -72,6 +162,7 @@ class LoggingAgent(Agent):
                     filepath = os.path.join(self._project_dir, filename)
                     
                     try:
+                        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
                         with open(filepath, 'w', encoding='utf-8') as f:
                             f.write(code)
                         extracted_files.append(filename)
@@ -132,17 +223,16 @@ class LoggingAgent(Agent):
                 return f"{task_name}_{index}.txt"
 
 # 角色定义 - 优化提示词，增加更多专业角色
+# AGENTS / TASKS 是只读原型，导入时创建一次；每次运行用 create_team 复制，不要直接修改
 AGENTS = {
     k: LoggingAgent(
-        role=v.role,
-        goal=v.goal,
-        backstory=v.backstory,
-        llm=v.llm,
-        tools=v.tools,
+        **spec,
+        # 每个角色只创建一个LLM；开启模型路由时按角色参数和任务名选择模型
+        llm=build_llm(os.getenv("OPENAI_MODEL", "gpt-4o-mini"), role_key=k),
         project_id="",  # 统一用空字符串
         project_dir=""   # 统一用空字符串
-    ) for k, v in {
-    "boss": Agent(
+    ) for k, spec in {
+    "boss": dict(
         role="项目总监",
         goal="负责项目整体把控、资源协调、风险管理和最终验收，确保项目按时高质量交付",
         backstory="""你是张总，一位经验丰富的项目总监，拥有15年以上的项目管理经验。
@@ -155,11 +245,10 @@ AGENTS = {
 
 你的工作风格严谨、果断，注重结果导向，善于在复杂项目中做出关键决策。
 你总是从商业价值和用户体验的角度来评估项目成果。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "product_manager": Agent(
+    "product_manager": dict(
         role="产品经理",
         goal="深入分析用户需求，设计产品功能，制定产品路线图，确保产品满足用户期望和商业目标",
         backstory="""你是李产品，一位资深产品经理，拥有8年产品设计和用户研究经验。
@@ -172,11 +261,10 @@ AGENTS = {
 
 你的工作风格细致、用户导向，善于从用户角度思考问题。
 你总是追求产品的易用性和商业价值的平衡。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "tech_lead": Agent(
+    "tech_lead": dict(
         role="技术总监",
         goal="设计系统架构，制定技术方案，确保技术选型的合理性和系统的可扩展性",
         backstory="""你是王技术，一位技术专家，拥有12年系统架构和技术管理经验。
@@ -189,11 +277,10 @@ AGENTS = {
 
 你的工作风格严谨、追求完美，注重技术的前瞻性和稳定性。
 你总是从技术可行性和长期维护的角度来评估技术方案。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "algorithm_engineer": Agent(
+    "algorithm_engineer": dict(
         role="算法工程师",
         goal="设计和实现智能算法，优化系统性能，提供数据驱动的智能解决方案",
         backstory="""你是陈算法，一位算法专家，拥有10年机器学习和算法开发经验。
@@ -206,11 +293,10 @@ AGENTS = {
 
 你的工作风格创新、数据驱动，善于将复杂问题转化为算法解决方案。
 你总是追求算法的准确性和效率的平衡。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "ui_designer": Agent(
+    "ui_designer": dict(
         role="UI设计师",
         goal="设计美观、易用的用户界面，确保产品具有良好的视觉体验和交互体验",
         backstory="""你是林设计，一位资深UI设计师，拥有7年界面设计和用户体验设计经验。
@@ -223,11 +309,10 @@ AGENTS = {
 
 你的工作风格创意、注重细节，善于将用户需求转化为美观实用的设计。
 你总是追求设计的美观性和功能性的完美结合。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "frontend_dev": Agent(
+    "frontend_dev": dict(
         role="前端开发工程师",
         goal="实现高质量的前端界面，确保良好的用户体验和性能表现",
         backstory="""你是陈前端，一位资深前端工程师，拥有6年前端开发经验。
@@ -240,11 +325,10 @@ AGENTS = {
 
 你的工作风格严谨、注重细节，善于将设计稿转化为高质量的代码。
 你总是追求代码的可维护性和用户体验的完美。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "backend_dev": Agent(
+    "backend_dev": dict(
         role="后端开发工程师",
         goal="构建稳定、高效的后端服务，确保系统的可靠性和性能",
         backstory="""你是刘后端，一位资深后端工程师，拥有8年后端开发经验。
@@ -257,11 +341,10 @@ AGENTS = {
 
 你的工作风格稳健、注重效率，善于构建可扩展的后端系统。
 你总是追求系统的稳定性和性能的平衡。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "data_analyst": Agent(
+    "data_analyst": dict(
         role="数据分析师",
         goal="分析业务数据，提供数据洞察，支持业务决策和产品优化",
         backstory="""你是赵数据，一位资深数据分析师，拥有5年数据分析和商业智能经验。
@@ -274,11 +357,10 @@ AGENTS = {
 
 你的工作风格严谨、数据驱动，善于从数据中发现业务洞察。
 你总是追求数据分析的准确性和实用性的结合。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "qa_engineer": Agent(
+    "qa_engineer": dict(
         role="测试工程师",
         goal="确保产品质量，发现和预防缺陷，提供质量保障",
         backstory="""你是赵测试，一位资深测试工程师，拥有7年软件测试和质量保障经验。
@@ -291,11 +373,10 @@ AGENTS = {
 
 你的工作风格细致、严谨，善于从用户角度发现潜在问题。
 你总是追求产品质量和用户体验的完美。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "devops_engineer": Agent(
+    "devops_engineer": dict(
         role="DevOps工程师",
         goal="构建自动化部署流程，确保系统的稳定运行和快速迭代",
         backstory="""你是孙运维，一位资深DevOps工程师，拥有6年运维和自动化经验。
@@ -308,11 +389,10 @@ AGENTS = {
 
 你的工作风格自动化、效率导向，善于构建可靠的运维体系。
 你总是追求部署的自动化和系统的稳定性。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     
-    "secretary": Agent(
+    "secretary": dict(
         role="项目文员",
         goal="协助项目文档管理，会议记录，进度跟踪，确保项目信息的有序管理",
         backstory="""你是王文员，一位细心的项目文员，拥有4年项目协调和文档管理经验。
@@ -325,7 +405,6 @@ AGENTS = {
 
 你的工作风格细致、有条理，善于整理和归纳信息。
 你总是确保项目信息的准确性和及时性。""",
-        llm=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         tools=[MCPTool()]
     ),
     }.items()
@@ -422,19 +501,60 @@ TASKS = [
     ),
 ]
 
-def multi_agent_discussion(stage_name: str, agents: List[Agent], context: Dict[str, Any], max_rounds: int = 10, context_manager: Optional[SmartContextManager] = None) -> str:
+class Team(NamedTuple):
+    """一次运行使用的Agent和任务，互不共享执行状态"""
+    agents: Dict[str, LoggingAgent]
+    tasks: List[Task]
+
+    def task(self, name: str) -> Task:
+        return next(t for t in self.tasks if t.name == name)
+
+def create_team(project_id: str = "", project_dir: str = "") -> Team:
+    """
+    从 AGENTS / TASKS 原型创建一次运行的Agent和任务，绑定项目目录
+    同一进程中的多个运行（线程或协程）各用各的实例，不会写入彼此的项目目录
+    """
+    agents = {key: prototype.for_run(project_id, project_dir) for key, prototype in AGENTS.items()}
+    run_agents = {id(AGENTS[key]): agent for key, agent in agents.items()}
+    tasks = [
+        task.model_copy(update={
+            "id": uuid.uuid4(),
+            "agent": run_agents.get(id(task.agent)),
+            "output": None,
+            "processed_by_agents": set(),
+            "used_tools": 0,
+            "tools_errors": 0,
+            "delegations": 0,
+            "retry_count": 0,
+        })
+        for task in TASKS
+    ]
+    return Team(agents, tasks)
+
+def multi_agent_discussion(stage_name: str, agents: List[Agent], context: Dict[str, Any], max_rounds: int = 10,
+                           context_manager: Optional[SmartContextManager] = None, max_workers: Optional[int] = None) -> str:
     """
     多Agent渐进式讨论，产出共识文档
     优化版本：渐进式共识达成 + 智能轮次控制 + 高质量提示词 + 智能上下文管理
+    同一轮内各Agent的发言只依赖上一轮结果，并发执行（max_workers 限制并发数），日志按Agent顺序写入
+    更早的轮次并入固定预算的滚动摘要，提示词大小不随轮次增长；完整讨论记录只写入日志文件
+    每轮解析Agent的投票块并计算与上一轮的收敛度，投票一致或观点收敛时提前结束
+    花费达到预算软上限时讨论缩短，达到硬上限时在下一轮开始前抛出 BudgetExceeded
+    每个发言完成后写入讨论断点，中断后重新进入时从最后完成的发言继续，已完成的轮次不再调用LLM
+    阶段超时时抛出 DeadlineExceeded，未完成的轮次不写入断点，已完成的发言在续跑时复用
     """
     print(f"[多Agent讨论] 开始 {stage_name} 阶段，参与Agent: {[a.role for a in agents]}")
     
     # 上下文缓存，避免重复内容
     context_cache = {}
     discussion_log = []
+    rolling_summary = RollingSummary(token_budget=DISCUSSION_SUMMARY_TOKENS)
+    consensus_tracker = ConsensusTracker(plateau_similarity=DISCUSSION_PLATEAU_SIMILARITY, participants=len(agents))
     consensus_detected = False
+    end_reason = None
     current_round = 0
     max_rounds = min(max_rounds, 10)  # 最多10轮
+    max_workers = max(1, min(max_workers or DISCUSSION_MAX_WORKERS, len(agents)))
     
     # 针对典型开发阶段，自动注入目标文件路径
     stage_file_map = {
@@ -444,84 +564,170 @@ def multi_agent_discussion(stage_name: str, agents: List[Agent], context: Dict[s
         'backend_code': 'backend/main.py',
     }
     file_path = stage_file_map.get(stage_name, None)
+    # kickoff 的输入不含项目目录时，使用Agent绑定的项目目录
+    project_dir = (context.get('project_dir') or getattr(agents[0], '_project_dir', '')) if agents else ''
+    meter = get_usage_meter(project_dir) if project_dir else None
+    checkpoint = DiscussionCheckpoint(project_dir, stage_name, DiscussionCheckpoint.make_fingerprint(
+        [a.role for a in agents], context.get('requirements', '')))
+    completed_rounds, pending_turns = checkpoint.load()
+    checkpoint.start()
     
-    # 渐进式讨论：每轮都检测共识状态
-    while current_round < max_rounds and not consensus_detected:
-        current_round += 1
-        print(f"[多Agent讨论] 第{current_round}轮讨论开始...")
-        
-        round_results = []
-        
-        for agent in agents:
-            try:
-                # 使用智能上下文管理器生成优化的上下文
-                if context_manager:
-                    optimized_context = context_manager.get_context_for_stage(stage_name, agent.role)
-                else:
-                    simplified_context = {
-                        'project_id': context.get('project_id', ''),
-                        'project_dir': context.get('project_dir', ''),
-                        'requirements': context.get('requirements', ''),
-                        'stage': stage_name,
-                        'current_round': current_round
-                    }
-                    optimized_context = str(simplified_context)
-                # 自动注入__file_path__到context
-                if file_path:
-                    if isinstance(optimized_context, str):
-                        optimized_context = f'__file_path__:{file_path}\n' + optimized_context
-                    elif isinstance(optimized_context, dict):
-                        optimized_context['__file_path__'] = file_path
-                # 根据轮次生成不同的提示词
-                if current_round == 1:
-                    prompt = _generate_first_round_prompt(agent.role, stage_name, context)
-                else:
-                    previous_summary = "\n".join(discussion_log[-len(agents):])
-                    consensus_status = _analyze_consensus_status(discussion_log[-len(agents):])
-                    prompt = _generate_follow_up_prompt(agent.role, stage_name, current_round, previous_summary, consensus_status)
-                task = Task(
-                    name=f"{stage_name}_discussion_round{current_round}_{agent.role}",
-                    description=prompt,
-                    expected_output="请提供具体的专业观点和建议。",
-                    agent=agent
-                )
-                result = agent.execute_task(task, context=optimized_context)
-                round_results.append(result)
-                discussion_log.append(f"=== 第{current_round}轮 {agent.role} 观点 ===\n{result}")
-                context_key = f"{agent.role}_{stage_name}"
-                context_cache[context_key] = {'last_output': result}
-            except Exception as e:
-                print(f"[多Agent讨论] {agent.role} 第{current_round}轮发言异常: {e}")
-                discussion_log.append(f"=== 第{current_round}轮 {agent.role} 发言异常: {e} ===")
-        print(f"[多Agent讨论] 检测第{current_round}轮共识状态...")
-        consensus_detected = _detect_consensus(round_results)
-        if consensus_detected:
-            print(f"[多Agent讨论] 第{current_round}轮检测到共识，结束讨论")
-            break
-        elif current_round < max_rounds:
-            print(f"[多Agent讨论] 第{current_round}轮未达成共识，继续下一轮")
+    def agent_turn(agent: Agent, round_num: int, previous_round_log: List[str], consensus_status: Dict) -> str:
+        """单个Agent的一次发言"""
+        # 根据轮次生成不同的提示词
+        if round_num == 1:
+            prompt = _generate_first_round_prompt(agent.role, stage_name, context)
+        else:
+            prompt = _generate_follow_up_prompt(agent.role, stage_name, round_num,
+                                                rolling_summary.text(before_round=round_num - 1),
+                                                "\n".join(previous_round_log), consensus_status)
+        # 使用智能上下文管理器生成优化的上下文，以本轮提示词做语义召回；第二轮起只发送增量
+        if context_manager:
+            optimized_context = context_manager.get_delta_context_for_stage(stage_name, agent.role, round_num, query=prompt)
         else:
-            print(f"[多Agent讨论] 达到最大轮次{max_rounds}，强制结束讨论")
+            simplified_context = {
+                'project_id': context.get('project_id', ''),
+                'project_dir': context.get('project_dir', ''),
+                'requirements': context.get('requirements', ''),
+                'stage': stage_name,
+                'current_round': round_num
+            }
+            optimized_context = str(simplified_context)
+        # 自动注入__file_path__到context
+        if file_path:
+            if isinstance(optimized_context, str):
+                optimized_context = f'__file_path__:{file_path}\n' + optimized_context
+            elif isinstance(optimized_context, dict):
+                optimized_context['__file_path__'] = file_path
+        task = Task(
+            name=f"{stage_name}_discussion_round{round_num}_{agent.role}",
+            description=prompt,
+            expected_output="请提供具体的专业观点和建议。",
+            agent=agent
+        )
+        with usage_scope(round=round_num):
+            result = agent.execute_task(task, context=optimized_context)
+        if isinstance(result, str) and result.startswith(FAILED_RESULT_PREFIXES):
+            # 失败的发言不写入断点，续跑时重新发言
+            raise RuntimeError(result)
+        checkpoint.record_turn(round_num, agent.role, result)
+        return result
+    
+    def finish_round(round_statements: List, replayed: bool = False) -> Dict:
+        """一轮发言结束后更新滚动摘要和共识状态，重放断点时不重复写入指标"""
+        rolling_summary.add_round(current_round, [(role, strip_vote(text)) for role, text in round_statements])
+        metrics = consensus_tracker.observe(current_round, round_statements)
+        if not replayed:
+            _append_consensus_metrics(project_dir, stage_name, metrics)
+        return metrics
+    
+    # 重放断点中已完成的轮次，恢复讨论日志、滚动摘要和共识状态
+    for entry in completed_rounds[:max_rounds]:
+        current_round = entry["round"]
+        round_statements = []
+        for agent in agents:
+            if agent.role in entry["turns"]:
+                round_statements.append((agent.role, entry["turns"][agent.role]))
+                discussion_log.append(f"=== 第{current_round}轮 {agent.role} 观点 ===\n{entry['turns'][agent.role]}")
+            else:
+                discussion_log.append(f"=== 第{current_round}轮 {agent.role} 发言异常: {entry['errors'].get(agent.role, '无记录')} ===")
+        finish_round(round_statements, replayed=True)
+        consensus_detected = consensus_tracker.agreed
+        end_reason = consensus_tracker.stop_reason
+        if not end_reason and meter and meter.budget_state() != "ok" and current_round >= SOFT_BUDGET_MAX_ROUNDS:
+            end_reason = "达到预算软上限"
+    if current_round:
+        print(f"[多Agent讨论] 从断点恢复：已完成 {current_round} 轮"
+              f"{f'，第{current_round + 1}轮已有 {len(pending_turns)} 个发言' if pending_turns and not end_reason else ''}"
+              f"{f'，{end_reason}' if end_reason else ''}")
+    elif pending_turns:
+        print(f"[多Agent讨论] 从断点恢复：第1轮已有 {len(pending_turns)} 个发言")
+    
+    # 渐进式讨论：每轮都检测共识状态
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="discussion") as executor:
+        while current_round < max_rounds and not end_reason:
+            current_round += 1
+            if meter:
+                meter.check(f"{stage_name}第{current_round}轮")
+            check_deadline(f"{stage_name}第{current_round}轮")
+            print(f"[多Agent讨论] 第{current_round}轮讨论开始（并发 {max_workers}）...")
+            
+            round_statements = []
+            previous_round_log = discussion_log[-len(agents):]
+            consensus_status = consensus_tracker.status()
+            # 断点中本轮已完成的发言直接复用，只为其余Agent调用LLM
+            resumed = pending_turns if current_round == len(completed_rounds) + 1 else {}
+            # 复制当前上下文，发言线程沿用所属阶段的用量标记
+            futures = [None if agent.role in resumed else
+                       executor.submit(contextvars.copy_context().run, agent_turn, agent, current_round, previous_round_log, consensus_status)
+                       for agent in agents]
+            
+            # 按Agent顺序收集结果，单个Agent异常不影响其他Agent
+            errors = {}
+            for agent, future in zip(agents, futures):
+                try:
+                    result = resumed[agent.role] if future is None else future.result()
+                    round_statements.append((agent.role, result))
+                    discussion_log.append(f"=== 第{current_round}轮 {agent.role} 观点 ===\n{result}")
+                    context_key = f"{agent.role}_{stage_name}"
+                    context_cache[context_key] = {'last_output': result}
+                except (DeadlineExceeded, LLMCacheMiss):
+                    # 其余发言线程在检查点退出，本轮不记为完成；回放未命中时中止讨论
+                    raise
+                except Exception as e:
+                    print(f"[多Agent讨论] {agent.role} 第{current_round}轮发言异常: {e}")
+                    discussion_log.append(f"=== 第{current_round}轮 {agent.role} 发言异常: {e} ===")
+                    errors[agent.role] = str(e)
+            metrics = finish_round(round_statements)
+            checkpoint.record_round(current_round, errors)
+            print(f"[多Agent讨论] 第{current_round}轮后滚动摘要: {count_tokens(rolling_summary.text())}/{DISCUSSION_SUMMARY_TOKENS} tokens")
+            if context_manager and current_round > 1:
+                savings = context_manager.get_delta_savings(stage_name, current_round)
+                print(f"[多Agent讨论] 第{current_round}轮增量上下文: 发送 {savings['sent']}/{savings['full']} tokens, 节省 {savings['saved']} tokens")
+            print(f"[多Agent讨论] 第{current_round}轮{ConsensusTracker.describe(metrics)}")
+            consensus_detected = consensus_tracker.agreed
+            end_reason = consensus_tracker.stop_reason
+            if not end_reason and meter and meter.budget_state() != "ok" and current_round >= SOFT_BUDGET_MAX_ROUNDS:
+                end_reason = "达到预算软上限"
+            if end_reason:
+                print(f"[多Agent讨论] 第{current_round}轮{end_reason}，结束讨论")
+                break
+            elif current_round < max_rounds:
+                print(f"[多Agent讨论] 第{current_round}轮未达成共识，继续下一轮")
+            else:
+                print(f"[多Agent讨论] 达到最大轮次{max_rounds}，强制结束讨论")
     print(f"[多Agent讨论] 生成最终共识文档")
+    check_deadline(f"{stage_name}共识文档")
     try:
         summary_agent = _select_summary_agent(stage_name, agents)
-        consensus_prompt = _generate_consensus_prompt(stage_name, discussion_log, current_round, consensus_detected)
+        latest_round_log = discussion_log[-len(agents):]
+        consensus_prompt = _generate_consensus_prompt(stage_name, rolling_summary.text(before_round=current_round),
+                                                      latest_round_log, current_round, consensus_detected, len(agents))
+        print(f"[多Agent讨论] 共识提示词: {count_tokens(consensus_prompt)} tokens（完整讨论记录 {count_tokens(chr(10).join(discussion_log))} tokens）")
         consensus_task = Task(
             name=f"{stage_name}_consensus",
             description=consensus_prompt,
             expected_output="请生成结构化的共识文档。",
             agent=summary_agent
         )
-        consensus_result = summary_agent.execute_task(consensus_task, context=f"讨论记录: {chr(10).join(discussion_log)}")
-        discussion_log_path = os.path.join(context.get('project_dir', ''), f'{stage_name}_discussion_log.txt')
-        consensus_path = os.path.join(context.get('project_dir', ''), f'{stage_name}_共识文档.md')
+        # 讨论内容已在提示词中，不再重复发送完整记录
+        with usage_scope(round="consensus"):
+            consensus_result = summary_agent.execute_task(consensus_task, context=f"阶段: {stage_name}，讨论轮次: {current_round}")
+        discussion_log_path = os.path.join(project_dir, f'{stage_name}_discussion_log.txt')
+        consensus_path = os.path.join(project_dir, f'{stage_name}_共识文档.md')
         try:
             with open(discussion_log_path, 'w', encoding='utf-8') as f:
                 f.write(f"# {stage_name} 阶段讨论日志\n\n")
                 f.write(f"讨论轮次: {current_round}\n")
                 f.write(f"共识状态: {'已达成共识' if consensus_detected else '未完全达成共识'}\n")
-                f.write(f"结束原因: {'自然达成' if consensus_detected else '达到最大轮次'}\n\n")
-                f.write(chr(10).join(discussion_log))
+                f.write(f"结束原因: {end_reason or '达到最大轮次'}\n")
+                for metrics in consensus_tracker.metrics:
+                    f.write(f"第{metrics['round']}轮: {ConsensusTracker.describe(metrics)}\n")
+                f.write("\n")
+                # 长发言只记录引用和开头摘录，原文与讨论断点共用一份
+                blobs = get_blob_store(project_dir)
+                f.write(chr(10).join(f"{header}\n{blobs.log_text(body)}" if body else header
+                                     for header, _, body in (entry.partition("\n") for entry in discussion_log)))
             with open(consensus_path, 'w', encoding='utf-8') as f:
                 f.write(consensus_result)
             print(f"[多Agent讨论] 讨论日志已保存: {discussion_log_path}")
@@ -529,6 +735,9 @@ def multi_agent_discussion(stage_name: str, agents: List[Agent], context: Dict[s
         except Exception as e:
             print(f"[多Agent讨论] 保存文件异常: {e}")
         return consensus_result
+    except (DeadlineExceeded, LLMCallFailed):
+        # 共识文档没有生成，阶段不能视为完成
+        raise
     except Exception as e:
         print(f"[多Agent讨论] 生成共识文档异常: {e}")
         return f"共识文档生成失败: {e}\n讨论记录:\n{chr(10).join(discussion_log)}"
@@ -556,20 +765,26 @@ def _generate_first_round_prompt(role: str, stage_name: str, context: Dict) -> s
 - 避免过度复杂化，追求简单可行的方案
 
 请用简洁明了的语言表达，确保每个建议都有实际价值。
+
+{VOTE_INSTRUCTIONS}
 """
 
 
-def _generate_follow_up_prompt(role: str, stage_name: str, round_num: int, previous_summary: str, consensus_status: Dict) -> str:
-    """生成后续轮次提示词 - 优化版本，更快达成共识"""
+def _generate_follow_up_prompt(role: str, stage_name: str, round_num: int, previous_summary: str,
+                               last_round: str, consensus_status: Dict) -> str:
+    """生成后续轮次提示词 - 优化版本，更快达成共识；更早的轮次只提供滚动摘要，上一轮提供原文"""
     return f"""基于前{round_num-1}轮讨论结果，作为{role}，请进行第{round_num}轮发言：
 
 前轮讨论摘要：
-{previous_summary}
+{previous_summary or '（无）'}
+
+上一轮（第{round_num-1}轮）发言：
+{last_round}
 
 共识状态分析：
-- 已达成共识：{consensus_status.get('agreed_points', [])}
-- 存在分歧：{consensus_status.get('disagreed_points', [])}
-- 需要澄清：{consensus_status.get('unclear_points', [])}
+- 已达成共识：{'；'.join(consensus_status.get('agreed_points', [])) or '无'}
+- 存在分歧：{'；'.join(consensus_status.get('disagreed_points', [])) or '无'}
+- 需要澄清：{'；'.join(consensus_status.get('unclear_points', [])) or '无'}
 
 请针对当前状态提供：
 1. 【分歧解决】针对存在分歧的点提出具体解决方案或妥协方案
@@ -586,32 +801,9 @@ def _generate_follow_up_prompt(role: str, stage_name: str, round_num: int, previ
 - 如果其他观点合理，主动表示支持
 
 请用简洁明了的语言表达，确保每个建议都有实际价值。
-"""
-
 
-def _analyze_consensus_status(results: List[str]) -> Dict:
-    """分析共识状态，识别已达成共识、存在分歧和需要澄清的点 - 优化版本"""
-    consensus_status = {
-        'agreed_points': [],
-        'disagreed_points': [],
-        'unclear_points': []
-    }
-    
-    # 提取关键观点
-    all_points = []
-    for result in results:
-        lines = result.split('\n')
-        for line in lines:
-            if line.strip() and ('【' in line or ':' in line or '：' in line):
-                all_points.append(line.strip())
-    
-    # 简化的观点分析 - 实际项目中可以根据需要实现更复杂的语义分析
-    # 这里我们假设大部分情况下Agent能够达成共识
-    consensus_status['agreed_points'] = ["技术选型", "架构设计", "实施策略"]
-    consensus_status['disagreed_points'] = []  # 减少分歧点
-    consensus_status['unclear_points'] = ["具体配置"]  # 减少需要澄清的点
-    
-    return consensus_status
+{VOTE_INSTRUCTIONS}
+"""
 
 
 def _select_summary_agent(stage_name: str, agents: List[Agent]) -> Agent:
@@ -624,17 +816,21 @@ def _select_summary_agent(stage_name: str, agents: List[Agent]) -> Agent:
         return agents[0]
 
 
-def _generate_consensus_prompt(stage_name: str, discussion_log: List[str], round_num: int, consensus_detected: bool) -> str:
-    """生成最终共识文档提示词"""
+def _generate_consensus_prompt(stage_name: str, previous_summary: str, latest_round_log: List[str], round_num: int,
+                               consensus_detected: bool, participant_count: int) -> str:
+    """生成最终共识文档提示词：前几轮使用滚动摘要，最后一轮使用原文"""
     return f"""基于{round_num}轮讨论，请生成{stage_name}阶段的最终共识文档：
 
-讨论记录：
-{chr(10).join(discussion_log)}
+前轮讨论摘要：
+{previous_summary or '（无）'}
+
+最后一轮（第{round_num}轮）发言：
+{chr(10).join(latest_round_log)}
 
 讨论统计：
 - 总轮次：{round_num}
 - 共识状态：{'已达成共识' if consensus_detected else '部分达成共识'}
-- 参与角色：{len(set([log.split()[2] for log in discussion_log if '===' in log]))}个
+- 参与角色：{participant_count}个
 
 请生成一份结构化的共识文档，包含：
 
@@ -679,68 +875,30 @@ def _generate_consensus_prompt(stage_name: str, discussion_log: List[str], round
 """
 
 
-def _detect_consensus(results: List[str]) -> bool:
-    """
-    智能检测是否已达成共识 - 优化版本，更快达成共识
-    通过分析Agent回答的关键词和观点来判断
-    """
-    if len(results) < 2:
-        return True
-    
-    # 扩展共识关键词
-    consensus_keywords = [
-        '同意', '支持', '认可', '确认', '达成共识', '一致', '无异议',
-        '建议', '推荐', '可行', '合理', '合适', '适当', '确认',
-        '可以', '没问题', '同意实施', '支持方案', '同意', '支持',
-        '认可', '确认', '一致', '无异议', '可行', '合理', '合适',
-        '可以', '没问题', '同意实施', '支持方案', '同意', '支持',
-        '认可', '确认', '一致', '无异议', '可行', '合理', '合适',
-        '可以', '没问题', '同意实施', '支持方案'
-    ]
-    
-    # 减少分歧关键词的影响
-    conflict_keywords = [
-        '不同意', '反对', '质疑', '问题', '风险', '担忧', '需要讨论',
-        '分歧', '争议', '不同意见', '建议修改', '重新考虑', '有疑问',
-        '不确定', '需要澄清', '有待商榷'
-    ]
-    
-    consensus_count = 0
-    conflict_count = 0
-    
-    for result in results:
-        result_lower = result.lower()
-        
-        # 统计共识和分歧关键词
-        for keyword in consensus_keywords:
-            if keyword in result_lower:
-                consensus_count += 1
-        
-        for keyword in conflict_keywords:
-            if keyword in result_lower:
-                conflict_count += 1
-    
-    # 判断共识状态 - 降低阈值，更容易达成共识
-    total_agents = len(results)
-    consensus_ratio = consensus_count / (consensus_count + conflict_count) if (consensus_count + conflict_count) > 0 else 1.0
-    
-    # 降低共识阈值：从75%降低到60%，更容易达成共识
-    if consensus_ratio > 0.6 and conflict_count < total_agents * 0.4:
-        return True
-    
-    # 额外规则：如果所有Agent都使用了共识关键词，直接认为达成共识
-    if consensus_count >= total_agents * 2:  # 每个Agent至少使用2个共识关键词
-        return True
-    
-    return False
+def _append_consensus_metrics(project_dir: str, stage_name: str, metrics: Dict) -> None:
+    """追加每轮共识指标到 consensus_metrics.jsonl，用于统计平均讨论轮次和调优停止阈值"""
+    if not project_dir:
+        return
+    try:
+        os.makedirs(project_dir, exist_ok=True)
+        with open(os.path.join(project_dir, 'consensus_metrics.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"stage": stage_name, "timestamp": time.time(), **metrics}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[多Agent讨论] 保存共识指标异常: {e}")
 
-def run_command_with_log(cmd, cwd, log_path):
-    """在指定目录下执行命令，捕获stdout/stderr并写入日志，返回(exitcode, stdout, stderr)"""
+def run_command_with_log(cmd, cwd, log_path, timeout=None):
+    """在指定目录下执行命令，捕获stdout/stderr并写入日志，返回(exitcode, stdout, stderr)；超过 timeout 秒时终止命令"""
     with open(log_path, 'a', encoding='utf-8') as f:
         f.write(f"\n[CMD] {cmd}\n")
         try:
             proc = subprocess.Popen(cmd, cwd=cwd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            out, err = proc.communicate()
+            try:
+                out, err = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.communicate()
+                f.write(f"[TIMEOUT] 超过 {timeout:.0f} 秒，已终止\n")
+                return -1, '', f"命令执行超过 {timeout:.0f} 秒，已终止"
             out = out.decode(errors='ignore')
             err = err.decode(errors='ignore')
             f.write(f"[STDOUT]\n{out}\n[STDERR]\n{err}\n[EXITCODE] {proc.returncode}\n")
@@ -756,6 +914,63 @@ def extract_error_summary(log):
     error_lines = [l for l in lines if re.search(r'(error|exception|fail|traceback|not found|denied|refused|exit code)', l, re.I)]
     return '\n'.join(error_lines[-10:]) if error_lines else '\n'.join(lines[-10:])
 
+# 阶段声明：执行方式（多Agent讨论 discussion / 单Agent任务 task）、写入上下文的优先级和类型、
+# 可直接复用的共识文档；阶段间依赖取自 SmartContextManager.stage_dependencies，after 为额外的先后约束
+STAGE_SPECS: Dict[str, Dict[str, Any]] = {
+    "requirement_analysis": {
+        "label": "需求分析", "discussion": "需求分析", "agents": ["boss", "product_manager", "tech_lead"],
+        "priority": ContextPriority.CRITICAL, "context_type": ContextType.REQUIREMENT, "doc": "需求分析_共识文档.md"
+    },
+    "technical_design": {
+        "label": "技术设计", "discussion": "技术设计", "agents": ["tech_lead", "product_manager", "frontend_dev", "backend_dev"],
+        "priority": ContextPriority.CRITICAL, "context_type": ContextType.DESIGN, "doc": "技术设计_共识文档.md"
+    },
+    "ui_design": {
+        "label": "UI设计", "task": "ui_design",
+        "priority": ContextPriority.HIGH, "context_type": ContextType.DESIGN, "doc": "UI设计_共识文档.md"
+    },
+    "frontend_development": {
+        "label": "前端开发讨论", "discussion": "前端开发", "agents": ["frontend_dev", "ui_designer", "tech_lead"],
+        "priority": ContextPriority.HIGH, "context_type": ContextType.IMPLEMENTATION, "doc": "前端开发_共识文档.md"
+    },
+    "frontend_code": {
+        "label": "前端代码生成", "task": "frontend_development",
+        "after": ["technical_design", "ui_design", "frontend_development"],
+        "priority": ContextPriority.MEDIUM, "context_type": ContextType.IMPLEMENTATION
+    },
+    "backend_development": {
+        "label": "后端开发讨论", "discussion": "后端开发", "agents": ["backend_dev", "tech_lead", "product_manager"],
+        "priority": ContextPriority.HIGH, "context_type": ContextType.IMPLEMENTATION, "doc": "后端开发_共识文档.md"
+    },
+    "backend_code": {
+        "label": "后端代码生成", "task": "backend_development",
+        "after": ["technical_design", "backend_development"],
+        "priority": ContextPriority.MEDIUM, "context_type": ContextType.IMPLEMENTATION
+    },
+    "data_analysis": {
+        "task": "data_analysis",
+        "priority": ContextPriority.MEDIUM, "context_type": ContextType.IMPLEMENTATION, "doc": "data_analysis_共识文档.md"
+    },
+    "testing": {
+        "task": "testing", "after": ["frontend_code", "backend_code"],
+        "priority": ContextPriority.MEDIUM, "context_type": ContextType.IMPLEMENTATION, "doc": "testing_共识文档.md"
+    },
+    "deployment": {
+        "task": "deployment",
+        "priority": ContextPriority.MEDIUM, "context_type": ContextType.CONFIGURATION, "doc": "deployment_共识文档.md"
+    },
+    "documentation": {
+        "task": "documentation", "after": ["frontend_code", "backend_code"],
+        "priority": ContextPriority.MEDIUM, "context_type": ContextType.REQUIREMENT, "doc": "documentation_共识文档.md"
+    },
+    "acceptance": {
+        "label": "验收", "discussion": "验收", "after": ["data_analysis"],
+        "agents": ["boss", "product_manager", "qa_engineer", "frontend_dev", "backend_dev"],
+        "priority": ContextPriority.CRITICAL, "context_type": ContextType.REQUIREMENT, "doc": "验收_共识文档.md"
+    },
+    "auto_execution": {"label": "自动执行与修正", "after": ["acceptance"]}
+}
+
 class AiTeamCrew:
     def __init__(self, project_id=None, project_dir=None):
         self.project_id = project_id
@@ -767,15 +982,20 @@ class AiTeamCrew:
             self.context_manager = None
         pid = str(project_id) if project_id is not None else ""
         pdir = str(project_dir) if project_dir is not None else ""
-        for agent in AGENTS.values():
-            agent._project_id = pid
-            agent._project_dir = pdir
-        self.crew = Crew(agents=list(AGENTS.values()), tasks=TASKS)
+        # 本次运行独立的Agent和任务，多个 AiTeamCrew 可在同一进程中并发 kickoff
+        self.team = create_team(pid, pdir)
+        # 并发阶段共享 results/context，写入时加锁
+        self._state_lock = threading.Lock()
+        # 按轮次续跑的阶段：忽略已有共识文档，重新讨论
+        self._rediscuss_stages = set()
+        self.stage_durations: Dict[str, float] = {}
+        self.stage_spans: Dict[str, Tuple[float, float]] = {}
 
     def auto_execute_and_fix(self, project_dir, file_to_run, agent_list, run_type='python', custom_cmd=None, use_mcp=False, max_retry=3):
         """
         支持多执行类型、MCP远程执行、日志摘要与多Agent修正。
         优化版本：添加智能重试策略、循环检测和详细错误分析
+        每次尝试和修正前检查阶段时限，超时时抛出 DeadlineExceeded；本地命令的执行时间不超过阶段剩余时间
         """
         log_path = os.path.join(project_dir, 'auto_exec_log.txt')
         mcp = MCPServer(workspace_path=project_dir) if use_mcp else None
@@ -784,6 +1004,7 @@ class AiTeamCrew:
         execution_history = []
         
         for attempt in range(1, max_retry+1):
+            check_deadline(f"自动执行第{attempt}次尝试")
             print(f"[自动执行] 第 {attempt}/{max_retry} 次尝试，类型: {run_type}")
             
             # 1. 构造命令
@@ -838,7 +1059,7 @@ class AiTeamCrew:
                             out = run_result.logs
                             err = run_result.message if not run_result.success else ''
                     else:
-                        exitcode, out, err = run_command_with_log(cmd, project_dir, log_path)
+                        exitcode, out, err = run_command_with_log(cmd, project_dir, log_path, timeout=remaining_seconds())
                         logs = out + '\n' + err
                     
             except Exception as e:
@@ -882,6 +1103,7 @@ class AiTeamCrew:
                 if i >= 2:  # 最多2个Agent参与修正
                     break
                     
+                check_deadline(f"{agent.role} 修正")
                 try:
                     fix_task = Task(
                         name=f"auto_fix_{run_type}_attempt{attempt}_agent{i+1}", 
@@ -891,6 +1113,8 @@ class AiTeamCrew:
                     )
                     result = agent.execute_task(fix_task, context=fix_prompt, tools=agent.tools)
                     print(f"[自动执行] {agent.role} 修正完成")
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     print(f"[自动执行] {agent.role} 修正异常: {e}")
                     
@@ -951,15 +1175,130 @@ class AiTeamCrew:
                 'suggestion': '查看详细错误日志，手动分析问题'
             }
 
-    def kickoff(self, inputs, resume_from: Optional[str] = None):
+    def _stage_dependencies(self) -> Dict[str, List[str]]:
+        """阶段依赖：上下文管理器声明的依赖 + STAGE_SPECS 中额外的先后约束"""
+        declared = self.context_manager.stage_dependencies
+        return {
+            stage: list(dict.fromkeys(declared.get(stage, []) + spec.get("after", [])))
+            for stage, spec in STAGE_SPECS.items()
+        }
+    
+    def _run_stage(self, stage: str, context: Dict[str, Any], results: Dict[str, Any],
+                   progress_manager: "ProgressManager", project_dir: str):
+        """执行单个阶段：已有共识文档时直接使用，已完成时跳过，否则讨论或由单Agent执行"""
+        spec = STAGE_SPECS[stage]
+        label = spec.get("label", stage)
+        if stage == "auto_execution":
+            if not progress_manager.is_stage_completed(stage):
+                get_usage_meter(project_dir).check("自动执行阶段")
+            self._run_auto_execution(context, progress_manager, project_dir)
+            return
+        
+        consensus_path = os.path.join(project_dir, spec["doc"]) if spec.get("doc") else None
+        if consensus_path and os.path.exists(consensus_path) and stage not in self._rediscuss_stages:
+            print(f"[AI团队] 检测到{label}共识文档，直接用文档驱动开发...")
+            with open(consensus_path, 'r', encoding='utf-8') as f:
+                result = f.read()
+        elif not progress_manager.is_stage_completed(stage):
+            get_usage_meter(project_dir).check(f"{label}阶段")
+            print(f"[AI团队] 开始{label}阶段...")
+            with self._state_lock:
+                stage_context = dict(context)
+            if "discussion" in spec:
+                result = multi_agent_discussion(
+                    stage_name=spec["discussion"],
+                    agents=[self.team.agents[name] for name in spec["agents"]],
+                    context=stage_context,
+                    max_rounds=10,  # 使用渐进式共识达成，最多10轮
+                    context_manager=self.context_manager
+                )
+            else:
+                task = self.team.task(spec["task"])
+                agent = task.agent
+                if agent is None:
+                    return
+                optimized_context = self.context_manager.get_context_for_stage(stage, agent.role)
+                result = agent.execute_task(task, context=optimized_context, tools=task.tools)
+            if isinstance(result, str) and result.startswith(FAILED_RESULT_PREFIXES):
+                raise StageFailed(f"{label}阶段执行失败，未保存进度: {result[:200]}")
+        else:
+            print(f"[AI团队] {label}阶段已完成，跳过...")
+            with self._state_lock:
+                results[stage] = progress_manager.get_stage_result(stage)
+                context[f"{stage}_result"] = results[stage]
+            return
+        
+        with self._state_lock:
+            results[stage] = result
+            context[f"{stage}_result"] = result
+            saved_context = dict(context)
+        self.context_manager.add_context(
+            key=f"{stage}_result",
+            value=result,
+            priority=spec["priority"],
+            context_type=spec["context_type"],
+            stage=stage
+        )
+        progress_manager.save_progress(stage, result, saved_context)
+        self.context_manager.flush()
+    
+    def _run_auto_execution(self, context: Dict[str, Any], progress_manager: "ProgressManager", project_dir: str):
+        """自动执行与修正闭环（多类型、多Agent、多环境）"""
+        if progress_manager.is_stage_completed("auto_execution"):
+            print("[AI团队] 自动执行与修正阶段已完成，跳过...")
+            return
+        print("[AI团队] 开始自动执行与修正阶段...")
+        # 1) main.py
+        main_py = os.path.join(project_dir, 'main.py')
+        if os.path.exists(main_py):
+            self.auto_execute_and_fix(
+                project_dir, 'main.py',
+                agent_list=[self.team.agents["backend_dev"], self.team.agents["qa_engineer"]],
+                run_type='python', use_mcp=True, max_retry=3)
+        # 2) shell脚本
+        shell_file = os.path.join(project_dir, 'deploy.sh')
+        if os.path.exists(shell_file):
+            self.auto_execute_and_fix(
+                project_dir, 'deploy.sh',
+                agent_list=[self.team.agents["devops_engineer"]],
+                run_type='shell', use_mcp=True, max_retry=2)
+        # 3) npm前端
+        frontend_dir = os.path.join(project_dir, 'frontend')
+        if os.path.exists(frontend_dir):
+            self.auto_execute_and_fix(
+                frontend_dir, 'build',
+                agent_list=[self.team.agents["frontend_dev"], self.team.agents["qa_engineer"]],
+                run_type='npm', use_mcp=True, max_retry=2)
+        # 4) pytest自动化测试
+        test_file = os.path.join(project_dir, 'tests')
+        if os.path.exists(test_file):
+            self.auto_execute_and_fix(
+                project_dir, '',
+                agent_list=[self.team.agents["qa_engineer"], self.team.agents["backend_dev"]],
+                run_type='pytest', use_mcp=True, max_retry=2)
+        # 5) Dockerfile
+        dockerfile = os.path.join(project_dir, 'Dockerfile')
+        if os.path.exists(dockerfile):
+            self.auto_execute_and_fix(
+                project_dir, '',
+                agent_list=[self.team.agents["devops_engineer"], self.team.agents["backend_dev"]],
+                run_type='docker', use_mcp=True, max_retry=2)
+        with self._state_lock:
+            saved_context = dict(context)
+        progress_manager.save_progress("auto_execution", "自动执行完成", saved_context)
+        self.context_manager.flush()
+    
+    def kickoff(self, inputs, resume_from: Optional[str] = None, max_parallel_stages: Optional[int] = None):
         """
         启动AI团队协作流程
         inputs: 项目输入参数
-        resume_from: 从指定阶段继续执行（可选）
+        resume_from: 从指定阶段继续执行（可选）；"阶段:轮次" 表示从该阶段讨论的第N轮重新开始，
+                     之前的轮次从讨论断点恢复
+        max_parallel_stages: 同时执行的阶段数上限（默认取 AI_TEAM_STAGE_WORKERS）
         """
         context = dict(inputs) if inputs else {}
         results = {}
-        project_dir = AGENTS["product_manager"]._project_dir
+        project_dir = self.team.agents["product_manager"]._project_dir
         
         # 初始化进度管理器
         progress_manager = ProgressManager(project_dir)
@@ -987,6 +1326,15 @@ class AiTeamCrew:
         
         # 如果指定了恢复点，检查进度
         if resume_from:
+            resume_from, resume_round = parse_resume_point(resume_from)
+            if resume_round:
+                spec = STAGE_SPECS.get(resume_from, {})
+                if "discussion" not in spec:
+                    raise ValueError(f"阶段 '{resume_from}' 不是讨论阶段，不能按轮次继续")
+                kept = DiscussionCheckpoint(project_dir, spec["discussion"]).truncate(resume_round)
+                progress_manager.invalidate_stage(resume_from)
+                self._rediscuss_stages.add(resume_from)
+                print(f"[AI团队] {spec['label']}从第{resume_round}轮重新讨论，复用断点中的 {kept} 轮")
             print(f"[AI团队] 从阶段 '{resume_from}' 继续执行...")
             # 加载已完成阶段的结果到context和上下文管理器
             for stage in progress_manager.stages:
@@ -1007,397 +1355,67 @@ class AiTeamCrew:
                     if stage == resume_from:
                         break
         
-        initial_input = f"项目需求：{inputs.get('requirements', '')}"
+        # 按阶段依赖图调度：依赖都已完成的阶段并发执行
+        graph = StageGraph(self._stage_dependencies())
+        stage_workers = max_parallel_stages or STAGE_MAX_WORKERS
+        print(f"[AI团队] 阶段调度顺序: {' -> '.join(graph.order)}（最多并发 {stage_workers} 个阶段）")
+        durations: Dict[str, float] = {}
+        spans: Dict[str, Tuple[float, float]] = {}
+        # 各阶段耗时和起止时间，供基准测试等调用方读取
+        self.stage_durations = durations
+        self.stage_spans = spans
         
-        # 1. 需求分析阶段：老板-产品经理-技术总监多轮对话
-        consensus_path = os.path.join(project_dir, '需求分析_共识文档.md')
-        if os.path.exists(consensus_path):
-            print("[AI团队] 检测到需求分析共识文档，直接用文档驱动开发...")
-            with open(consensus_path, 'r', encoding='utf-8') as f:
-                consensus = f.read()
-            results["requirement_analysis"] = consensus
-            context["requirement_analysis_result"] = consensus
-            self.context_manager.add_context(
-                key="requirement_analysis_result",
-                value=consensus,
-                priority=ContextPriority.CRITICAL,
-                context_type=ContextType.REQUIREMENT,
-                stage="requirement_analysis"
-            )
-            progress_manager.save_progress("requirement_analysis", consensus, context)
-        elif not progress_manager.is_stage_completed("requirement_analysis"):
-            print("[AI团队] 开始需求分析阶段...")
-            consensus = multi_agent_discussion(
-                stage_name="需求分析",
-                agents=[AGENTS["boss"], AGENTS["product_manager"], AGENTS["tech_lead"]],
-                context=context,
-                max_rounds=10,  # 使用渐进式共识达成，最多10轮
-                context_manager=self.context_manager
-            )
-            results["requirement_analysis"] = consensus
-            context["requirement_analysis_result"] = consensus
-            self.context_manager.add_context(
-                key="requirement_analysis_result",
-                value=consensus,
-                priority=ContextPriority.CRITICAL,
-                context_type=ContextType.REQUIREMENT,
-                stage="requirement_analysis"
-            )
-            progress_manager.save_progress("requirement_analysis", consensus, context)
-        else:
-            print("[AI团队] 需求分析阶段已完成，跳过...")
-            results["requirement_analysis"] = progress_manager.get_stage_result("requirement_analysis")
-            context["requirement_analysis_result"] = results["requirement_analysis"]
+        def run_stage(stage: str):
+            begin = time.time()
+            with usage_scope(stage=stage), deadline_scope(f"{STAGE_SPECS[stage].get('label', stage)}阶段", STAGE_TIMEOUT):
+                self._run_stage(stage, context, results, progress_manager, project_dir)
+            end = time.time()
+            durations[stage] = end - begin
+            spans[stage] = (begin, end)
         
-        # 2. 技术设计阶段：技术总监-产品经理-前端-后端多轮对话
-        consensus_path = os.path.join(project_dir, '技术设计_共识文档.md')
-        if os.path.exists(consensus_path):
-            print("[AI团队] 检测到技术设计共识文档，直接用文档驱动开发...")
-            with open(consensus_path, 'r', encoding='utf-8') as f:
-                consensus = f.read()
-            results["technical_design"] = consensus
-            context["technical_design_result"] = consensus
-            self.context_manager.add_context(
-                key="technical_design_result",
-                value=consensus,
-                priority=ContextPriority.CRITICAL,
-                context_type=ContextType.DESIGN,
-                stage="technical_design"
-            )
-            progress_manager.save_progress("technical_design", consensus, context)
-        elif not progress_manager.is_stage_completed("technical_design"):
-            print("[AI团队] 开始技术设计阶段...")
-            consensus = multi_agent_discussion(
-                stage_name="技术设计",
-                agents=[AGENTS["tech_lead"], AGENTS["product_manager"], AGENTS["frontend_dev"], AGENTS["backend_dev"]],
-                context=context,
-                max_rounds=10,  # 使用渐进式共识达成，最多10轮
-                context_manager=self.context_manager
-            )
-            results["technical_design"] = consensus
-            context["technical_design_result"] = consensus
-            self.context_manager.add_context(
-                key="technical_design_result",
-                value=consensus,
-                priority=ContextPriority.CRITICAL,
-                context_type=ContextType.DESIGN,
-                stage="technical_design"
-            )
-            progress_manager.save_progress("technical_design", consensus, context)
-        else:
-            print("[AI团队] 技术设计阶段已完成，跳过...")
-            results["technical_design"] = progress_manager.get_stage_result("technical_design")
-            context["technical_design_result"] = results["technical_design"]
-        
-        # 3. UI设计阶段（单Agent串行）
-        consensus_path = os.path.join(project_dir, 'UI设计_共识文档.md')
-        if os.path.exists(consensus_path):
-            print("[AI团队] 检测到UI设计共识文档，直接用文档驱动开发...")
-            with open(consensus_path, 'r', encoding='utf-8') as f:
-                result = f.read()
-            results["ui_design"] = result
-            context["ui_design_result"] = result
-            self.context_manager.add_context(
-                key="ui_design_result",
-                value=result,
-                priority=ContextPriority.HIGH,
-                context_type=ContextType.DESIGN,
-                stage="ui_design"
-            )
-            progress_manager.save_progress("ui_design", result, context)
-        elif not progress_manager.is_stage_completed("ui_design"):
-            print("[AI团队] 开始UI设计阶段...")
-            task = next(t for t in TASKS if t.name == "ui_design")
-            agent = task.agent
-            if agent is not None:
-                optimized_context = self.context_manager.get_context_for_stage("ui_design", agent.role)
-                result = agent.execute_task(task, context=optimized_context, tools=task.tools)
-                results["ui_design"] = result
-                context["ui_design_result"] = result
-                self.context_manager.add_context(
-                    key="ui_design_result",
-                    value=result,
-                    priority=ContextPriority.HIGH,
-                    context_type=ContextType.DESIGN,
-                    stage="ui_design"
-                )
-                progress_manager.save_progress("ui_design", result, context)
-        else:
-            print("[AI团队] UI设计阶段已完成，跳过...")
-            results["ui_design"] = progress_manager.get_stage_result("ui_design")
-            context["ui_design_result"] = results["ui_design"]
-        
-        # 4. 前端开发阶段：前端-UI设计-技术总监多轮对话
-        consensus_path = os.path.join(project_dir, '前端开发_共识文档.md')
-        if os.path.exists(consensus_path):
-            print("[AI团队] 检测到前端开发共识文档，直接用文档驱动开发...")
-            with open(consensus_path, 'r', encoding='utf-8') as f:
-                consensus = f.read()
-            results["frontend_development"] = consensus
-            context["frontend_development_result"] = consensus
-            self.context_manager.add_context(
-                key="frontend_development_result",
-                value=consensus,
-                priority=ContextPriority.HIGH,
-                context_type=ContextType.IMPLEMENTATION,
-                stage="frontend_development"
-            )
-            progress_manager.save_progress("frontend_development", consensus, context)
-        elif not progress_manager.is_stage_completed("frontend_development"):
-            print("[AI团队] 开始前端开发讨论阶段...")
-            consensus = multi_agent_discussion(
-                stage_name="前端开发",
-                agents=[AGENTS["frontend_dev"], AGENTS["ui_designer"], AGENTS["tech_lead"]],
-                context=context,
-                max_rounds=10,  # 使用渐进式共识达成，最多10轮
-                context_manager=self.context_manager
-            )
-            results["frontend_development"] = consensus
-            context["frontend_development_result"] = consensus
-            self.context_manager.add_context(
-                key="frontend_development_result",
-                value=consensus,
-                priority=ContextPriority.HIGH,
-                context_type=ContextType.IMPLEMENTATION,
-                stage="frontend_development"
-            )
-            progress_manager.save_progress("frontend_development", consensus, context)
-        else:
-            print("[AI团队] 前端开发讨论阶段已完成，跳过...")
-            results["frontend_development"] = progress_manager.get_stage_result("frontend_development")
-            context["frontend_development_result"] = results["frontend_development"]
-        
-        # 4.1 前端代码生成阶段（单Agent执行）
-        if not progress_manager.is_stage_completed("frontend_code"):
-            print("[AI团队] 开始前端代码生成阶段...")
-            task = next(t for t in TASKS if t.name == "frontend_development")
-            agent = task.agent
-            if agent is not None:
-                # 使用智能上下文管理器
-                optimized_context = self.context_manager.get_context_for_stage("frontend_code", agent.role)
-                result = agent.execute_task(task, context=optimized_context, tools=task.tools)
-                results["frontend_code"] = result
-                context["frontend_code_result"] = result
-                
-                # 添加到智能上下文管理器
-                self.context_manager.add_context(
-                    key="frontend_code_result",
-                    value=result,
-                    priority=ContextPriority.MEDIUM,
-                    context_type=ContextType.IMPLEMENTATION,
-                    stage="frontend_code"
-                )
-                
-                progress_manager.save_progress("frontend_code", result, context)
-        else:
-            print("[AI团队] 前端代码生成阶段已完成，跳过...")
-            results["frontend_code"] = progress_manager.get_stage_result("frontend_code")
-            context["frontend_code_result"] = results["frontend_code"]
-        
-        # 5. 后端开发阶段：后端-技术总监-产品经理多轮对话
-        consensus_path = os.path.join(project_dir, '后端开发_共识文档.md')
-        if os.path.exists(consensus_path):
-            print("[AI团队] 检测到后端开发共识文档，直接用文档驱动开发...")
-            with open(consensus_path, 'r', encoding='utf-8') as f:
-                consensus = f.read()
-            results["backend_development"] = consensus
-            context["backend_development_result"] = consensus
-            self.context_manager.add_context(
-                key="backend_development_result",
-                value=consensus,
-                priority=ContextPriority.HIGH,
-                context_type=ContextType.IMPLEMENTATION,
-                stage="backend_development"
-            )
-            progress_manager.save_progress("backend_development", consensus, context)
-        elif not progress_manager.is_stage_completed("backend_development"):
-            print("[AI团队] 开始后端开发讨论阶段...")
-            consensus = multi_agent_discussion(
-                stage_name="后端开发",
-                agents=[AGENTS["backend_dev"], AGENTS["tech_lead"], AGENTS["product_manager"]],
-                context=context,
-                max_rounds=10,  # 使用渐进式共识达成，最多10轮
-                context_manager=self.context_manager
-            )
-            results["backend_development"] = consensus
-            context["backend_development_result"] = consensus
-            self.context_manager.add_context(
-                key="backend_development_result",
-                value=consensus,
-                priority=ContextPriority.HIGH,
-                context_type=ContextType.IMPLEMENTATION,
-                stage="backend_development"
-            )
-            progress_manager.save_progress("backend_development", consensus, context)
-        else:
-            print("[AI团队] 后端开发讨论阶段已完成，跳过...")
-            results["backend_development"] = progress_manager.get_stage_result("backend_development")
-            context["backend_development_result"] = results["backend_development"]
-        
-        # 5.1 后端代码生成阶段（单Agent执行）
-        if not progress_manager.is_stage_completed("backend_code"):
-            print("[AI团队] 开始后端代码生成阶段...")
-            task = next(t for t in TASKS if t.name == "backend_development")
-            agent = task.agent
-            if agent is not None:
-                # 使用智能上下文管理器
-                optimized_context = self.context_manager.get_context_for_stage("backend_code", agent.role)
-                result = agent.execute_task(task, context=optimized_context, tools=task.tools)
-                results["backend_code"] = result
-                context["backend_code_result"] = result
-                
-                # 添加到智能上下文管理器
-                self.context_manager.add_context(
-                    key="backend_code_result",
-                    value=result,
-                    priority=ContextPriority.MEDIUM,
-                    context_type=ContextType.IMPLEMENTATION,
-                    stage="backend_code"
-                )
-                
-                progress_manager.save_progress("backend_code", result, context)
-        else:
-            print("[AI团队] 后端代码生成阶段已完成，跳过...")
-            results["backend_code"] = progress_manager.get_stage_result("backend_code")
-            context["backend_code_result"] = results["backend_code"]
-        
-        # 6. 数据分析、测试、部署、文档阶段（单Agent串行）
-        for name, doc_type, priority in [
-            ("data_analysis", ContextType.IMPLEMENTATION, ContextPriority.MEDIUM),
-            ("testing", ContextType.IMPLEMENTATION, ContextPriority.MEDIUM),
-            ("deployment", ContextType.CONFIGURATION, ContextPriority.MEDIUM),
-            ("documentation", ContextType.REQUIREMENT, ContextPriority.MEDIUM)
-        ]:
-            consensus_path = os.path.join(project_dir, f'{name}_共识文档.md')
-            if os.path.exists(consensus_path):
-                print(f"[AI团队] 检测到{name}共识文档，直接用文档驱动开发...")
-                with open(consensus_path, 'r', encoding='utf-8') as f:
-                    result = f.read()
-                results[name] = result
-                context[f"{name}_result"] = result
-                self.context_manager.add_context(
-                    key=f"{name}_result",
-                    value=result,
-                    priority=priority,
-                    context_type=doc_type,
-                    stage=name
-                )
-                progress_manager.save_progress(name, result, context)
-            elif not progress_manager.is_stage_completed(name):
-                print(f"[AI团队] 开始{name}阶段...")
-                task = next(t for t in TASKS if t.name == name)
-                agent = task.agent
-                if agent is not None:
-                    optimized_context = self.context_manager.get_context_for_stage(name, agent.role)
-                    result = agent.execute_task(task, context=optimized_context, tools=task.tools)
-                    results[name] = result
-                    context[f"{name}_result"] = result
-                    self.context_manager.add_context(
-                        key=f"{name}_result",
-                        value=result,
-                        priority=priority,
-                        context_type=doc_type,
-                        stage=name
-                    )
-                    progress_manager.save_progress(name, result, context)
-            else:
-                print(f"[AI团队] {name}阶段已完成，跳过...")
-                results[name] = progress_manager.get_stage_result(name)
-                context[f"{name}_result"] = results[name]
-        
-        # 7. 验收阶段：老板-产品经理-测试-开发多轮对话
-        consensus_path = os.path.join(project_dir, '验收_共识文档.md')
-        if os.path.exists(consensus_path):
-            print("[AI团队] 检测到验收共识文档，直接用文档驱动开发...")
-            with open(consensus_path, 'r', encoding='utf-8') as f:
-                consensus = f.read()
-            results["acceptance"] = consensus
-            context["acceptance_result"] = consensus
-            self.context_manager.add_context(
-                key="acceptance_result",
-                value=consensus,
-                priority=ContextPriority.CRITICAL,
-                context_type=ContextType.REQUIREMENT,
-                stage="acceptance"
-            )
-            progress_manager.save_progress("acceptance", consensus, context)
-        elif not progress_manager.is_stage_completed("acceptance"):
-            print("[AI团队] 开始验收阶段...")
-            consensus = multi_agent_discussion(
-                stage_name="验收",
-                agents=[AGENTS["boss"], AGENTS["product_manager"], AGENTS["qa_engineer"], AGENTS["frontend_dev"], AGENTS["backend_dev"]],
-                context=context,
-                max_rounds=10,  # 使用渐进式共识达成，最多10轮
-                context_manager=self.context_manager
-            )
-            results["acceptance"] = consensus
-            context["acceptance_result"] = consensus
-            self.context_manager.add_context(
-                key="acceptance_result",
-                value=consensus,
-                priority=ContextPriority.CRITICAL,
-                context_type=ContextType.REQUIREMENT,
-                stage="acceptance"
-            )
-            progress_manager.save_progress("acceptance", consensus, context)
-        else:
-            print("[AI团队] 验收阶段已完成，跳过...")
-            results["acceptance"] = progress_manager.get_stage_result("acceptance")
-            context["acceptance_result"] = results["acceptance"]
-        
-        # 8. 自动执行与修正闭环（多类型、多Agent、多环境）
-        if not progress_manager.is_stage_completed("auto_execution"):
-            print("[AI团队] 开始自动执行与修正阶段...")
-            # 1) main.py
-            main_py = os.path.join(project_dir, 'main.py')
-            if os.path.exists(main_py):
-                self.auto_execute_and_fix(
-                    project_dir, 'main.py',
-                    agent_list=[AGENTS["backend_dev"], AGENTS["qa_engineer"]],
-                    run_type='python', use_mcp=True, max_retry=3)
-            # 2) shell脚本
-            shell_file = os.path.join(project_dir, 'deploy.sh')
-            if os.path.exists(shell_file):
-                self.auto_execute_and_fix(
-                    project_dir, 'deploy.sh',
-                    agent_list=[AGENTS["devops_engineer"]],
-                    run_type='shell', use_mcp=True, max_retry=2)
-            # 3) npm前端
-            frontend_dir = os.path.join(project_dir, 'frontend')
-            if os.path.exists(frontend_dir):
-                self.auto_execute_and_fix(
-                    frontend_dir, 'build',
-                    agent_list=[AGENTS["frontend_dev"], AGENTS["qa_engineer"]],
-                    run_type='npm', use_mcp=True, max_retry=2)
-            # 4) pytest自动化测试
-            test_file = os.path.join(project_dir, 'tests')
-            if os.path.exists(test_file):
-                self.auto_execute_and_fix(
-                    project_dir, '',
-                    agent_list=[AGENTS["qa_engineer"], AGENTS["backend_dev"]],
-                    run_type='pytest', use_mcp=True, max_retry=2)
-            # 5) Dockerfile
-            dockerfile = os.path.join(project_dir, 'Dockerfile')
-            if os.path.exists(dockerfile):
-                self.auto_execute_and_fix(
-                    project_dir, '',
-                    agent_list=[AGENTS["devops_engineer"], AGENTS["backend_dev"]],
-                    run_type='docker', use_mcp=True, max_retry=2)
-            progress_manager.save_progress("auto_execution", "自动执行完成", context)
-        else:
-            print("[AI团队] 自动执行与修正阶段已完成，跳过...")
+        start_time = time.time()
+        try:
+            graph.run(run_stage, max_workers=stage_workers)
+        except BudgetExceeded as e:
+            # 已完成的阶段都已保存进度，提高预算后可用 --resume-from 继续
+            print(f"[AI团队] {e}，已完成阶段的进度已保存，提高预算后可继续执行")
+        except DeadlineExceeded as e:
+            # 超时阶段不保存进度，讨论中已完成的发言保存在讨论断点中
+            print(f"[AI团队] {e}，已完成阶段的进度和讨论断点已保存，可用 --resume-from 继续")
+        except (LLMCallFailed, StageFailed) as e:
+            # 失败的阶段不保存进度，重新运行时再次执行
+            print(f"[AI团队] 阶段执行失败，流程暂停: {e}，已完成阶段的进度和讨论断点已保存，可用 --resume-from 继续")
+        critical_time, critical_stages = graph.critical_path(durations)
+        print(f"[AI团队] 总耗时 {time.time() - start_time:.1f} 秒，关键路径 {critical_time:.1f} 秒: {' -> '.join(critical_stages)}")
         
         # 打印进度摘要
         summary = progress_manager.get_progress_summary()
         print(f"[AI团队] 项目执行完成！进度：{summary['completed']}/{summary['total']} ({summary['percentage']}%)")
+        llm_cache = get_llm_cache(project_dir)
+        if llm_cache:
+            print(f"[AI团队] LLM响应缓存: {llm_cache.summary()}")
+        print(f"[AI团队] LLM用量: {get_usage_meter(project_dir).summary()}")
+        print(f"[AI团队] LLM请求调度: {get_request_scheduler().summary()}")
+        print(f"[AI团队] LLM调用时限: {get_call_monitor().summary()}")
+        # 状态落盘后回收不再被任何文件引用的大文本（被替换的上下文、重跑前的阶段结果等）
+        get_usage_meter(project_dir).flush()
+        self.context_manager.flush()
+        removed = get_blob_store(project_dir).collect_garbage(project_dir)
+        if removed:
+            print(f"[AI团队] 回收未引用的大文本 {removed} 个")
         
-        return results
+        # 并发阶段完成顺序不固定，结果按阶段声明顺序返回
+        return {stage: results[stage] for stage in progress_manager.stages if stage in results}
 
 # 进度状态管理
 class ProgressManager:
     def __init__(self, project_dir: str):
         self.project_dir = project_dir
         self.progress_file = os.path.join(project_dir, 'progress.json')
+        # 阶段结果和上下文中的长文本存入内容寻址存储，progress.json 只保存引用
+        self.blobs = get_blob_store(project_dir)
+        # 并发阶段同时保存进度，读改写需串行
+        self._lock = threading.Lock()
         self.stages = [
             "requirement_analysis",
             "technical_design", 
@@ -1415,19 +1433,22 @@ class ProgressManager:
         ]
     
     def save_progress(self, stage: str, result: str, context: Optional[Dict] = None):
-        """保存阶段进度"""
-        progress = self.load_progress()
-        progress[stage] = {
-            "status": "completed",
-            "result": result,
-            "timestamp": time.time(),
-            "context": context if context is not None else {}
-        }
-        with open(self.progress_file, 'w', encoding='utf-8') as f:
-            json.dump(progress, f, ensure_ascii=False, indent=2)
+        """保存阶段进度（原子替换，中途崩溃不会损坏已有进度）"""
+        with self._lock:
+            progress = self.load_progress()
+            progress[stage] = {
+                "status": "completed",
+                "result": self.blobs.pack(result),
+                "timestamp": time.time(),
+                "context": self.blobs.pack(context if context is not None else {})
+            }
+            tmp_file = self.progress_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(progress, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.progress_file)
     
     def load_progress(self) -> Dict:
-        """加载进度状态"""
+        """加载进度状态（长文本为引用，需要原文时用 get_stage_result / get_stage_context）"""
         if os.path.exists(self.progress_file):
             try:
                 with open(self.progress_file, 'r', encoding='utf-8') as f:
@@ -1458,13 +1479,32 @@ class ProgressManager:
         """获取阶段结果"""
         progress = self.load_progress()
         if stage in progress:
-            return progress[stage].get("result", "")
+            return self.blobs.unpack(progress[stage].get("result", ""))
         return ""
     
+    def get_stage_context(self, stage: str) -> Dict:
+        """获取阶段保存时的上下文"""
+        progress = self.load_progress()
+        if stage in progress:
+            return self.blobs.unpack(progress[stage].get("context", {}))
+        return {}
+    
+    def invalidate_stage(self, stage: str):
+        """移除阶段的完成记录，下次执行时重新运行"""
+        with self._lock:
+            progress = self.load_progress()
+            if progress.pop(stage, None) is None:
+                return
+            tmp_file = self.progress_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(progress, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.progress_file)
+    
     def reset_progress(self):
-        """重置进度"""
+        """重置进度（包括讨论断点）"""
         if os.path.exists(self.progress_file):
             os.remove(self.progress_file)
+        shutil.rmtree(os.path.join(self.project_dir, CHECKPOINT_DIR), ignore_errors=True)
     
     def get_progress_summary(self) -> Dict:
         """获取进度摘要"""
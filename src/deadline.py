@@ -0,0 +1,196 @@
+import time
+import queue
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from .llm_errors import LLMCallFailed
+
+# 当前阶段的截止时间，由阶段执行设置；讨论发言线程复制上下文后沿用
+_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+# 等待调用结果时检查截止时间和对冲时机的间隔（秒）
+POLL_SECONDS = 0.1
+# 对冲延迟取同一模型最近调用耗时的分位数，样本不足时不对冲
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+class DeadlineExceeded(TimeoutError):
+    """阶段超过截止时间，进行中的LLM调用被取消，后续发言和修正不再执行"""
+
+
+class LLMCallTimeout(LLMCallFailed, TimeoutError):
+    """单次LLM调用超过时限"""
+
+
+class LLMCallCancelled(RuntimeError):
+    """调用已被取消（阶段超时、调用超时或对冲请求已先返回），结果被丢弃；partial_text 为取消前已收到的内容"""
+
+    def __init__(self, message: str = "", partial_text: str = ""):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+
+class Deadline:
+    """截止时间：到期后 check() 抛出 DeadlineExceeded，各检查点据此协作取消"""
+
+    def __init__(self, label: str, seconds: float):
+        self.label = label
+        self.seconds = seconds
+        self.expires_at = time.time() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.time()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, checkpoint: str = "") -> None:
+        if self.expired:
+            raise DeadlineExceeded(f"{self.label}超过时限 {self.seconds:g} 秒"
+                                   f"{f'，在{checkpoint}前取消' if checkpoint else ''}")
+
+
+@contextmanager
+def deadline_scope(label: str, seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """在当前上下文中设置截止时间，seconds 为空或0时不限制；嵌套时取更早的截止时间"""
+    outer = _deadline.get()
+    if not seconds:
+        yield outer
+        return
+    deadline = Deadline(label, seconds)
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+def check_deadline(checkpoint: str = "") -> None:
+    """当前上下文的截止时间已到时抛出 DeadlineExceeded"""
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.check(checkpoint)
+
+def remaining_seconds() -> Optional[float]:
+    """距截止时间的秒数，未设置时返回None"""
+    deadline = _deadline.get()
+    return max(0.0, deadline.remaining()) if deadline is not None else None
+
+
+class CallMonitor:
+    """
+    LLM调用的时限与对冲统计（进程内共享）：
+    - 按模型记录最近 window 次成功调用的耗时（发出请求到返回，不含排队），对冲延迟取其 quantile 分位数
+    - 统计超时、取消、发出对冲和对冲先返回的次数
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW, quantile: float = HEDGE_QUANTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.stats = {"timeout": 0, "cancelled": 0, "hedged": 0, "hedge_won": 0}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """对冲延迟秒数，样本不足时返回None（不对冲）"""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.quantile))]
+
+    def count(self, outcome: str) -> None:
+        if outcome in self.stats:
+            with self._lock:
+                self.stats[outcome] += 1
+
+    def summary(self) -> str:
+        return (f"超时 {self.stats['timeout']} 次，阶段超时取消 {self.stats['cancelled']} 次，"
+                f"对冲 {self.stats['hedged']} 次（对冲先返回 {self.stats['hedge_won']} 次）")
+
+
+def run_call(fn: Callable[[threading.Event, bool], Any], timeout: Optional[float] = None,
+             hedge_delay: Optional[float] = None, deadline: Optional[Deadline] = None) -> Tuple[Any, Dict[str, bool]]:
+    """
+    执行一次LLM调用并限制耗时，返回 (结果, {"hedged": 是否发出对冲, "hedge_won": 是否由对冲请求返回})
+    - fn(cancel, hedge): cancel 置位后应尽快放弃（流式读取会关闭连接），hedge 表示是否为对冲请求
+    - timeout: 单次调用时限，超过时抛出 LLMCallTimeout
+    - deadline: 所属阶段的截止时间，到期时抛出 DeadlineExceeded
+    - hedge_delay: 超过该秒数仍未返回时再发出一个相同请求，取先返回的结果；原请求先失败时不再对冲
+    超时或取消时不等待后台线程结束（非流式调用无法中断，由底层请求超时回收）
+    """
+    cancel = threading.Event()
+    if deadline is not None:
+        deadline.check()
+    if not timeout and deadline is None and hedge_delay is None:
+        return fn(cancel, False), {"hedged": False, "hedge_won": False}
+
+    results: "queue.Queue" = queue.Queue()
+
+    def launch(hedge: bool) -> None:
+        # 后台线程沿用调用方的用量标记和截止时间
+        context = contextvars.copy_context()
+
+        def target():
+            try:
+                results.put((hedge, None, context.run(fn, cancel, hedge)))
+            except BaseException as e:
+                results.put((hedge, e, None))
+
+        threading.Thread(target=target, name="llm-hedge" if hedge else "llm-call", daemon=True).start()
+
+    started = time.time()
+    launch(False)
+    running, hedged = 1, False
+    while True:
+        now = time.time()
+        waits = [POLL_SECONDS]
+        if timeout:
+            waits.append(started + timeout - now)
+        if deadline is not None:
+            waits.append(deadline.remaining())
+        if hedge_delay is not None and not hedged:
+            waits.append(started + hedge_delay - now)
+        try:
+            hedge, error, value = results.get(timeout=max(0.0, min(waits)))
+        except queue.Empty:
+            now = time.time()
+            if deadline is not None and deadline.expired:
+                cancel.set()
+                deadline.check("LLM调用返回")
+            if timeout and now - started >= timeout:
+                cancel.set()
+                raise LLMCallTimeout(f"LLM调用超过 {timeout:g} 秒未返回，已取消")
+            if hedge_delay is not None and not hedged and now - started >= hedge_delay:
+                hedged = True
+                running += 1
+                launch(True)
+            continue
+        running -= 1
+        if error is None:
+            cancel.set()
+            return value, {"hedged": hedged, "hedge_won": hedge}
+        if running == 0:
+            cancel.set()
+            raise error
+        # 另一个请求仍在进行，等待其结果
+
+
+_monitor = CallMonitor()
+
+def get_call_monitor() -> CallMonitor:
+    return _monitor
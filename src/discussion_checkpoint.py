@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .blob_store import get_blob_store
+
+CHECKPOINT_DIR = "checkpoints"
+
+def parse_resume_point(text: str) -> Tuple[str, Optional[int]]:
+    """解析 --resume-from 参数："stage" 或 "stage:round"，返回 (阶段, 轮次或None)"""
+    stage, _, round_text = (text or "").partition(":")
+    if not round_text:
+        return stage, None
+    if not round_text.isdigit() or int(round_text) < 1:
+        raise ValueError(f"无效的轮次 '{round_text}'，应为正整数，如 {stage}:3")
+    return stage, int(round_text)
+
+
+class DiscussionCheckpoint:
+    """
+    多Agent讨论的逐轮断点：<项目目录>/checkpoints/<阶段名>.jsonl
+    - 每个Agent发言完成后立即追加一条 turn 记录，一轮结束后追加 round 记录（含发言异常）
+    - 重新进入讨论时重放已完成的轮次，恢复讨论日志、滚动摘要和共识状态；未完成轮次中已有的发言直接复用
+    - 只记录成功的发言；有发言失败的轮次不视为完成，续跑时从该轮重新开始，只让失败的Agent重新发言
+    - 首行记录讨论指纹（参与角色 + 需求），需求或参与者变化时丢弃旧断点
+    - 长发言存入项目的内容寻址存储，断点中只保存引用，与讨论日志共用一份
+    追加写入，崩溃时最多丢失正在写入的一行，读取时跳过不完整的行
+    """
+
+    def __init__(self, project_dir: str, stage_name: str, fingerprint: str = ""):
+        self.path = os.path.join(project_dir, CHECKPOINT_DIR, f"{stage_name}.jsonl") if project_dir else ""
+        self.stage_name = stage_name
+        self.fingerprint = fingerprint
+        self.blobs = get_blob_store(project_dir) if project_dir else None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_fingerprint(roles: List[str], requirements: str) -> str:
+        payload = json.dumps({"roles": roles, "requirements": requirements}, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+    def _read(self) -> List[Dict[str, Any]]:
+        if not self.path or not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _rewrite(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def load(self) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """
+        返回 (已完成轮次, 未完成轮次中已有的发言)
+        已完成轮次为 [{"round", "turns": {角色: 发言}, "errors": {角色: 异常}}]，按轮次排序
+        """
+        records = self._read()
+        if not records:
+            return [], {}
+        if records[0].get("type") != "header" or records[0].get("fingerprint") != self.fingerprint:
+            print(f"[讨论断点] {self.stage_name} 的需求或参与者已变化，丢弃旧断点")
+            self.reset()
+            return [], {}
+        turns: Dict[int, Dict[str, str]] = {}
+        rounds = []
+        for record in records[1:]:
+            if record.get("type") == "turn":
+                text = self.blobs.unpack(record["text"]) if self.blobs else record["text"]
+                turns.setdefault(record["round"], {})[record["role"]] = text
+            elif record.get("type") == "round":
+                rounds.append({"round": record["round"], "turns": turns.get(record["round"], {}),
+                               "errors": record.get("errors", {})})
+        # 只重放从第1轮开始连续、且没有失败发言的轮次
+        completed = []
+        for expected, entry in enumerate(sorted(rounds, key=lambda r: r["round"]), start=1):
+            if entry["round"] != expected or entry["errors"]:
+                break
+            completed.append(entry)
+        pending_round = len(completed) + 1
+        # 从有失败发言的轮次重新开始：丢弃该轮的完成记录和之后的轮次，保留该轮成功的发言
+        kept = [record for record in records if record.get("type") == "header" or record.get("round", 0) < pending_round
+                or (record.get("type") == "turn" and record["round"] == pending_round)]
+        if len(kept) < len(records):
+            self._rewrite(kept)
+        return completed, turns.get(pending_round, {})
+
+    def start(self) -> None:
+        """没有断点时写入指纹"""
+        if self.path and not os.path.exists(self.path):
+            self._append({"type": "header", "stage": self.stage_name, "fingerprint": self.fingerprint,
+                          "timestamp": time.time()})
+
+    def record_turn(self, round_num: int, role: str, text: str) -> None:
+        if self.blobs:
+            text = self.blobs.pack(text)
+        self._append({"type": "turn", "round": round_num, "role": role, "text": text, "timestamp": time.time()})
+
+    def record_round(self, round_num: int, errors: Optional[Dict[str, str]] = None) -> None:
+        self._append({"type": "round", "round": round_num, "errors": errors or {}, "timestamp": time.time()})
+
+    def truncate(self, from_round: int) -> int:
+        """丢弃第 from_round 轮及之后的记录，返回保留的已完成轮次数"""
+        records = self._read()
+        if not records:
+            return 0
+        kept = [record for record in records if record.get("type") == "header" or record.get("round", 0) < from_round]
+        self._rewrite(kept)
+        return len([record for record in kept if record.get("type") == "round"])
+
+    def completed_rounds(self) -> int:
+        records = self._read()
+        return len([record for record in records[1:] if record.get("type") == "round"])
+
+    def reset(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def list_checkpoints(project_dir: str) -> Dict[str, int]:
+    """项目中各讨论断点已完成的轮次数 {阶段名: 轮次}"""
+    root = os.path.join(project_dir, CHECKPOINT_DIR)
+    if not os.path.isdir(root):
+        return {}
+    return {
+        name[:-len(".jsonl")]: DiscussionCheckpoint(project_dir, name[:-len(".jsonl")]).completed_rounds()
+        for name in sorted(os.listdir(root)) if name.endswith(".jsonl")
+    }
@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional, Tuple
+
+from .context_summarizer import ContextSummarizer
+from .utils.token_utils import count_tokens
+
+class RollingSummary:
+    """
+    多轮讨论的滚动摘要：每轮结束后并入本轮发言，始终控制在固定Token预算内
+    - 抽取式：发言按章节保留开头要点（medium），超预算时较早轮次的发言压缩为一句（short），
+      仍超预算时省略最早的发言；最近一轮始终保留要点
+    - 每条发言各粒度的Token数在并入时计算一次，生成摘要时只做加减，不随轮次重复计数
+    """
+
+    def __init__(self, token_budget: int = 1500, line_chars: int = 100, short_chars: int = 120):
+        self.token_budget = token_budget
+        self.line_chars = line_chars
+        self.short_chars = short_chars
+        self.summarizer = ContextSummarizer(section_lines=1)
+        # (轮次, 角色, {medium, short} 渲染, {medium, short} 该行Token数)
+        self._entries: List[Tuple[int, str, Dict[str, str], Dict[str, int]]] = []
+        # 轮次 -> 轮次标题行的Token数
+        self._header_tokens: Dict[int, int] = {}
+
+    def add_round(self, round_num: int, statements: List[Tuple[str, str]]) -> None:
+        """并入一轮发言，statements 为 (角色, 发言) 列表"""
+        self._header_tokens[round_num] = count_tokens(self._header(round_num) + "\n")
+        for role, text in statements:
+            lines = [self._clip(line, self.line_chars) for line in self.summarizer.render(text)["medium"].split('\n') if line.strip()]
+            medium = " ".join(lines)
+            renderings = {"medium": medium, "short": self._clip(medium, self.short_chars)}
+            tokens = {resolution: count_tokens(self._line(role, rendering) + "\n") for resolution, rendering in renderings.items()}
+            self._entries.append((round_num, role, renderings, tokens))
+
+    def text(self, before_round: Optional[int] = None) -> str:
+        """生成 before_round 之前各轮的摘要（不含该轮及之后）"""
+        entries = [e for e in self._entries if before_round is None or e[0] < before_round]
+        if not entries:
+            return ""
+        # 从最早的发言开始逐条压缩（最近一轮除外），仍超预算时从最早的开始省略
+        latest_round = entries[-1][0]
+        resolutions = ["medium"] * len(entries)
+        body = sum(e[3]["medium"] for e in entries) + sum(self._header_tokens[r] for r in {e[0] for e in entries})
+        for i, entry in enumerate(entries):
+            if body <= self.token_budget or entry[0] == latest_round:
+                break
+            resolutions[i] = "short"
+            body -= entry[3]["medium"] - entry[3]["short"]
+        start, total = 0, body
+        while total > self.token_budget and start < len(entries) - 1:
+            round_num = entries[start][0]
+            body -= entries[start][3][resolutions[start]]
+            if entries[start + 1][0] != round_num:
+                body -= self._header_tokens[round_num]
+            start += 1
+            total = body + count_tokens(self._omitted(round_num) + "\n")
+        return self._render(entries[start:], resolutions[start:], omitted_until=entries[start - 1][0] if start else None)
+
+    @staticmethod
+    def _clip(text: str, limit: int) -> str:
+        text = " ".join(text.split())
+        return text[:limit] + "..." if len(text) > limit else text
+
+    @staticmethod
+    def _header(round_num: int) -> str:
+        return f"第{round_num}轮："
+
+    @staticmethod
+    def _line(role: str, rendering: str) -> str:
+        return f"- {role}: {rendering}"
+
+    @staticmethod
+    def _omitted(round_num: int) -> str:
+        return f"（第{round_num}轮及之前的部分发言已省略）"
+
+    @classmethod
+    def _render(cls, entries: List[Tuple[int, str, Dict[str, str], Dict[str, int]]], resolutions: List[str],
+                omitted_until: Optional[int] = None) -> str:
+        lines = []
+        if omitted_until:
+            lines.append(cls._omitted(omitted_until))
+        current_round = None
+        for (round_num, role, renderings, _), resolution in zip(entries, resolutions):
+            if round_num != current_round:
+                lines.append(cls._header(round_num))
+                current_round = round_num
+            lines.append(cls._line(role, renderings[resolution]))
+        return "\n".join(lines)
@@ -0,0 +1,163 @@
+import os
+import re
+import time
+import random
+import string
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import yaml
+
+from .utils.token_utils import count_tokens
+
+DEFAULT_SCRIPT_FILE = Path(__file__).parent.parent / "config/fake_llm.yaml"
+
+DEFAULT_RESPONSE = (
+    "Thought: 已根据任务要求完成分析\n"
+    "Final Answer: 本地模拟模型的回复。\n\n"
+    "【投票】\n立场: 同意\n共识点: 按当前方案推进\n分歧点: 无\n待澄清: 无"
+)
+
+class ScriptedResponder:
+    """
+    按脚本生成模拟回复：
+    - rules 按顺序用正则匹配任务名（请求 metadata 中的 task_name），第一个命中的规则生效
+    - response 为模板，可用 ${task_name} ${role} ${model} 以及正则中的命名分组
+    - 回复不含 "Final Answer:" 时自动补全为 ReAct 格式
+    - 规则可设置 latency 覆盖默认延迟
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = [dict(rule, pattern=re.compile(rule.get("task", ".*")),
+                           template=string.Template(rule["response"])) for rule in rules]
+        self.hits: Dict[str, int] = {}
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path] = DEFAULT_SCRIPT_FILE) -> "ScriptedResponder":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls((yaml.safe_load(f) or {}).get("rules") or [])
+
+    def __call__(self, params: Dict[str, Any]) -> Union[str, Tuple[str, Optional[float]]]:
+        metadata = params.get("metadata") or {}
+        task_name = metadata.get("task_name", "")
+        for rule in self.rules:
+            match = rule["pattern"].search(task_name)
+            if not match:
+                continue
+            name = rule.get("name", rule["pattern"].pattern)
+            self.hits[name] = self.hits.get(name, 0) + 1
+            text = rule["template"].safe_substitute(
+                task_name=task_name, role=metadata.get("agent_role", ""), model=params.get("model", ""),
+                **{k: v for k, v in match.groupdict().items() if v is not None})
+            if "Final Answer:" not in text:
+                text = f"Thought: 已根据任务要求完成\nFinal Answer: {text}"
+            return text, rule.get("latency")
+        return DEFAULT_RESPONSE, None
+
+
+class FakeRateLimitError(Exception):
+    """模拟服务端返回的 429"""
+    status_code = 429
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("429 Too Many Requests (fake provider)")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+class FakeCompletion:
+    """
+    本地模拟的 completion 接口，参数与 litellm.completion 相同，用于离线测试调度、限流和流式输出：
+    - latency / jitter: 首Token前的延迟秒数及随机抖动
+    - rate_limit_ratio: 按比例抛出 429
+    - tokens_per_second: 流式输出速度，0表示不限速
+    - responder: 按请求参数生成回复文本（或 (文本, 延迟)），默认返回固定的 ReAct 格式回复
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_ratio: float = 0.0,
+                 tokens_per_second: float = 0.0, responder: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 retry_after: Optional[float] = None, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.tokens_per_second = tokens_per_second
+        self.responder = responder
+        self.retry_after = retry_after
+        self.stats = {"calls": 0, "rate_limited": 0, "max_concurrent": 0}
+        self._concurrent = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeCompletion":
+        """
+        - AI_TEAM_FAKE_LATENCY: 首Token延迟秒数，默认0.2
+        - AI_TEAM_FAKE_429_RATE: 429 比例，默认0
+        - AI_TEAM_FAKE_TOKENS_PER_SEC: 流式输出速度，默认0（不限速）
+        - AI_TEAM_FAKE_SCRIPT: 回复脚本，默认 config/fake_llm.yaml
+        """
+        script = os.getenv("AI_TEAM_FAKE_SCRIPT") or (DEFAULT_SCRIPT_FILE if DEFAULT_SCRIPT_FILE.exists() else None)
+        return cls(latency=float(os.getenv("AI_TEAM_FAKE_LATENCY", "0.2")),
+                   rate_limit_ratio=float(os.getenv("AI_TEAM_FAKE_429_RATE", "0")),
+                   tokens_per_second=float(os.getenv("AI_TEAM_FAKE_TOKENS_PER_SEC", "0")),
+                   responder=ScriptedResponder.from_file(script) if script else None)
+
+    def __call__(self, **params) -> Any:
+        with self._lock:
+            self.stats["calls"] += 1
+            throttled = self._random.random() < self.rate_limit_ratio
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            if throttled:
+                self.stats["rate_limited"] += 1
+        if throttled:
+            raise FakeRateLimitError(self.retry_after)
+        text = DEFAULT_RESPONSE
+        if self.responder:
+            reply = self.responder(params)
+            text, rule_latency = reply if isinstance(reply, tuple) else (reply, None)
+            if rule_latency is not None:
+                delay = float(rule_latency)
+        usage = {"prompt_tokens": sum(count_tokens(str(m.get("content", ""))) for m in params.get("messages", [])),
+                 "completion_tokens": count_tokens(text)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if params.get("stream"):
+            return self._stream(text, usage, delay)
+        with self._active():
+            time.sleep(delay)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+    @contextmanager
+    def _active(self):
+        """统计同时进行中的请求数"""
+        with self._lock:
+            self._concurrent += 1
+            self.stats["max_concurrent"] = max(self.stats["max_concurrent"], self._concurrent)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._concurrent -= 1
+
+    def _stream(self, text: str, usage: Dict[str, int], delay: float) -> Iterator[Dict[str, Any]]:
+        with self._active():
+            time.sleep(delay)
+            pieces: List[str] = text.splitlines(keepends=True) or [text]
+            for piece in pieces:
+                if self.tokens_per_second:
+                    time.sleep(count_tokens(piece) / self.tokens_per_second)
+                yield {"choices": [{"delta": {"content": piece}}]}
+            yield {"choices": [{"delta": {}}], "usage": usage}
+
+
+_fake: Optional[FakeCompletion] = None
+_fake_lock = threading.Lock()
+
+def get_fake_completion() -> FakeCompletion:
+    """进程内共享的模拟接口，所有Agent共用，便于统计并发和限流"""
+    global _fake
+    with _fake_lock:
+        if _fake is None:
+            _fake = FakeCompletion.from_env()
+        return _fake
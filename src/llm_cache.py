@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from .llm_errors import LLMCallFailed
+
+# 缓存模式：off 关闭；on 读穿缓存；record 总是调用LLM并写入缓存；replay 只从缓存读取，未命中即报错
+CACHE_MODES = ("off", "on", "record", "replay")
+
+class LLMCacheMiss(LLMCallFailed, RuntimeError):
+    """replay 模式下缓存未命中，回放与录制不一致，任务和阶段都不能继续"""
+
+class LLMResponseCache:
+    """
+    LLM响应的磁盘缓存，按内容寻址：
+    模型、角色设定、任务描述、上下文、工具集合相同的调用直接复用上次的结果。
+    总大小超过 max_bytes 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir: str, mode: str = "on", max_bytes: int = 256 * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"不支持的LLM缓存模式: {mode}，可选 {CACHE_MODES}")
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._total_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(cache_dir) for name in files if name.endswith('.json')
+        ) if os.path.isdir(cache_dir) else 0
+
+    @staticmethod
+    def make_key(model: str, role: str, backstory: str, description: str, expected_output: str,
+                 context: Optional[str], tools: Iterable[str]) -> str:
+        payload = json.dumps({
+            "model": model,
+            "role": role,
+            "backstory": backstory,
+            "description": description,
+            "expected_output": expected_output,
+            "context": context or "",
+            "tools": sorted(tools)
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存；record 模式总是视为未命中，replay 模式未命中时抛出 LLMCacheMiss"""
+        path = self._path(key)
+        with self._lock:
+            if self.mode != "record" and os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        result = json.load(f)["result"]
+                    os.utime(path)  # 记录最近使用时间，用于淘汰
+                    self.stats["hits"] += 1
+                    return result
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"[LLM缓存] 缓存文件损坏，忽略: {e}")
+            self.stats["misses"] += 1
+        if self.mode == "replay":
+            raise LLMCacheMiss(f"replay 模式下未找到缓存: {key}")
+        return None
+
+    def put(self, key: str, result: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        path = self._path(key)
+        data = json.dumps({"result": result, "meta": meta or {}, "created": time.time()}, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += os.path.getsize(path) - old_size
+            self.stats["writes"] += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """按最近使用时间从旧到新删除，直到总大小降到上限的90%"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._total_bytes <= target:
+                break
+            os.remove(path)
+            self._total_bytes -= size
+            self.stats["evictions"] += 1
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return (f"模式 {self.mode}, 命中 {self.stats['hits']}/{lookups} ({self.hit_rate():.0%}), "
+                f"写入 {self.stats['writes']}, 淘汰 {self.stats['evictions']}, "
+                f"占用 {self._total_bytes / 1024 / 1024:.1f} MB")
+
+
+_caches: Dict[str, LLMResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_llm_cache(project_dir: str) -> Optional[LLMResponseCache]:
+    """
+    按环境变量获取缓存实例，未开启时返回None：
+    - AI_TEAM_LLM_CACHE: off / on / record / replay
+    - AI_TEAM_LLM_CACHE_SCOPE: project（<项目目录>/llm_cache，默认）或 global（AI_TEAM_LLM_CACHE_DIR，默认 ~/.cache/ai_team/llm_cache）
+    - AI_TEAM_LLM_CACHE_MAX_MB: 缓存大小上限，默认256
+    """
+    mode = os.getenv("AI_TEAM_LLM_CACHE", "off")
+    if mode == "off":
+        return None
+    if os.getenv("AI_TEAM_LLM_CACHE_SCOPE", "project") == "global" or not project_dir:
+        cache_dir = os.getenv("AI_TEAM_LLM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai_team", "llm_cache"))
+    else:
+        cache_dir = os.path.join(project_dir, "llm_cache")
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None or cache.mode != mode:
+            max_bytes = int(float(os.getenv("AI_TEAM_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+            cache = _caches[cache_dir] = LLMResponseCache(cache_dir, mode=mode, max_bytes=max_bytes)
+        return cache
@@ -0,0 +1,5 @@
+class LLMCallFailed(Exception):
+    """
+    LLM调用失败（超时、流式停滞、限流重试用尽、缓存回放未命中等），本次任务没有可用结果
+    Agent执行任务时不把这类异常转成结果文本，由阶段执行决定重试或暂停，避免失败内容被当作产出保存
+    """
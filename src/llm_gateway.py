@@ -0,0 +1,440 @@
+import os
+import json
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from crewai import BaseLLM
+from crewai.llms.base_llm import llm_call_context
+from pydantic import PrivateAttr
+
+from .utils.token_utils import count_tokens
+from .llm_errors import LLMCallFailed
+from .usage_meter import current_scope, get_usage_meter
+from .model_router import ModelRouter, get_model_router
+from .rate_limiter import LLMRateLimited, get_request_scheduler, queue_timeout, request_priority
+from .deadline import (POLL_SECONDS, DeadlineExceeded, LLMCallCancelled, LLMCallTimeout, current_deadline,
+                       get_call_monitor, run_call)
+
+# 流式输出模式：off 整体返回；log 只写入流式日志；console 同时逐行输出到控制台
+STREAM_MODES = ("off", "log", "console")
+
+# 多个调用并发时串行写入调用记录
+_RECORD_LOCK = threading.Lock()
+
+class LLMStreamStalled(LLMCallFailed, TimeoutError):
+    """流式响应超过空闲阈值没有新内容，已取消生成；已接收的部分输出 partial_text 不作为结果，只计入用量"""
+
+    def __init__(self, message: str = "", partial_text: str = ""):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+
+class LLMStreamInterrupted(LLMCallFailed):
+    """流式响应已输出部分内容后出错中断；partial_text 不作为结果，只计入用量"""
+
+    def __init__(self, message: str = "", partial_text: str = ""):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+
+class StreamSink:
+    """
+    流式输出落点：
+    - 日志：追加写入，缓冲超过 buffer_chars 时落盘，内存占用有上限
+    - 控制台：按行输出并带角色前缀，多个Agent并发输出时不会交错在同一行
+    """
+
+    def __init__(self, label: str, log_path: Optional[str] = None, echo: bool = True,
+                 buffer_chars: int = 4096, line_chars: int = 400):
+        self.label = label
+        self.log_path = log_path
+        self.echo = echo
+        self.buffer_chars = buffer_chars
+        self.line_chars = line_chars
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._line = ""
+        if log_path:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            self._append(f"\n===== [{time.strftime('%Y-%m-%d %H:%M:%S')}] {label} =====\n")
+
+    def write(self, chunk: str) -> None:
+        if self.log_path:
+            self._buffer.append(chunk)
+            self._buffered += len(chunk)
+            if self._buffered >= self.buffer_chars:
+                self._flush_log()
+        if self.echo:
+            self._line += chunk
+            while '\n' in self._line or len(self._line) >= self.line_chars:
+                cut = self._line.find('\n')
+                line, self._line = (self._line[:cut], self._line[cut + 1:]) if cut >= 0 else \
+                    (self._line[:self.line_chars], self._line[self.line_chars:])
+                print(f"[{self.label}] {line}", flush=True)
+
+    def close(self, footer: str = "") -> None:
+        if self.echo and self._line:
+            print(f"[{self.label}] {self._line}", flush=True)
+            self._line = ""
+        if self.log_path:
+            if footer:
+                self._buffer.append(f"\n----- {footer} -----\n")
+            self._flush_log()
+
+    def _flush_log(self) -> None:
+        if self._buffer:
+            self._append("".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def _append(self, text: str) -> None:
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(text)
+
+
+def _chunk_text(chunk: Any) -> Optional[str]:
+    """从流式chunk中取出增量文本，兼容litellm对象和dict"""
+    choices = chunk.get("choices") if isinstance(chunk, dict) else getattr(chunk, "choices", None)
+    if not choices:
+        return None
+    choice = choices[0]
+    delta = choice.get("delta") if isinstance(choice, dict) else getattr(choice, "delta", None)
+    if delta is None:
+        return None
+    return delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+
+def _chunk_usage(chunk: Any) -> Optional[Dict[str, int]]:
+    usage = chunk.get("usage") if isinstance(chunk, dict) else getattr(chunk, "usage", None)
+    if usage is None:
+        return None
+    if not isinstance(usage, dict):
+        usage = {k: getattr(usage, k, 0) for k in ("prompt_tokens", "completion_tokens", "total_tokens")}
+    return usage if usage.get("completion_tokens") else None
+
+def _close_stream(stream: Any) -> None:
+    """尽量关闭底层连接，让读取线程尽快退出"""
+    for target in (getattr(stream, "completion_stream", None), stream):
+        close = getattr(target, "close", None)
+        if callable(close):
+            try:
+                close()
+                return
+            except Exception:
+                pass
+
+def consume_stream(stream: Iterable[Any], sink: Optional[StreamSink] = None,
+                   idle_timeout: Optional[float] = None, started: Optional[float] = None,
+                   cancel: Optional[threading.Event] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    读取流式响应，返回 (完整文本, 统计)
+    读取在后台线程进行，超过 idle_timeout 秒没有新chunk时关闭连接并抛出 LLMStreamStalled
+    cancel 置位时（调用超时、阶段超时或对冲请求已先返回）关闭连接并抛出 LLMCallCancelled
+    已输出部分内容后出错时抛出 LLMStreamInterrupted；以上异常都带有已接收的部分文本 partial_text
+    统计包括首Token延迟 ttft（从 started 即发出请求时算起）、总耗时、chunk数和服务端返回的 usage
+    """
+    started = started or time.time()
+    chunks: "queue.Queue" = queue.Queue()
+    done = object()
+    cancelled = threading.Event()
+
+    def pump():
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                chunks.put(chunk)
+        except BaseException as e:
+            chunks.put(e)
+        finally:
+            chunks.put(done)
+
+    threading.Thread(target=pump, name="llm-stream", daemon=True).start()
+    parts: List[str] = []
+    stats: Dict[str, Any] = {"ttft": None, "chunks": 0, "usage": None}
+    last_chunk = time.time()
+    while True:
+        wait = idle_timeout
+        if cancel is not None:
+            # 分段等待，及时响应取消
+            idle_left = None if idle_timeout is None else idle_timeout - (time.time() - last_chunk)
+            wait = POLL_SECONDS if idle_left is None else max(0.0, min(POLL_SECONDS, idle_left))
+        try:
+            item = chunks.get(timeout=wait)
+        except queue.Empty:
+            if cancel is not None and cancel.is_set():
+                cancelled.set()
+                _close_stream(stream)
+                raise LLMCallCancelled(f"流式响应已取消（已接收{len(''.join(parts))}字符）", "".join(parts))
+            if cancel is not None and (idle_timeout is None or time.time() - last_chunk < idle_timeout):
+                continue
+            cancelled.set()
+            _close_stream(stream)
+            stats["duration"] = time.time() - started
+            raise LLMStreamStalled(f"流式响应超过{idle_timeout}秒无新内容，已取消（已接收{len(''.join(parts))}字符）",
+                                   "".join(parts))
+        last_chunk = time.time()
+        if item is done:
+            break
+        if isinstance(item, BaseException):
+            if parts:
+                raise LLMStreamInterrupted(f"流式响应中断: {item}（已接收{len(''.join(parts))}字符）",
+                                           "".join(parts)) from item
+            raise item
+        usage = _chunk_usage(item)
+        if usage:
+            stats["usage"] = usage
+        text = _chunk_text(item)
+        if not text:
+            continue
+        if stats["ttft"] is None:
+            stats["ttft"] = time.time() - started
+        stats["chunks"] += 1
+        parts.append(text)
+        if sink:
+            sink.write(text)
+    stats["duration"] = time.time() - started
+    return "".join(parts), stats
+
+
+class GatewayLLM(BaseLLM):
+    """
+    所有Agent的LLM调用入口：通过litellm调用模型，支持流式输出
+    - 流式时增量写入 <项目目录>/streams/<角色>.log，console 模式同时逐行打印
+    - 记录每次调用的首Token延迟、生成速度和费用，追加到 <项目目录>/llm_calls.jsonl，并计入项目用量
+    - 流式响应空闲超过 idle_timeout 秒即取消
+    - 配置了模型路由时，按任务名切换模型档位（讨论发言用便宜模型，共识文档和代码生成用强模型）
+    - 请求经进程内共享的调度器按模型限额和优先级排队，被限流时退避重试
+    - 单次调用超过 call_timeout 秒即取消；所属阶段到达截止时间时，进行中的调用被取消；排队等待同样受这两个时限约束
+    - 开启 hedge 时，调用超过同模型最近耗时的p95仍未返回则再发一个相同请求（单独排队占用名额），取先返回的结果；
+      后返回或被取消的请求同样计入用量
+    - 服务端已开始生成的失败调用（流式停滞、中途出错、超时或取消）按 prompt 和已收到的部分输出计入用量；
+      限流等未开始生成就返回的错误不计费，也不计入
+    不声明 function calling 能力，工具调用走 crewai 的 ReAct 文本协议
+    """
+
+    llm_type: str = "gateway"
+    stream_mode: str = "console"
+    idle_timeout: Optional[float] = 60.0
+    call_timeout: Optional[float] = None
+    hedge: bool = False
+    _completion_fn: Any = PrivateAttr(default=None)
+    _router: Optional[ModelRouter] = PrivateAttr(default=None)
+
+    def route(self, task_name: str) -> Dict[str, Any]:
+        """本次任务实际使用的模型及覆盖参数"""
+        route = self._router.route(task_name) if self._router else None
+        return route or {"rule": None, "model": self.model}
+
+    def model_for(self, task_name: str) -> str:
+        return self.route(task_name)["model"]
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None):
+        # 开始、完成和失败事件共用同一个 call_id
+        with llm_call_context():
+            return self._call(messages, from_task, from_agent)
+
+    def _call(self, messages, from_task=None, from_agent=None):
+        formatted = self._format_messages(messages)
+        role = getattr(from_agent, "role", "") or "LLM"
+        task_name = getattr(from_task, "name", "") or ""
+        project_dir = getattr(from_agent, "_project_dir", "") or ""
+        streaming = self.stream_mode != "off"
+        self._emit_call_started_event(messages=formatted, from_task=from_task, from_agent=from_agent, stream=streaming)
+
+        route = self.route(task_name)
+        params = self._completion_params(formatted, streaming, route)
+        # litellm 只用于回调日志，不发送给模型；本地模拟接口据此按任务匹配回复
+        params["metadata"] = {"task_name": task_name, "agent_role": role}
+        record = {"model": route["model"], "route": route["rule"], "role": role, "task": task_name,
+                  "stream": streaming, **current_scope(),
+                  "prompt_tokens": sum(count_tokens(str(m.get("content", ""))) for m in formatted)}
+        started = time.time()
+        record["started"] = round(started, 3)
+        sink = None
+        monitor = get_call_monitor()
+        deadline = current_deadline()
+        hedge_delay = monitor.hedge_delay(route["model"]) if self.hedge else None
+
+        scheduler = get_request_scheduler()
+        # 预留 prompt + 最大输出的Token额度，完成后按实际用量退回
+        reserved = record["prompt_tokens"] + int(params.get("max_tokens") or 1024)
+        priority = request_priority(task_name, record.get("stage"))
+        winner: List[bool] = []
+        winner_lock = threading.Lock()
+
+        def meter_discarded(text: str, usage: Optional[Dict[str, Any]], requested: float) -> None:
+            # 被丢弃的请求（对冲中后返回的一方、超时或取消后才结束的请求、停滞或中途出错的流式请求）服务端同样计费
+            if project_dir:
+                get_usage_meter(project_dir).record(
+                    route["model"], role, (usage or {}).get("prompt_tokens") or record["prompt_tokens"],
+                    (usage or {}).get("completion_tokens") or count_tokens(text), time.time() - requested)
+
+        def request(cancel: threading.Event, hedge: bool, requested: float):
+            try:
+                if streaming:
+                    # 对冲请求不写流式日志，先返回时再补写完整内容
+                    text, stats = consume_stream(self._completion(params), None if hedge else sink,
+                                                 self.idle_timeout, started=requested, cancel=cancel)
+                    usage, ttft = stats["usage"], stats["ttft"]
+                else:
+                    response = self._completion(params)
+                    usage, ttft = getattr(response, "usage", None), None
+                    if usage is not None and not isinstance(usage, dict):
+                        usage = usage.model_dump()
+                    text = response.choices[0].message.content or ""
+            except (LLMCallCancelled, LLMStreamStalled, LLMStreamInterrupted) as e:
+                meter_discarded(e.partial_text, None, requested)
+                raise
+            with winner_lock:
+                won = not winner and not cancel.is_set()
+                if won:
+                    winner.append(hedge)
+            if not won:
+                meter_discarded(text, usage, requested)
+                raise LLMCallCancelled("另一请求已先返回或调用已取消，结果丢弃")
+            return text, usage, ttft
+
+        def send(cancel: threading.Event, hedge: bool, requested: float):
+            if not hedge:
+                return request(cancel, False, requested)
+            # 对冲请求单独排队，与其他请求一样占用并发名额和令牌桶
+            scheduler.acquire(route["model"], reserved, priority, queue_timeout(self.call_timeout, deadline), cancel)
+            result = None
+            try:
+                result = request(cancel, True, time.time())
+                return result
+            finally:
+                scheduler.release(route["model"], reserved, (result[1] or {}).get("total_tokens") if result else None)
+
+        def attempt():
+            requested = time.time()
+            record["queue_wait"] = round(requested - started, 3)
+            result, outcome = run_call(lambda cancel, hedge: send(cancel, hedge, requested),
+                                       self.call_timeout, hedge_delay, deadline)
+            monitor.observe(route["model"], time.time() - requested)
+            if outcome["hedged"]:
+                record.update(hedged=True, hedge_won=outcome["hedge_won"], hedge_delay=round(hedge_delay, 3))
+                monitor.count("hedged")
+                if outcome["hedge_won"]:
+                    monitor.count("hedge_won")
+                    if sink:
+                        sink.write(f"\n[对冲请求先返回]\n{result[0]}")
+            return result
+
+        try:
+            if deadline is not None:
+                deadline.check(f"{role}的LLM调用")
+            if streaming:
+                log_path = os.path.join(project_dir, "streams", f"{role}.log") if project_dir else None
+                sink = StreamSink(f"{role}", log_path=log_path, echo=self.stream_mode == "console")
+            text, usage, ttft = scheduler.run(
+                attempt, route["model"], reserved, priority,
+                used_tokens=lambda result: (result[1] or {}).get("total_tokens"),
+                timeout=self.call_timeout, deadline=deadline)
+            if streaming:
+                record["ttft"] = round(ttft, 3) if ttft is not None else None
+        except Exception as e:
+            status = ("stalled" if isinstance(e, LLMStreamStalled) else "rate_limited" if isinstance(e, LLMRateLimited)
+                      else "timeout" if isinstance(e, LLMCallTimeout) else "cancelled" if isinstance(e, DeadlineExceeded)
+                      else "error")
+            monitor.count(status)
+            record.update(status=status, error=str(e), duration=round(time.time() - started, 3))
+            if sink:
+                sink.close(f"{record['status']}: {e}")
+            _append_call_record(project_dir, record)
+            self._emit_call_failed_event(error=str(e), from_task=from_task, from_agent=from_agent)
+            raise
+
+        duration = time.time() - started
+        completion_tokens = (usage or {}).get("completion_tokens") or count_tokens(text)
+        if usage:
+            record["prompt_tokens"] = usage.get("prompt_tokens") or record["prompt_tokens"]
+        generation_time = duration - record["queue_wait"] - (record.get("ttft") or 0)
+        record.update(status="ok", duration=round(duration, 3), completion_tokens=completion_tokens,
+                      tokens_per_sec=round(completion_tokens / generation_time, 1) if generation_time > 0 else None)
+        if sink:
+            sink.close(f"ttft {record['ttft']}s, {record['tokens_per_sec']} tokens/s")
+        if streaming:
+            print(f"[LLM流式] {role} {task_name} 首Token {record['ttft']}s，{record['tokens_per_sec']} tokens/s，共 {completion_tokens} tokens")
+        if project_dir:
+            record["cost"] = get_usage_meter(project_dir).record(route["model"], role, record["prompt_tokens"],
+                                                                 completion_tokens, duration)
+        _append_call_record(project_dir, record)
+        self._track_token_usage_internal({"prompt_tokens": record["prompt_tokens"], "completion_tokens": completion_tokens,
+                                          "total_tokens": record["prompt_tokens"] + completion_tokens})
+        text = self._apply_stop_words(text)
+        self._emit_call_completed_event(response=text, call_type=_llm_call_type(), from_task=from_task,
+                                        from_agent=from_agent, messages=formatted)
+        return text
+
+    def _completion_params(self, messages: List[Dict[str, Any]], streaming: bool,
+                           route: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        route = route or {}
+        params = {
+            "model": route.get("model", self.model),
+            "messages": messages,
+            "temperature": route.get("temperature", self.temperature),
+            "max_tokens": route.get("max_tokens", self.max_tokens),
+            "stop": self.stop or None,
+            "api_key": self.api_key,
+            "base_url": self.base_url,
+            # 路由到的模型可能不支持部分参数（如o系列的temperature），由litellm丢弃
+            "drop_params": True,
+            # 非流式调用无法从外部中断，由底层请求超时回收被放弃的连接
+            "timeout": self.call_timeout,
+            **self.additional_params
+        }
+        if streaming:
+            params.update(stream=True, stream_options={"include_usage": True})
+        return {k: v for k, v in params.items() if v is not None}
+
+    def _completion(self, params: Dict[str, Any]) -> Any:
+        if self._completion_fn is None:
+            from litellm import completion
+            self._completion_fn = completion
+        return self._completion_fn(**params)
+
+
+def _llm_call_type():
+    from crewai.events.types.llm_events import LLMCallType
+    return LLMCallType.LLM_CALL
+
+def _append_call_record(project_dir: str, record: Dict[str, Any]) -> None:
+    if not project_dir:
+        return
+    record = {"timestamp": time.time(), **record}
+    try:
+        with _RECORD_LOCK:
+            os.makedirs(project_dir, exist_ok=True)
+            with open(os.path.join(project_dir, "llm_calls.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[LLM网关] 写入调用记录失败: {e}")
+
+def build_llm(model: str, role_key: Optional[str] = None, **kwargs) -> GatewayLLM:
+    """
+    按环境变量创建网关LLM：
+    - AI_TEAM_LLM_STREAM: off / log / console（默认）
+    - AI_TEAM_LLM_IDLE_TIMEOUT: 流式响应空闲超时秒数，默认60，0表示不限制
+    - AI_TEAM_LLM_CALL_TIMEOUT: 单次调用时限秒数，默认300，0表示不限制
+    - AI_TEAM_LLM_HEDGE: on 时对慢于同模型p95的调用发出对冲请求，默认off
+    - AI_TEAM_LLM_PROVIDER: 设为 fake 时使用本地模拟接口，不访问真实服务
+    开启模型路由时，使用 role_key 对应角色的 temperature 和 max_tokens，模型按任务名由路由规则切换
+    """
+    stream_mode = os.getenv("AI_TEAM_LLM_STREAM", "console")
+    if stream_mode not in STREAM_MODES:
+        raise ValueError(f"不支持的流式输出模式: {stream_mode}，可选 {STREAM_MODES}")
+    idle_timeout = float(os.getenv("AI_TEAM_LLM_IDLE_TIMEOUT", "60")) or None
+    call_timeout = float(os.getenv("AI_TEAM_LLM_CALL_TIMEOUT", "300")) or None
+    hedge = os.getenv("AI_TEAM_LLM_HEDGE", "off") == "on"
+    router = get_model_router()
+    settings = router.settings_for_role(role_key, model) if router else {"model": model}
+    llm = GatewayLLM(stream_mode=stream_mode, idle_timeout=idle_timeout, call_timeout=call_timeout, hedge=hedge, **{**settings, **kwargs})
+    llm._router = router
+    if os.getenv("AI_TEAM_LLM_PROVIDER") == "fake":
+        from .fake_provider import get_fake_completion
+        llm._completion_fn = get_fake_completion()
+    return llm
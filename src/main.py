@@ -12,7 +12,9 @@ from typing import Optional
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.crew import AiTeamCrew, ProgressManager
+from src.crew import AiTeamCrew, ProgressManager, STAGE_SPECS
+from src.discussion_checkpoint import DiscussionCheckpoint, list_checkpoints, parse_resume_point
+from src.batch_runner import format_summary, load_manifest, run_batch
 
 # 自动加载.env环境变量
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../.env'))
@@ -68,11 +70,12 @@ def update_project_index(project_id, project_name, requirements):
 
 app = typer.Typer()
 
-@app.command()
+@app.callback(invoke_without_command=True)
 def main(
-    project_name: str = typer.Option(..., "--project-name", "-p", help="项目名称"),
-    requirements: str = typer.Option(..., "--requirements", "-r", help="项目需求描述"),
-    resume_from: Optional[str] = typer.Option(None, "--resume-from", help="从指定阶段继续执行"),
+    ctx: typer.Context,
+    project_name: Optional[str] = typer.Option(None, "--project-name", "-p", help="项目名称"),
+    requirements: Optional[str] = typer.Option(None, "--requirements", "-r", help="项目需求描述"),
+    resume_from: Optional[str] = typer.Option(None, "--resume-from", help="从指定阶段继续执行，讨论阶段可用 阶段:轮次 从第N轮继续"),
     show_progress: bool = typer.Option(False, "--show-progress", help="显示项目进度"),
     reset_progress: bool = typer.Option(False, "--reset-progress", help="重置项目进度")
 ):
@@ -81,13 +84,22 @@ def main(
     
     支持断点续传功能：
     - 使用 --resume-from <阶段名> 从指定阶段继续
+    - 使用 --resume-from <阶段名>:<轮次> 从讨论阶段的第N轮重新讨论（如 technical_design:3）
+    - 讨论中断后直接重新运行，会从最后完成的发言继续
     - 使用 --show-progress 查看当前进度
     - 使用 --reset-progress 重置进度重新开始
     
     可用阶段：requirement_analysis, technical_design, ui_design, 
     frontend_development, frontend_code, backend_development, backend_code,
     data_analysis, testing, deployment, documentation, acceptance, auto_execution
+    
+    批量执行多个项目使用 batch 子命令
     """
+    if ctx.invoked_subcommand:
+        return
+    if not project_name:
+        print("错误：缺少 --project-name，批量执行请使用 batch 子命令")
+        raise typer.Exit(1)
     
     # 设置项目目录
     project_dir = os.path.join("projects", project_name)
@@ -112,6 +124,12 @@ def main(
                 if data.get("status") == "completed":
                     timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(data.get("timestamp", 0)))
                     print(f"✓ {stage}: {timestamp}")
+        
+        checkpoints = list_checkpoints(project_dir)
+        if checkpoints:
+            print(f"\n=== 讨论断点 ===")
+            for stage_name, rounds in checkpoints.items():
+                print(f"{stage_name}: 已完成 {rounds} 轮")
         return
     
     # 重置进度
@@ -122,23 +140,37 @@ def main(
     
     # 检查是否从指定阶段继续
     if resume_from:
-        if resume_from not in progress_manager.stages:
-            print(f"错误：无效的阶段名 '{resume_from}'")
+        try:
+            resume_stage, resume_round = parse_resume_point(resume_from)
+        except ValueError as e:
+            print(f"错误：{e}")
+            return
+        if resume_stage not in progress_manager.stages:
+            print(f"错误：无效的阶段名 '{resume_stage}'")
             print(f"可用阶段：{', '.join(progress_manager.stages)}")
             return
         
-        if not progress_manager.is_stage_completed(resume_from):
-            print(f"错误：阶段 '{resume_from}' 尚未完成，无法从此处继续")
+        if resume_round:
+            discussion = STAGE_SPECS[resume_stage].get("discussion")
+            if not discussion:
+                print(f"错误：阶段 '{resume_stage}' 不是讨论阶段，不能按轮次继续")
+                return
+            completed_rounds = DiscussionCheckpoint(project_dir, discussion).completed_rounds()
+            if completed_rounds < resume_round - 1:
+                print(f"错误：阶段 '{resume_stage}' 的讨论断点只有 {completed_rounds} 轮，无法从第{resume_round}轮继续")
+                return
+        elif not progress_manager.is_stage_completed(resume_stage):
+            print(f"错误：阶段 '{resume_stage}' 尚未完成，无法从此处继续")
             return
     
+    if not requirements:
+        print("错误：缺少 --requirements")
+        raise typer.Exit(1)
+    
     try:
         # 初始化AI团队
         crew = AiTeamCrew(project_dir=project_dir)
         
-        # 设置项目目录到所有Agent
-        for agent in crew.crew.agents:
-            agent._project_dir = project_dir
-        
         # 启动项目
         inputs = {
             "project_name": project_name,
@@ -161,5 +193,37 @@ def main(
     
     return 0
 
+@app.command()
+def batch(
+    manifest: str = typer.Argument(..., help="批量清单文件（YAML/JSON），每项包含 project_name 和 requirements"),
+    workers: int = typer.Option(int(os.getenv("AI_TEAM_BATCH_WORKERS", "4")), "--workers", "-w", help="同时执行的项目数"),
+    summary_file: Optional[str] = typer.Option(None, "--summary", help="汇总文件路径，默认 projects/batch_summary_<时间>.json")
+):
+    """
+    批量执行清单中的项目：每个项目在独立进程中运行，所有进程共享同一个LLM请求调度器，
+    单个项目的输出写入 logs/<项目名>.log，结束后输出每个项目的状态、耗时、Tokens和费用汇总
+    """
+    try:
+        projects = load_manifest(manifest)
+    except (OSError, ValueError) as e:
+        print(f"错误：读取清单失败：{e}")
+        raise typer.Exit(1)
+    print(f"[批量执行] 共 {len(projects)} 个项目，并发 {workers}，日志目录: {LOGS_ROOT}")
+    
+    def on_result(result):
+        print(f"[批量执行] {result['project_name']}: {result['status']}"
+              f"{'，' + result['error'] if result.get('error') else ''}")
+    
+    summary = run_batch(projects, workers, "projects", LOGS_ROOT, on_result=on_result)
+    summary_file = summary_file or os.path.join("projects", f"batch_summary_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(summary_file)), exist_ok=True)
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"\n=== 批量执行汇总 ===")
+    print(format_summary(summary))
+    print(f"[批量执行] 汇总已保存: {summary_file}")
+    if summary["totals"]["failed"]:
+        raise typer.Exit(1)
+
 if __name__ == "__main__":
     app() 
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+MODELS_CONFIG_FILE = Path(__file__).parent.parent / "config/models.yaml"
+ROLES_CONFIG_FILE = Path(__file__).parent.parent / "config/role_knowledge_base.yaml"
+
+def _load_yaml(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"[模型路由] 读取配置失败 {path}: {e}")
+        return {}
+
+
+class ModelRouter:
+    """
+    按角色和任务选择模型：
+    - 角色的 temperature、max_tokens 取自 role_knowledge_base.yaml 的 model_config
+    - models.yaml 的 routing.rules 按任务名匹配档位（tiers），讨论发言用便宜模型，只有共识文档和代码生成用强模型
+    - 未匹配规则的任务沿用统一模型（OPENAI_MODEL）；角色的 default_model 比统一模型贵，不参与路由
+    """
+
+    def __init__(self, tiers: Dict[str, str], rules: List[Dict[str, Any]],
+                 role_settings: Dict[str, Dict[str, Any]], defaults: Optional[Dict[str, Any]] = None):
+        self.tiers = tiers
+        self.rules = [dict(rule, pattern=re.compile(rule["task_pattern"])) for rule in rules]
+        self.role_settings = role_settings
+        self.defaults = defaults or {}
+
+    @classmethod
+    def from_config(cls, models_path: Path = MODELS_CONFIG_FILE, roles_path: Path = ROLES_CONFIG_FILE,
+                    enabled: Optional[bool] = None) -> Optional["ModelRouter"]:
+        """读取配置，未开启路由时返回None；enabled 不为空时覆盖 routing.enabled"""
+        models_config = _load_yaml(models_path)
+        routing = models_config.get("routing") or {}
+        if not (routing.get("enabled", False) if enabled is None else enabled):
+            return None
+        role_settings = {}
+        for key, spec in (_load_yaml(roles_path).get("roles") or {}).items():
+            role_settings[key] = dict(spec.get("model_config") or {})
+        return cls(routing.get("tiers") or {}, routing.get("rules") or [], role_settings,
+                   models_config.get("defaults"))
+
+    def settings_for_role(self, role_key: Optional[str], fallback_model: str) -> Dict[str, Any]:
+        """角色的模型参数（temperature、max_tokens），模型固定为 fallback_model，按任务切换由 route 决定"""
+        settings = dict(self.role_settings.get(role_key or "", {}))
+        settings["model"] = fallback_model
+        return settings
+
+    def route(self, task_name: str) -> Optional[Dict[str, Any]]:
+        """按任务名匹配规则，返回 {rule, model, 其他覆盖参数}；未匹配返回None"""
+        for rule in self.rules:
+            if task_name and rule["pattern"].search(task_name):
+                model = self.tiers.get(rule.get("tier"), rule.get("model"))
+                if not model:
+                    continue
+                overrides = {k: rule[k] for k in ("temperature", "max_tokens") if k in rule}
+                return {"rule": rule.get("name", rule["task_pattern"]), "model": model, **overrides}
+        return None
+
+
+_router: Optional[ModelRouter] = None
+_router_loaded = False
+_router_lock = threading.Lock()
+
+def get_model_router() -> Optional[ModelRouter]:
+    """
+    获取全局路由器，默认按 models.yaml 的 routing.enabled（默认开启，关闭时所有调用使用 OPENAI_MODEL）；
+    环境变量 AI_TEAM_MODEL_ROUTING=on / off 覆盖配置
+    """
+    global _router, _router_loaded
+    setting = os.getenv("AI_TEAM_MODEL_ROUTING", "")
+    if setting == "off":
+        return None
+    with _router_lock:
+        if not _router_loaded:
+            _router = ModelRouter.from_config(enabled=True if setting == "on" else None)
+            _router_loaded = True
+        return _router
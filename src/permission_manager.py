@@ -3,17 +3,28 @@
 本地RBAC+ABAC权限管理模块
 - 支持用户、角色、资源、操作、优先级判定
 - 权限表本地json存储，便于扩展
+- 支持角色继承和用户组，加载时预编译为传递闭包表，判定只需一次索引查找
 """
 import json
+import argparse
+from collections import deque
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 
 PERMISSION_FILE = Path(__file__).parent.parent / "config/permissions.json"
+ROLE_HIERARCHY_FILE = Path(__file__).parent.parent / "config/role_hierarchy.json"
+
+# (resource_type, resource_id, action) -> (allow, 来源说明)
+PermissionKey = Tuple[str, str, str]
+PermissionTable = Dict[PermissionKey, Tuple[bool, str]]
 
 class PermissionManager:
-    def __init__(self, permission_file: Path = PERMISSION_FILE):
+    def __init__(self, permission_file: Path = PERMISSION_FILE, hierarchy_file: Path = ROLE_HIERARCHY_FILE):
         self.permission_file = permission_file
+        self.hierarchy_file = hierarchy_file
         self.permissions = self._load_permissions()
+        self.hierarchy = self._load_hierarchy()
+        self._compile()
 
     def _load_permissions(self) -> List[Dict]:
         if self.permission_file.exists():
@@ -21,13 +32,21 @@ class PermissionManager:
                 return json.load(f)
         return []
 
+    def _load_hierarchy(self) -> Dict:
+        """加载角色继承和用户组定义，文件不存在时视为无继承关系"""
+        if self.hierarchy_file.exists():
+            with open(self.hierarchy_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {"roles": data.get("roles", {}), "groups": data.get("groups", {})}
+        return {"roles": {}, "groups": {}}
+
     def save_permissions(self):
         with open(self.permission_file, "w", encoding="utf-8") as f:
             json.dump(self.permissions, f, ensure_ascii=False, indent=2)
 
-    def add_permission(self, user_id: Optional[str], role: Optional[str], resource_type: str, resource_id: str, action: str, allow: bool, note: str = ""):
-        """添加权限，user_id/role 二选一，allow=True为允许，False为拒绝"""
-        self.permissions.append({
+    def add_permission(self, user_id: Optional[str], role: Optional[str], resource_type: str, resource_id: str, action: str, allow: bool, note: str = "", group: Optional[str] = None):
+        """添加权限，user_id/role/group 三选一，allow=True为允许，False为拒绝"""
+        entry = {
             "user_id": user_id,
             "role": role,
             "resource_type": resource_type,
@@ -35,26 +54,117 @@ class PermissionManager:
             "action": action,
             "allow": allow,
             "note": note
-        })
+        }
+        if group:
+            entry["group"] = group
+        self.permissions.append(entry)
         self.save_permissions()
+        self._compile()
+
+    def _compile(self):
+        """
+        把权限表、角色继承和用户组编译为有效权限闭包表：
+        - 角色表：角色自身权限 + 所有祖先（被继承）角色权限，距离越近优先级越高
+        - 用户表：个人特批 + 所在组（含父组）的权限 + 组绑定角色的有效权限
+        同一层级内沿用权限表中的先后顺序，先出现者生效
+        """
+        direct: Dict[str, Dict[str, PermissionTable]] = {"user": {}, "role": {}, "group": {}}
+        for p in self.permissions:
+            key = (p["resource_type"], p["resource_id"], p["action"])
+            for kind, subject in (("user", p.get("user_id")), ("role", p.get("role")), ("group", p.get("group"))):
+                if subject:
+                    table = direct[kind].setdefault(subject, {})
+                    if key not in table:
+                        table[key] = (p["allow"], f"{kind}:{subject}")
+
+        role_defs = self.hierarchy["roles"]
+        group_defs = self.hierarchy["groups"]
+
+        # 1. 角色闭包：广度优先展开继承链，天然按距离排序并防止环
+        self._role_closure: Dict[str, List[str]] = {}
+        all_roles = set(role_defs) | set(direct["role"])
+        for role in all_roles:
+            self._role_closure[role] = self._expand(role, lambda r: role_defs.get(r, {}).get("inherits", []))
+
+        self._role_table: Dict[str, PermissionTable] = {}
+        for role, closure in self._role_closure.items():
+            table: PermissionTable = {}
+            for ancestor in closure:
+                for key, value in direct["role"].get(ancestor, {}).items():
+                    table.setdefault(key, value)
+            self._role_table[role] = table
+
+        # 2. 用户组闭包：用户 -> 直接所属组 -> 父组
+        user_groups: Dict[str, List[str]] = {}
+        for group, group_def in group_defs.items():
+            for member in group_def.get("members", []):
+                user_groups.setdefault(member, []).append(group)
+        self._user_groups: Dict[str, List[str]] = {}
+        for user, groups in user_groups.items():
+            closure: List[str] = []
+            for group in groups:
+                for g in self._expand(group, lambda name: group_defs.get(name, {}).get("inherits", [])):
+                    if g not in closure:
+                        closure.append(g)
+            self._user_groups[user] = closure
+
+        self._user_table: Dict[str, PermissionTable] = {}
+        for user in set(direct["user"]) | set(self._user_groups):
+            table = dict(direct["user"].get(user, {}))
+            for group in self._user_groups.get(user, []):
+                for key, value in direct["group"].get(group, {}).items():
+                    table.setdefault(key, value)
+                for role in group_defs.get(group, {}).get("roles", []):
+                    for key, value in self._role_table.get(role, {}).items():
+                        table.setdefault(key, value)
+            self._user_table[user] = table
+
+    @staticmethod
+    def _expand(start: str, parents) -> List[str]:
+        """广度优先展开继承关系，返回包含自身在内按距离排序的闭包"""
+        seen = [start]
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for parent in parents(node):
+                if parent not in seen:
+                    seen.append(parent)
+                    queue.append(parent)
+        return seen
 
     def has_permission(self, user_id: str, role: str, resource_type: str, resource_id: str, action: str) -> bool:
         """
         权限判定优先级：
-        1. 个人特批（user_id）
-        2. 角色权限（role）
+        1. 个人特批（user_id）及所在用户组
+        2. 角色权限（role，含继承的角色）
         3. 默认拒绝
         """
-        # 1. 查个人权限
-        for p in self.permissions:
-            if p["user_id"] == user_id and p["resource_type"] == resource_type and p["resource_id"] == resource_id and p["action"] == action:
-                return p["allow"]
-        # 2. 查角色权限
-        for p in self.permissions:
-            if p["role"] == role and p["resource_type"] == resource_type and p["resource_id"] == resource_id and p["action"] == action:
-                return p["allow"]
-        # 3. 默认拒绝
-        return False
+        key = (resource_type, resource_id, action)
+        hit = self._user_table.get(user_id, {}).get(key)
+        if hit is None:
+            hit = self._role_table.get(role, {}).get(key)
+        return hit[0] if hit is not None else False
+
+    def get_effective_permissions(self, user_id: Optional[str] = None, role: Optional[str] = None) -> List[Dict]:
+        """一次性列出某用户/角色的全部有效权限（含继承和用户组），并标注生效来源"""
+        merged: PermissionTable = dict(self._user_table.get(user_id, {})) if user_id else {}
+        if role:
+            for key, value in self._role_table.get(role, {}).items():
+                merged.setdefault(key, value)
+        return [
+            {
+                "resource_type": resource_type,
+                "resource_id": resource_id,
+                "action": action,
+                "allow": allow,
+                "source": source
+            }
+            for (resource_type, resource_id, action), (allow, source) in merged.items()
+        ]
+
+    def get_role_closure(self, role: str) -> List[str]:
+        """返回角色自身及其继承的全部角色"""
+        return list(self._role_closure.get(role, [role]))
 
     def list_permissions(self, user_id: Optional[str] = None, role: Optional[str] = None) -> List[Dict]:
         """列出某用户或角色的所有权限"""
@@ -66,15 +176,31 @@ class PermissionManager:
 
 # 示例用法
 if __name__ == "__main__":
-    pm = PermissionManager()
-    # 添加角色权限
-    pm.add_permission(user_id=None, role="boss", resource_type="doc", resource_id="d123", action="read", allow=True, note="boss可读d123")
-    pm.add_permission(user_id=None, role="dev", resource_type="doc", resource_id="d123", action="read", allow=False, note="dev禁止读d123")
-    # 添加个人特批
-    pm.add_permission(user_id="u001", role=None, resource_type="doc", resource_id="d123", action="read", allow=True, note="u001特批可读d123")
-    # 权限判定
-    print("u001 boss:", pm.has_permission("u001", "boss", "doc", "d123", "read"))  # True（个人特批）
-    print("u002 dev:", pm.has_permission("u002", "dev", "doc", "d123", "read"))    # False（角色禁止）
-    print("u003 boss:", pm.has_permission("u003", "boss", "doc", "d123", "read"))  # True（角色允许）
-    print("u004 dev:", pm.has_permission("u004", "dev", "doc", "d123", "read"))    # False（角色禁止）
-    print("u005 pm:", pm.has_permission("u005", "pm", "doc", "d123", "read"))      # False（无权限） 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="权限管理工具")
+    parser.add_argument("--user-id", help="查询该用户的有效权限")
+    parser.add_argument("--role", help="查询该角色的有效权限")
+    parser.add_argument("--permission-file", type=Path, default=PERMISSION_FILE, help="权限表文件")
+    parser.add_argument("--hierarchy-file", type=Path, default=ROLE_HIERARCHY_FILE, help="角色继承和用户组定义文件")
+    args = parser.parse_args()
+
+    if args.user_id or args.role:
+        # 有效权限报告：python src/permission_manager.py --user-id u001 --role boss
+        pm = PermissionManager(args.permission_file, args.hierarchy_file)
+        if args.role:
+            print(f"角色继承链: {' -> '.join(pm.get_role_closure(args.role))}")
+        for p in pm.get_effective_permissions(user_id=args.user_id, role=args.role):
+            flag = "允许" if p["allow"] else "拒绝"
+            print(f"{p['resource_type']}/{p['resource_id']} {p['action']}: {flag} (来源 {p['source']})")
+    else:
+        pm = PermissionManager(args.permission_file, args.hierarchy_file)
+        # 添加角色权限
+        pm.add_permission(user_id=None, role="boss", resource_type="doc", resource_id="d123", action="read", allow=True, note="boss可读d123")
+        pm.add_permission(user_id=None, role="dev", resource_type="doc", resource_id="d123", action="read", allow=False, note="dev禁止读d123")
+        # 添加个人特批
+        pm.add_permission(user_id="u001", role=None, resource_type="doc", resource_id="d123", action="read", allow=True, note="u001特批可读d123")
+        # 权限判定
+        print("u001 boss:", pm.has_permission("u001", "boss", "doc", "d123", "read"))  # True（个人特批）
+        print("u002 dev:", pm.has_permission("u002", "dev", "doc", "d123", "read"))    # False（角色禁止）
+        print("u003 boss:", pm.has_permission("u003", "boss", "doc", "d123", "read"))  # True（角色允许）
+        print("u004 dev:", pm.has_permission("u004", "dev", "doc", "d123", "read"))    # False（角色禁止）
+        print("u005 pm:", pm.has_permission("u005", "pm", "doc", "d123", "read"))      # False（无权限）
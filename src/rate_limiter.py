@@ -0,0 +1,322 @@
+import os
+import re
+import time
+import heapq
+import random
+import itertools
+import threading
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import yaml
+
+from .llm_errors import LLMCallFailed
+from .deadline import POLL_SECONDS, Deadline, LLMCallCancelled, LLMCallTimeout
+
+MODELS_CONFIG_FILE = Path(__file__).parent.parent / "config/models.yaml"
+
+# 请求优先级，数值越小越先执行
+PRIORITY_CONSENSUS = 0
+PRIORITY_CRITICAL = 1
+PRIORITY_NORMAL = 2
+# 关键阶段：后续阶段都依赖它们的结果
+CRITICAL_STAGES = ("requirement_analysis", "technical_design", "acceptance")
+
+_LIMIT_PATTERN = re.compile(r'([\d.]+)\s*([KkMm]?)\s*(RPM|TPM)', re.IGNORECASE)
+
+class LLMRateLimited(LLMCallFailed, RuntimeError):
+    """限流重试次数用尽"""
+
+def request_priority(task_name: str, stage: Optional[str] = None) -> int:
+    if task_name and task_name.endswith("_consensus"):
+        return PRIORITY_CONSENSUS
+    if stage in CRITICAL_STAGES:
+        return PRIORITY_CRITICAL
+    return PRIORITY_NORMAL
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """只按HTTP状态码和异常类型（litellm / openai 的 RateLimitError）判断，不匹配错误文本，避免把内容中的"429"误判为限流"""
+    if type(error).__name__ == "RateLimitError":
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+def queue_timeout(timeout: Optional[float], deadline: Optional[Deadline]) -> Optional[float]:
+    """排队等待的时限：单次调用时限与阶段剩余时间中较小者，都未设置时返回None"""
+    limits = [limit for limit in (timeout, deadline.remaining() if deadline is not None else None) if limit is not None]
+    return max(0.0, min(limits)) if limits else None
+
+def parse_rate_limit(text: str) -> Dict[str, float]:
+    """解析 "1000 RPM" / "1000 RPM, 200K TPM" 形式的限额，返回 {"rpm": .., "tpm": ..}"""
+    limits = {}
+    for number, unit, kind in _LIMIT_PATTERN.findall(text or ""):
+        scale = {"k": 1e3, "m": 1e6}.get(unit.lower(), 1)
+        limits[kind.lower()] = float(number) * scale
+    return limits
+
+def load_rate_limits(config_path: Path = MODELS_CONFIG_FILE) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            models = (yaml.safe_load(f) or {}).get("models") or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"[LLM限流] 读取模型限额失败: {e}")
+        return {}
+    return {name: parse_rate_limit(str(spec.get("rate_limit", ""))) for name, spec in models.items() if isinstance(spec, dict)}
+
+
+class TokenBucket:
+    """令牌桶：容量为一分钟的限额，按秒匀速补充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """取出 amount 还需等待的秒数，0表示可以立即取出"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RequestScheduler:
+    """
+    进程内所有LLM请求的调度器：
+    - 每个模型按 RPM / TPM 维护令牌桶，进程内同时进行的请求数不超过 max_in_flight
+    - 每个模型一个等待队列，按优先级排队（共识文档、关键阶段优先），同优先级先到先得；
+      有空闲名额时交给令牌桶已就绪的队首中优先级最高的请求，一个模型被限额卡住不影响其他模型
+    - 被限流（429）时按指数退避加随机抖动重试
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, max_in_flight: int = 8,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.limits = limits or {}
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "queued": 0, "wait_seconds": 0.0}
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        # 模型 -> 等待中的请求堆 [(优先级, 序号, Token数)]
+        self._waiting: Dict[str, list] = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _bucket(self, model: str, kind: str) -> Optional[TokenBucket]:
+        key = (model, kind)
+        if key not in self._buckets:
+            limits = self.limits.get(model) or self.limits.get(model.split('/')[-1]) or {}
+            self._buckets[key] = TokenBucket(limits[kind]) if limits.get(kind) else None
+        return self._buckets[key]
+
+    def waiting_count(self) -> int:
+        with self._cond:
+            return sum(len(waiting) for waiting in self._waiting.values())
+
+    def _bucket_wait(self, model: str, tokens: int) -> float:
+        buckets = [(self._bucket(model, "rpm"), 1), (self._bucket(model, "tpm"), tokens)]
+        return max([bucket.wait_time(amount) for bucket, amount in buckets if bucket] or [0.0])
+
+    def _next_ticket(self) -> Tuple[Optional[Tuple[int, int, int]], Optional[float]]:
+        """令牌桶已就绪的各模型队首中优先级最高的请求，以及其余队首最早就绪还需等待的秒数"""
+        best, soonest = None, None
+        for model, waiting in self._waiting.items():
+            head = waiting[0]
+            wait = self._bucket_wait(model, head[2])
+            if wait == 0:
+                best = head if best is None or head < best else best
+            else:
+                soonest = wait if soonest is None else min(soonest, wait)
+        return best, soonest
+
+    def acquire(self, model: str, tokens: int, priority: int, timeout: Optional[float] = None,
+                cancel: Optional[threading.Event] = None) -> None:
+        """
+        按优先级排队，直到有空闲并发名额且令牌桶足够
+        排队超过 timeout 秒抛出 LLMCallTimeout，cancel 置位时抛出 LLMCallCancelled，两种情况都不占用名额
+        """
+        ticket = (priority, next(self._sequence), tokens)
+        begin = time.monotonic()
+        with self._cond:
+            if self._waiting or self.in_flight >= self.max_in_flight:
+                self.stats["queued"] += 1
+            heapq.heappush(self._waiting.setdefault(model, []), ticket)
+            while True:
+                if cancel is not None and cancel.is_set():
+                    self._leave_queue(model, ticket)
+                    raise LLMCallCancelled(f"{model} 请求在排队时被取消")
+                wait = None
+                if self.in_flight < self.max_in_flight:
+                    best, wait = self._next_ticket()
+                    if best == ticket:
+                        for bucket, amount in ((self._bucket(model, "rpm"), 1), (self._bucket(model, "tpm"), tokens)):
+                            if bucket:
+                                bucket.take(amount)
+                        self._leave_queue(model, ticket)
+                        self.in_flight += 1
+                        self.stats["requests"] += 1
+                        self.stats["wait_seconds"] += time.monotonic() - begin
+                        return
+                    if best is not None:
+                        # 其他请求正在取得名额，之后会唤醒
+                        wait = None
+                if timeout is not None:
+                    left = begin + timeout - time.monotonic()
+                    if left <= 0:
+                        self._leave_queue(model, ticket)
+                        raise LLMCallTimeout(f"{model} 排队超过 {timeout:g} 秒仍未获得请求名额")
+                    wait = left if wait is None else min(wait, left)
+                if cancel is not None:
+                    # 取消不会唤醒条件变量，分段等待以便及时退出
+                    wait = POLL_SECONDS if wait is None else min(wait, POLL_SECONDS)
+                self._cond.wait(timeout=wait)
+
+    def _leave_queue(self, model: str, ticket: Tuple[int, int, int]) -> None:
+        waiting = self._waiting[model]
+        waiting.remove(ticket)
+        heapq.heapify(waiting)
+        if not waiting:
+            del self._waiting[model]
+        self._cond.notify_all()
+
+    def release(self, model: str, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        """归还并发名额，退回多预留的Token"""
+        with self._cond:
+            self.in_flight -= 1
+            bucket = self._bucket(model, "tpm")
+            if bucket and used_tokens is not None and used_tokens < reserved_tokens:
+                bucket.refund(reserved_tokens - used_tokens)
+            self._cond.notify_all()
+
+    def run(self, fn: Callable[[], Any], model: str, tokens: int = 0, priority: int = PRIORITY_NORMAL,
+            used_tokens: Optional[Callable[[Any], int]] = None, timeout: Optional[float] = None,
+            deadline: Optional[Deadline] = None) -> Any:
+        """
+        按限额执行一次请求，被限流时退避重试；used_tokens 从结果中取实际Token数，多预留的部分退回令牌桶
+        每次排队等待不超过 timeout 秒和阶段截止时间 deadline，分别抛出 LLMCallTimeout 和 DeadlineExceeded
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.acquire(model, tokens, priority, queue_timeout(timeout, deadline))
+            except LLMCallTimeout:
+                if deadline is not None:
+                    deadline.check("LLM请求排队")
+                raise
+            result, used = None, None
+            try:
+                result = fn()
+                used = used_tokens(result) if used_tokens else None
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                error = e
+            finally:
+                self.release(model, tokens, used)
+            with self._cond:
+                self.stats["throttled"] += 1
+            if attempt == self.max_retries:
+                break
+            delay = self._retry_after(error) or random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            print(f"[LLM限流] {model} 被限流，{delay:.1f}秒后第{attempt + 1}次重试: {error}")
+            with self._cond:
+                self.stats["retries"] += 1
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline.remaining()))
+            time.sleep(delay)
+        # 在 except 块外抛出，避免外层按异常链再次当作限流重试
+        raise LLMRateLimited(f"{model} 限流重试{self.max_retries}次后仍失败")
+
+    @staticmethod
+    def _retry_after(error: BaseException) -> Optional[float]:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            return float(headers.get("retry-after")) if headers.get("retry-after") else None
+        except (TypeError, ValueError):
+            return None
+
+    def summary(self) -> str:
+        return (f"请求 {self.stats['requests']} 次，排队 {self.stats['queued']} 次，"
+                f"累计等待 {self.stats['wait_seconds']:.1f} 秒，被限流 {self.stats['throttled']} 次，重试 {self.stats['retries']} 次")
+
+
+class SharedRequestScheduler(RequestScheduler):
+    """
+    批量运行时工作进程使用的调度器：排队、并发名额和令牌桶由主进程托管的共享调度器统一管理，
+    所有工作进程合计不超过模型限额；限流重试和统计在本进程进行
+    """
+
+    def __init__(self, remote: Any, **kwargs):
+        super().__init__(**kwargs)
+        self.remote = remote
+
+    def acquire(self, model: str, tokens: int, priority: int, timeout: Optional[float] = None,
+                cancel: Optional[threading.Event] = None) -> None:
+        # 取消信号无法跨进程传递，拿到名额后再检查
+        begin = time.monotonic()
+        self.remote.acquire(model, tokens, priority, timeout)
+        if cancel is not None and cancel.is_set():
+            self.remote.release(model, tokens, 0)
+            raise LLMCallCancelled(f"{model} 请求在排队时被取消")
+        with self._cond:
+            self.in_flight += 1
+            self.stats["requests"] += 1
+            self.stats["wait_seconds"] += time.monotonic() - begin
+
+    def release(self, model: str, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        with self._cond:
+            self.in_flight -= 1
+        self.remote.release(model, reserved_tokens, used_tokens)
+
+
+class SchedulerManager(BaseManager):
+    """在独立进程中托管共享调度器，工作进程通过代理排队"""
+
+def _serve_scheduler() -> RequestScheduler:
+    return get_request_scheduler()
+
+SchedulerManager.register("scheduler", callable=_serve_scheduler)
+
+def start_shared_scheduler(ctx: Any = None) -> SchedulerManager:
+    """启动托管进程，返回的 manager.address 交给工作进程的 connect_shared_scheduler"""
+    manager = SchedulerManager(ctx=ctx)
+    manager.start()
+    return manager
+
+def connect_shared_scheduler(address: Any, authkey: bytes) -> None:
+    """工作进程初始化：本进程的LLM请求改由共享调度器排队"""
+    global _scheduler
+    manager = SchedulerManager(address=address, authkey=authkey)
+    manager.connect()
+    with _scheduler_lock:
+        _scheduler = SharedRequestScheduler(manager.scheduler())
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_request_scheduler() -> RequestScheduler:
+    """
+    进程内共享的请求调度器：
+    - 限额取自 models.yaml 的 rate_limit（如 "1000 RPM, 200K TPM"）
+    - AI_TEAM_LLM_MAX_IN_FLIGHT: 进程内同时进行的LLM请求数上限，默认8
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(load_rate_limits(), max_in_flight=int(os.getenv("AI_TEAM_LLM_MAX_IN_FLIGHT", "8")))
+        return _scheduler
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+class StageGraph:
+    """
+    阶段依赖图调度：按拓扑顺序执行阶段，依赖都完成的阶段并发执行
+    - 依赖中不在图内的阶段（如 initial）视为已满足
+    - 同时就绪的阶段按声明顺序提交，保证调度顺序稳定
+    - 某个阶段失败后不再提交新阶段，等待已运行的阶段结束后抛出该异常
+    """
+
+    def __init__(self, dependencies: Dict[str, List[str]]):
+        self.dependencies = {
+            stage: [dep for dep in deps if dep in dependencies and dep != stage]
+            for stage, deps in dependencies.items()
+        }
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        pending = {stage: set(deps) for stage, deps in self.dependencies.items()}
+        order: List[str] = []
+        while pending:
+            ready = [stage for stage, deps in pending.items() if not deps]
+            if not ready:
+                raise ValueError(f"阶段依赖存在环: {sorted(pending)}")
+            for stage in ready:
+                order.append(stage)
+                del pending[stage]
+            for deps in pending.values():
+                deps.difference_update(ready)
+        return order
+
+    def critical_path(self, durations: Dict[str, float]) -> Tuple[float, List[str]]:
+        """按各阶段耗时计算关键路径，返回 (总耗时, 阶段列表)"""
+        finish: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+        for stage in self.order:
+            deps = self.dependencies[stage]
+            before = max(deps, key=lambda d: finish[d]) if deps else None
+            finish[stage] = (finish[before] if before else 0.0) + durations.get(stage, 0.0)
+            previous[stage] = before
+        if not finish:
+            return 0.0, []
+        stage = max(finish, key=finish.get)
+        path = []
+        while stage:
+            path.append(stage)
+            stage = previous[stage]
+        return finish[path[0]], list(reversed(path))
+
+    def run(self, run_stage: Callable[[str], None], max_workers: int = 3) -> List[str]:
+        """执行全部阶段，返回完成顺序"""
+        remaining = {stage: set(deps) for stage, deps in self.dependencies.items()}
+        completed: List[str] = []
+        failure: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="stage") as executor:
+            running = {}
+
+            def submit_ready():
+                for stage in self.order:
+                    if stage in remaining and not remaining[stage]:
+                        del remaining[stage]
+                        running[executor.submit(run_stage, stage)] = stage
+
+            submit_ready()
+            while running:
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        print(f"[阶段调度] 阶段 {stage} 执行失败: {error}")
+                        failure = failure or error
+                        continue
+                    completed.append(stage)
+                    for deps in remaining.values():
+                        deps.discard(stage)
+                if failure is None:
+                    submit_ready()
+
+        if failure is not None:
+            raise failure
+        return completed
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import atexit
+import weakref
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import yaml
+
+MODELS_CONFIG_FILE = Path(__file__).parent.parent / "config/models.yaml"
+
+# 当前调用所属的阶段和讨论轮次，由阶段执行和讨论发言设置
+_usage_scope: contextvars.ContextVar = contextvars.ContextVar("usage_scope", default={})
+
+class BudgetExceeded(RuntimeError):
+    """项目花费达到预算硬上限"""
+
+def load_model_prices(config_path: Path = MODELS_CONFIG_FILE) -> Dict[str, Dict[str, float]]:
+    """读取 models.yaml 中每个模型每1k tokens的输入/输出价格"""
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"[用量统计] 读取模型价格失败: {e}")
+        return {}
+    return {
+        name: {"input": float(spec["price_per_1k_tokens"].get("input", 0)),
+               "output": float(spec["price_per_1k_tokens"].get("output", 0))}
+        for name, spec in (config.get("models") or {}).items()
+        if isinstance(spec, dict) and spec.get("price_per_1k_tokens")
+    }
+
+@contextmanager
+def usage_scope(**scope):
+    """在当前上下文中标记调用所属的 stage / round，嵌套时合并"""
+    token = _usage_scope.set({**_usage_scope.get(), **scope})
+    try:
+        yield
+    finally:
+        _usage_scope.reset(token)
+
+def current_scope() -> Dict[str, Any]:
+    return _usage_scope.get()
+
+# 进程退出时需要落盘的计量器；弱引用不延长实例生命周期，整个进程只注册一次退出回调
+_live_meters: "weakref.WeakSet[UsageMeter]" = weakref.WeakSet()
+
+@atexit.register
+def _flush_live_meters() -> None:
+    for meter in list(_live_meters):
+        try:
+            meter.flush(create_dir=False)
+        except Exception as e:
+            print(f"[用量统计] 退出时保存用量失败: {e}")
+
+def _empty_bucket() -> Dict[str, float]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "latency": 0.0}
+
+
+class UsageMeter:
+    """
+    LLM用量计量：记录每次调用的Token、耗时、模型和费用，按Agent、阶段、讨论轮次、模型和项目汇总
+    - 汇总写入 <项目目录>/usage.json（与 progress.json 同目录），重跑时在已有用量上累加
+    - 距上次写盘不足 flush_interval 秒的记录合并到一次写盘（后台定时写入），阶段流程结束和进程退出时调用 flush
+    - soft_budget: 达到后讨论缩短；hard_budget: 达到后在下一个检查点暂停（单位与价格表一致，美元）
+    """
+
+    def __init__(self, project_dir: str, prices: Optional[Dict[str, Dict[str, float]]] = None,
+                 soft_budget: Optional[float] = None, hard_budget: Optional[float] = None,
+                 flush_interval: float = 2.0):
+        self.project_dir = project_dir
+        self.usage_file = os.path.join(project_dir, 'usage.json')
+        self.prices = load_model_prices() if prices is None else prices
+        self.soft_budget = soft_budget
+        self.hard_budget = hard_budget
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unpriced = set()
+        self._dirty = False
+        self._last_save = float("-inf")
+        self._timer: Optional[threading.Timer] = None
+        self.usage = self._load()
+        _live_meters.add(self)
+
+    def _load(self) -> Dict[str, Any]:
+        usage = {"project": _empty_bucket(), "by_agent": {}, "by_stage": {}, "by_round": {}, "by_model": {}}
+        if os.path.exists(self.usage_file):
+            try:
+                with open(self.usage_file, 'r', encoding='utf-8') as f:
+                    usage.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"[用量统计] 用量文件损坏，重新统计: {e}")
+        return usage
+
+    def _price(self, model: str) -> Optional[Dict[str, float]]:
+        price = self.prices.get(model) or self.prices.get(model.split('/')[-1])
+        if price is None and model not in self._unpriced:
+            self._unpriced.add(model)
+            print(f"[用量统计] 模型 {model} 不在价格表中，费用按0计算")
+        return price
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self._price(model)
+        if not price:
+            return 0.0
+        return (prompt_tokens * price["input"] + completion_tokens * price["output"]) / 1000
+
+    def record(self, model: str, role: str, prompt_tokens: int, completion_tokens: int, latency: float,
+               stage: Optional[str] = None, round_num: Any = None) -> float:
+        """记录一次调用，stage / round_num 未指定时取当前 usage_scope，返回本次费用"""
+        scope = current_scope()
+        stage = stage or scope.get("stage")
+        round_num = round_num if round_num is not None else scope.get("round")
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        buckets = [("project", None), ("by_agent", role), ("by_model", model)]
+        if stage:
+            buckets.append(("by_stage", stage))
+            if round_num is not None:
+                buckets.append(("by_round", f"{stage}#{round_num}"))
+        with self._lock:
+            for group, key in buckets:
+                if key is None:
+                    bucket = self.usage[group]
+                else:
+                    bucket = self.usage[group].setdefault(key, _empty_bucket())
+                bucket["calls"] += 1
+                bucket["prompt_tokens"] += prompt_tokens
+                bucket["completion_tokens"] += completion_tokens
+                bucket["cost"] += cost
+                bucket["latency"] += latency
+            self._dirty = True
+            wait = self._last_save + self.flush_interval - time.monotonic()
+            if wait > 0 and self._timer is None:
+                self._timer = threading.Timer(wait, self.flush, kwargs={"create_dir": False})
+                self._timer.daemon = True
+                self._timer.start()
+        if wait <= 0:
+            self.flush()
+        return cost
+
+    def flush(self, create_dir: bool = True) -> None:
+        """
+        把未落盘的用量写入 usage.json；序列化在锁内完成，写文件不阻塞并发的 record
+        后台定时和退出时以 create_dir=False 调用，项目目录已被删除时不再重建
+        """
+        with self._save_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._last_save = time.monotonic()
+                data = json.dumps(self.usage, ensure_ascii=False)
+            if not self.project_dir or not (create_dir or os.path.isdir(self.project_dir)):
+                return
+            os.makedirs(self.project_dir, exist_ok=True)
+            tmp_file = f"{self.usage_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_file, self.usage_file)
+
+    @property
+    def total_cost(self) -> float:
+        return self.usage["project"]["cost"]
+
+    def budget_state(self) -> str:
+        """ok / soft / hard"""
+        if self.hard_budget is not None and self.total_cost >= self.hard_budget:
+            return "hard"
+        if self.soft_budget is not None and self.total_cost >= self.soft_budget:
+            return "soft"
+        return "ok"
+
+    def check(self, checkpoint: str) -> None:
+        """检查点：达到硬上限时抛出 BudgetExceeded"""
+        if self.budget_state() == "hard":
+            raise BudgetExceeded(f"项目花费 ${self.total_cost:.4f} 已达到预算硬上限 ${self.hard_budget}，在 {checkpoint} 前暂停")
+
+    def summary(self) -> str:
+        project = self.usage["project"]
+        text = (f"调用 {project['calls']} 次，输入 {project['prompt_tokens']} tokens，"
+                f"输出 {project['completion_tokens']} tokens，费用 ${project['cost']:.4f}")
+        if self.hard_budget is not None or self.soft_budget is not None:
+            text += f"（软上限 {self.soft_budget}，硬上限 {self.hard_budget}）"
+        return text
+
+
+_meters: Dict[str, UsageMeter] = {}
+_meters_lock = threading.Lock()
+
+def get_usage_meter(project_dir: str) -> UsageMeter:
+    """
+    获取项目的用量计量器，预算由环境变量设置（美元，不设置表示不限制）：
+    - AI_TEAM_BUDGET_SOFT: 达到后讨论最多进行 2 轮
+    - AI_TEAM_BUDGET_HARD: 达到后在下一个阶段或讨论轮次开始前暂停
+    """
+    key = os.path.abspath(project_dir) if project_dir else ""
+    with _meters_lock:
+        meter = _meters.get(key)
+        if meter is None:
+            soft = os.getenv("AI_TEAM_BUDGET_SOFT")
+            hard = os.getenv("AI_TEAM_BUDGET_HARD")
+            meter = _meters[key] = UsageMeter(project_dir, soft_budget=float(soft) if soft else None,
+                                              hard_budget=float(hard) if hard else None)
+        return meter
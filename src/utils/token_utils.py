@@ -0,0 +1,37 @@
+import os
+import re
+from typing import Optional
+
+# 默认使用 gpt-4o / gpt-4.1 系列的BPE编码，可通过环境变量切换
+TOKENIZER_ENCODING = os.getenv("AI_TEAM_TOKENIZER", "o200k_base")
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """加载本地BPE分词器，只尝试一次；离线且无缓存时返回None"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            print(f"[Token计数] 分词器 {TOKENIZER_ENCODING} 不可用，使用估算: {e}")
+            _encoding = None
+    return _encoding
+
+def estimate_tokens(text: str) -> int:
+    """无分词器时的估算：中文字符约1个Token，其余约4个字符1个Token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def count_tokens(text: Optional[str]) -> int:
+    """计算文本的Token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
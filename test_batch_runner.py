@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+批量执行测试脚本
+验证清单解析，以及多个工作进程经共享调度器排队时合计并发不超过上限
+"""
+
+import os
+import sys
+import time
+import shutil
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.batch_runner import load_manifest
+from src.rate_limiter import connect_shared_scheduler, get_request_scheduler, start_shared_scheduler
+
+def test_load_manifest():
+    """测试清单支持列表和 {"projects": [...]} 两种格式，缺字段或重名时报错"""
+    manifest_dir = "test_batch_manifest"
+    try:
+        os.makedirs(manifest_dir, exist_ok=True)
+        path = os.path.join(manifest_dir, "batch.yaml")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("projects:\n  - project_name: 请假审批\n    requirements: 员工请假审批小程序\n"
+                    "  - project_name: 图书管理\n    requirements: 图书借阅管理\n")
+        assert [p["project_name"] for p in load_manifest(path)] == ["请假审批", "图书管理"]
+
+        path = os.path.join(manifest_dir, "batch.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[{"project_name": "商城", "requirements": "在线商城"}, {"project_name": "商城", "requirements": "重复"}]')
+        try:
+            load_manifest(path)
+            assert False, "重名项目应报错"
+        except ValueError as e:
+            assert "重复" in str(e)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[{"project_name": "商城"}]')
+        try:
+            load_manifest(path)
+            assert False, "缺少需求应报错"
+        except ValueError as e:
+            assert "第1项" in str(e)
+    finally:
+        shutil.rmtree(manifest_dir, ignore_errors=True)
+
+def _hold_request(seconds: float) -> float:
+    """工作进程中经共享调度器执行一个耗时请求，返回本进程的请求数"""
+    scheduler = get_request_scheduler()
+    scheduler.run(lambda: time.sleep(seconds), "fake-model")
+    return scheduler.stats["requests"]
+
+def test_shared_scheduler_across_processes():
+    """测试两个工作进程共享调度器：共享并发上限为1时，4个请求串行执行"""
+    ctx = multiprocessing.get_context("spawn")
+    os.environ["AI_TEAM_LLM_MAX_IN_FLIGHT"] = "1"
+    try:
+        manager = start_shared_scheduler(ctx)
+    finally:
+        del os.environ["AI_TEAM_LLM_MAX_IN_FLIGHT"]
+    try:
+        authkey = bytes(multiprocessing.current_process().authkey)
+        with ProcessPoolExecutor(max_workers=2, mp_context=ctx, initializer=connect_shared_scheduler,
+                                 initargs=(manager.address, authkey)) as pool:
+            # 先让两个工作进程完成启动，再计时
+            list(pool.map(_hold_request, [0, 0]))
+            begin = time.time()
+            list(pool.map(_hold_request, [0.2] * 4))
+            elapsed = time.time() - begin
+        assert elapsed >= 0.8, elapsed
+        assert "请求 6 次" in manager.scheduler().summary()
+    finally:
+        manager.shutdown()
+
+if __name__ == "__main__":
+    test_load_manifest()
+    test_shared_scheduler_across_processes()
+    print("批量执行测试通过")
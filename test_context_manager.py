@@ -124,5 +124,330 @@ def test_context_manager():
     print(f"\n=== 测试完成 ===")
     print(f"智能上下文管理器显著减少了Token使用，平均节省 {((total_old_size - total_new_size) / total_old_size * 100):.1f}% 的Token消耗！")
 
+def test_hash_index_on_replace():
+    """测试哈希索引在替换同名key和清理过期项时保持一致"""
+    import shutil
+    test_project_dir = "test_context_index_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir)
+        context_manager.add_context("design", "方案A", ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        old_hash = context_manager.context_items["design"].hash
+        
+        # 重复内容被跳过
+        context_manager.add_context("design", "方案A", ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        assert len(context_manager.context_items) == 1
+        
+        # 替换同名key后旧哈希失效，旧内容可以重新写入
+        context_manager.add_context("design", "方案B", ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        assert old_hash not in context_manager._hash_index
+        assert context_manager._hash_index[context_manager.context_items["design"].hash] == "design"
+        context_manager.add_context("design", "方案A", ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        assert context_manager.context_items["design"].value == "方案A"
+        
+        # 重新加载后索引从持久化数据重建
+        context_manager.flush()
+        reloaded = SmartContextManager(test_project_dir)
+        assert set(reloaded._hash_index.values()) == {"design"}
+        
+        # 清理过期项时同步移除索引
+        reloaded.context_items["design"].timestamp = 0
+        reloaded.cleanup_old_context(max_age_hours=1)
+        assert not reloaded._hash_index
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_journal_replay_after_crash():
+    """测试追加日志在未压缩、末行写坏的情况下仍能恢复已落盘的变更"""
+    import shutil
+    test_project_dir = "test_context_journal_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir, journal_flush_items=2)
+        for i in range(5):
+            context_manager.add_context(f"item_{i}", f"内容{i}", ContextPriority.MEDIUM, ContextType.IMPLEMENTATION, "testing")
+        # 前4条已按批次写入日志，第5条仍在缓冲区，模拟进程崩溃前写了半行
+        assert not os.path.exists(context_manager.snapshot_file)
+        with open(context_manager.journal_file, 'a', encoding='utf-8') as f:
+            f.write('{"op": "put", "item": {"key": "tor')
+        
+        recovered = SmartContextManager(test_project_dir)
+        assert sorted(recovered.context_items) == [f"item_{i}" for i in range(4)]
+        
+        # 写坏的半行已截掉，之后追加的变更不会拼接到坏行上
+        for i in (4, 5):
+            recovered.add_context(f"item_{i}", f"内容{i}", ContextPriority.MEDIUM, ContextType.IMPLEMENTATION, "testing")
+            recovered.flush()
+        assert not os.path.exists(recovered.snapshot_file)
+        assert len(SmartContextManager(test_project_dir).context_items) == 6
+        
+        # 压缩后快照包含全部数据，日志被清空
+        recovered._save_persistent_context()
+        assert os.path.getsize(recovered.journal_file) == 0
+        assert len(SmartContextManager(test_project_dir).context_items) == 6
+        
+        # 退出时的落盘登记不持有管理器，实例用完即可回收
+        import gc
+        import weakref
+        ref = weakref.ref(recovered)
+        del recovered
+        gc.collect()
+        assert ref() is None
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_versioned_cache_invalidation():
+    """测试缓存只在所依赖的阶段/类型变更时失效"""
+    import shutil
+    test_project_dir = "test_context_cache_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir)
+        context_manager.add_context("requirement_analysis_result", "需求分析", ContextPriority.HIGH, ContextType.REQUIREMENT, "requirement_analysis")
+        ui_context = context_manager.get_context_for_stage("ui_design", "ui_designer")
+        testing_context = context_manager.get_context_for_stage("testing", "qa_engineer")
+        assert "technical_design_result" not in ui_context
+        
+        # 新增技术设计结果：ui_design 依赖 technical_design，必须重新生成
+        context_manager.add_context("technical_design_result", "技术设计", ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        assert "technical_design_result" in context_manager.get_context_for_stage("ui_design", "ui_designer")
+        assert context_manager.cache_stats["invalidations"] == 1
+        
+        # testing 不依赖 technical_design，qa_engineer 也不关注设计类信息，缓存继续命中
+        assert context_manager.get_context_for_stage("testing", "qa_engineer") == testing_context
+        stats = context_manager.get_cache_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 3
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_token_budget_packing():
+    """测试按Token预算装箱时跳过放不下的大项，继续装入更小的低优先级项"""
+    import shutil
+    test_project_dir = "test_context_budget_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir, max_context_size=120)
+        context_manager.add_context("big_design", "\n".join(f"第{i}节：微服务拆分与接口契约" for i in range(40)), ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        context_manager.add_context("small_config", "端口8000", ContextPriority.MEDIUM, ContextType.CONFIGURATION, "technical_design")
+        
+        context = context_manager.get_context_for_stage("ui_design", "ui_designer")
+        assert "small_config" in context and "big_design" not in context
+        usage = context_manager.token_usage["ui_design"]["ui_designer"]
+        assert usage["tokens"] <= usage["budget"] and usage["skipped"] == 1
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_multi_resolution_rendering():
+    """测试长共识文档按章节生成摘要，预算不足时降级为精简粒度而不是丢掉中间章节"""
+    import shutil
+    test_project_dir = "test_context_summary_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        consensus = "\n".join(
+            f"## 第{i}部分 章节{i}\n" + "\n".join(f"- 要点{i}.{j}：具体实施细节说明" for j in range(8))
+            for i in range(1, 9)
+        )
+        context_manager = SmartContextManager(test_project_dir, max_context_size=400)
+        context_manager.add_context("technical_design_result", consensus, ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        item = context_manager.context_items["technical_design_result"]
+        # 渲染在首次装箱时才生成，原文不另存副本
+        assert item.renderings is None and item.render_tokens is None
+        tokens = {res: context_manager._item_tokens(item, res) for res in ("full", "medium", "short")}
+        assert tokens["short"] < tokens["medium"] < tokens["full"]
+        assert set(item.renderings) == {"medium", "short"}
+        assert context_manager._item_line(item, "full") == f"• technical_design_result: {consensus}"
+        # 中间章节在精简和中等粒度中都保留了标题
+        assert "第5部分 章节5" in item.renderings["short"] and "第5部分 章节5" in item.renderings["medium"]
+        
+        context = context_manager.get_context_for_stage("ui_design", "ui_designer")
+        assert "第5部分 章节5" in context
+        assert context_manager.token_usage["ui_design"]["ui_designer"]["tokens"] <= 400
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_semantic_relevance():
+    """测试中文角色名按角色过滤，以及按提示词语义召回依赖阶段之外的上下文"""
+    import shutil
+    test_project_dir = "test_context_semantic_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir)
+        context_manager.add_context("db_design", "数据库表结构：用户表、订单表，订单表按用户ID分区", ContextPriority.MEDIUM, ContextType.DESIGN, "technical_design")
+        context_manager.add_context("deploy_log", "容器镜像构建完成，推送到私有仓库", ContextPriority.LOW, ContextType.LOG, "deployment")
+        context_manager.add_context("test_report", "订单表分区后查询性能测试通过", ContextPriority.LOW, ContextType.IMPLEMENTATION, "testing")
+        
+        # 中文角色名映射到后端开发角色，日志类上下文被过滤
+        context = context_manager.get_context_for_stage("后端开发", "后端开发工程师")
+        assert "db_design" in context and "deploy_log" not in context
+        
+        # 提示词涉及订单表分区时，召回测试阶段的相关报告
+        context = context_manager.get_context_for_stage("技术设计", "技术总监", query="请评审订单表分区方案的查询性能")
+        assert "test_report" in context and "deploy_log" not in context
+        
+        # 重排在缓存之外进行：不同提示词不增加缓存项，选中内容相同时复用渲染结果
+        entries = len(context_manager.context_cache)
+        hits = context_manager.cache_stats["hits"]
+        again = context_manager.get_context_for_stage("技术设计", "技术总监", query="订单表分区方案的查询性能如何")
+        assert again == context and len(context_manager.context_cache) == entries
+        assert context_manager.cache_stats["hits"] == hits + 1
+        sims = context_manager.semantic_index.similarities("订单表分区")
+        assert sims["test_report"] > sims["deploy_log"]
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_sqlite_storage_backend():
+    """测试SQLite存储后端：索引查询选择与统计、大值存为引用、过期清理和重新加载"""
+    import shutil
+    test_project_dir = "test_context_sqlite_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir, storage="sqlite")
+        big_design = "## 架构\n" + "服务拆分与接口约定说明。" * 3000
+        context_manager.add_context("requirements", "用户管理系统", ContextPriority.CRITICAL, ContextType.REQUIREMENT, "requirement_analysis")
+        context_manager.add_context("big_design", big_design, ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        context_manager.add_context("deploy_log", "部署完成", ContextPriority.LOW, ContextType.LOG, "deployment")
+        
+        selected = context_manager._select_relevant_items("ui_design", "ui_designer", context_manager.stage_dependencies["ui_design"])
+        assert [item.key for item in selected] == ["requirements", "big_design"]
+        stats = context_manager.get_context_stats()
+        assert stats["total_items"] == 3 and stats["by_priority"]["LOW"]["count"] == 1
+        assert stats["by_stage"]["technical_design"]["size"] == len(big_design)
+        context_manager.flush()
+        
+        # 大值存入内容寻址存储，数据库中只保存引用，重新加载后内容一致
+        row = context_manager.store.conn.execute("SELECT value FROM context_items WHERE key = 'big_design'").fetchone()
+        assert "$blob" in row[0] and len(row[0]) < 100
+        reloaded = SmartContextManager(test_project_dir, storage="sqlite")
+        assert reloaded.context_items["big_design"].value == big_design
+        
+        # 过期清理为SQL删除
+        reloaded.context_items["deploy_log"].timestamp -= 48 * 3600
+        reloaded.store.conn.execute("UPDATE context_items SET timestamp = timestamp - 172800 WHERE key = 'deploy_log'")
+        reloaded.cleanup_old_context(max_age_hours=24)
+        assert "deploy_log" not in reloaded.context_items
+        assert reloaded.get_context_stats()["total_items"] == 2
+        reloaded.store.close()
+        context_manager.store.close()
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_delta_context_rounds():
+    """测试多轮讨论只发送新增或更新的上下文，并统计节省的Token"""
+    import shutil
+    test_project_dir = "test_context_delta_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir)
+        design = "\n".join(f"## 模块{i}\n" + "接口定义与数据流说明，包含鉴权、分页和错误码约定。" * 5 for i in range(6))
+        context_manager.add_context("requirements", "用户管理系统", ContextPriority.CRITICAL, ContextType.REQUIREMENT, "requirement_analysis")
+        context_manager.add_context("design", design, ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        
+        first = context_manager.get_delta_context_for_stage("ui_design", "ui_designer", 1)
+        assert first == context_manager.get_context_for_stage("ui_design", "ui_designer")
+        
+        # 无变化：仍列出各项提纲，不发送正文
+        second = context_manager.get_delta_context_for_stage("ui_design", "ui_designer", 2)
+        assert "与第1轮相同" in second and "• design: 模块0 / 模块1" in second
+        assert "接口定义与数据流说明" not in second
+        assert context_manager.get_delta_savings("ui_design", 2)["saved"] > 0
+        
+        # 新增内容完整发送，未变化项只列提纲
+        context_manager.add_context("ui_spec", "主色调蓝色，圆角按钮", ContextPriority.HIGH, ContextType.DESIGN, "ui_design")
+        third = context_manager.get_delta_context_for_stage("ui_design", "ui_designer", 3)
+        assert "【新增或更新】" in third and "主色调蓝色" in third
+        assert "与第2轮相同" in third and "• requirements: 用户管理系统" in third
+        assert "接口定义与数据流说明" not in third
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_blob_store_dedup():
+    """测试长文本在快照中存为引用，相同内容只存一份"""
+    import shutil
+    from src.blob_store import BlobStore, get_blob_store
+    test_project_dir = "test_context_blob_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        consensus = "## 共识\n" + "统一使用REST接口和JWT鉴权。" * 200
+        context_manager = SmartContextManager(test_project_dir)
+        context_manager.add_context("technical_design_result", consensus, ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        context_manager.add_context("technical_design_copy", consensus, ContextPriority.HIGH, ContextType.DESIGN, "ui_design")
+        context_manager._save_persistent_context()
+        
+        with open(context_manager.snapshot_file, 'r', encoding='utf-8') as f:
+            snapshot = f.read()
+        assert "JWT" not in snapshot and len(snapshot) < len(consensus)
+        blobs = BlobStore(os.path.join(test_project_dir, 'blobs'))
+        blob_files = [f for _, _, files in os.walk(blobs.root) for f in files]
+        assert len(blob_files) == 1
+        
+        reloaded = SmartContextManager(test_project_dir)
+        assert reloaded.context_items["technical_design_copy"].value == consensus
+        assert blobs.unpack(blobs.pack({"a": [consensus], "b": "短文本"})) == {"a": [consensus], "b": "短文本"}
+        
+        # 同一项目共用一个存储；内容被替换且压缩后不再有文件引用，按可达性回收
+        assert reloaded.blobs is get_blob_store(test_project_dir)
+        revised = "## 共识\n" + "改为GraphQL接口。" * 200
+        for key in ("technical_design_result", "technical_design_copy"):
+            reloaded.add_context(key, revised, ContextPriority.HIGH, ContextType.DESIGN, "technical_design")
+        reloaded._save_persistent_context()
+        assert reloaded.blobs.collect_garbage(test_project_dir) == 0
+        assert reloaded.blobs.collect_garbage(test_project_dir, grace_seconds=0) == 1
+        assert reloaded.blobs.stored_digests() == {BlobStore.digest(revised)}
+        assert SmartContextManager(test_project_dir).context_items["technical_design_copy"].value == revised
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_compact_context_item():
+    """测试上下文项为紧凑表示：无实例字典、哈希延迟计算、加载时复用持久化的哈希"""
+    from src.context_manager import ContextItem
+    import time as _time
+    item = ContextItem("k", "内容", ContextPriority.LOW, ContextType.LOG, "testing", _time.time())
+    assert not hasattr(item, "__dict__")
+    assert item._hash is None and len(item.hash) == 32 and item.size == 2
+    
+    import shutil
+    test_project_dir = "test_context_item_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir)
+        data = context_manager._item_to_dict(item)
+        data["hash"] = "persisted"
+        loaded = context_manager._item_from_dict(data)
+        assert loaded.hash == "persisted" and loaded.stage is item.stage
+    finally:
+        shutil.rmtree(test_project_dir)
+
+def test_concurrent_access():
+    """测试多个Agent线程并发读写上下文不出错"""
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+    test_project_dir = "test_context_concurrent_project"
+    os.makedirs(test_project_dir, exist_ok=True)
+    try:
+        context_manager = SmartContextManager(test_project_dir)
+        context_manager.add_context("requirements", "用户管理系统", ContextPriority.CRITICAL, ContextType.REQUIREMENT, "requirement_analysis")
+        
+        def agent_turn(i):
+            context_manager.add_context(f"note_{i}", f"第{i}条设计意见", ContextPriority.MEDIUM, ContextType.DESIGN, "technical_design")
+            return context_manager.get_delta_context_for_stage("ui_design", f"agent_{i % 4}", 1 + i // 4)
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            contexts = list(executor.map(agent_turn, range(40)))
+        assert len(contexts) == 40 and all("项目上下文" in c for c in contexts)
+        assert context_manager.get_context_stats()["total_items"] == 41
+    finally:
+        shutil.rmtree(test_project_dir)
+
 if __name__ == "__main__":
-    test_context_manager() 
\ No newline at end of file
+    test_context_manager()
+    test_hash_index_on_replace()
+    test_journal_replay_after_crash()
+    test_versioned_cache_invalidation()
+    test_token_budget_packing()
+    test_multi_resolution_rendering() 
+    test_semantic_relevance()
+    test_sqlite_storage_backend()
+    test_delta_context_rounds()
+    test_blob_store_dedup()
+    test_compact_context_item()
+    test_concurrent_access()
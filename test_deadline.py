@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+调用时限测试脚本
+验证LLM调用超时、阶段截止时间和对冲请求，以及失败的调用不会被当作阶段产出保存
+"""
+
+import os
+import sys
+import time
+import shutil
+import threading
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.crew import AiTeamCrew, LoggingAgent, ProgressManager
+from src.llm_gateway import GatewayLLM
+from src.fake_provider import FakeCompletion
+from src.deadline import (CallMonitor, DeadlineExceeded, LLMCallTimeout, deadline_scope, get_call_monitor,
+                          run_call)
+from src.usage_meter import get_usage_meter
+from src import rate_limiter
+from src.rate_limiter import RequestScheduler
+
+def test_failed_call_not_saved():
+    """测试调用超时向上抛出，单Agent阶段不保存进度"""
+    project_dir = "test_deadline_project"
+    try:
+        crew = AiTeamCrew(project_dir=project_dir)
+        agent = crew.team.task("ui_design").agent
+        agent.llm = GatewayLLM(model="fake-model", stream_mode="log", call_timeout=0.3)
+        agent.llm._completion_fn = FakeCompletion(latency=3.0)
+        progress_manager = ProgressManager(project_dir)
+        try:
+            crew._run_stage("ui_design", {"requirements": "请假系统"}, {}, progress_manager, project_dir)
+            assert False, "应抛出 LLMCallTimeout"
+        except LLMCallTimeout:
+            pass
+        assert not progress_manager.is_stage_completed("ui_design")
+        assert not os.path.exists(os.path.join(project_dir, "UI设计_共识文档.md"))
+        # 超时取消的请求同样计入用量
+        for _ in range(20):
+            if get_usage_meter(project_dir).usage["project"]["calls"]:
+                break
+            time.sleep(0.1)
+        assert get_usage_meter(project_dir).usage["project"]["calls"] >= 1
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+def test_queue_wait_bounded():
+    """测试排队等待受单次调用时限和阶段截止时间约束，放弃排队后不占用名额"""
+    scheduler = RequestScheduler(max_in_flight=1)
+    scheduler.acquire("m", 0, 2)
+    begin = time.time()
+    try:
+        scheduler.run(lambda: "结果", "m", timeout=0.2)
+        assert False, "排队超时应抛出 LLMCallTimeout"
+    except LLMCallTimeout:
+        assert time.time() - begin < 1.0
+    with deadline_scope("测试阶段", 0.2) as deadline:
+        try:
+            scheduler.run(lambda: "结果", "m", timeout=5, deadline=deadline)
+            assert False, "阶段到期应抛出 DeadlineExceeded"
+        except DeadlineExceeded:
+            pass
+    assert scheduler.waiting_count() == 0
+    scheduler.release("m", 0, 0)
+    assert scheduler.run(lambda: "结果", "m", timeout=0.2) == "结果"
+
+def test_hedge_uses_own_slot():
+    """测试对冲请求单独占用调度名额，名额不足时不发出；被取消的一方同样计入用量"""
+    project_dir = "test_deadline_hedge_project"
+    saved = rate_limiter._scheduler
+    agent = LoggingAgent(role="测试角色", goal="测试", backstory="测试", project_dir=project_dir)
+    try:
+        for max_in_flight, expect_hedge in ((1, False), (2, True)):
+            rate_limiter._scheduler = scheduler = RequestScheduler(max_in_flight=max_in_flight)
+            model = f"hedge-slot-model-{max_in_flight}"
+            for _ in range(20):
+                get_call_monitor().observe(model, 0.05)
+            latencies = iter([0.6, 0.01])
+            llm = GatewayLLM(model=model, stream_mode="log", hedge=True)
+            llm._completion_fn = FakeCompletion(responder=lambda params: ("Final Answer: 完成", next(latencies)))
+            stats = dict(get_call_monitor().stats)
+            calls = get_usage_meter(project_dir).usage["project"]["calls"]
+            begin = time.time()
+            assert "完成" in llm.call("列出核心功能", from_agent=agent)
+            elapsed = time.time() - begin
+            assert scheduler.stats["requests"] == (2 if expect_hedge else 1)
+            assert get_call_monitor().stats["hedge_won"] == stats["hedge_won"] + (1 if expect_hedge else 0)
+            assert (elapsed < 0.5) == expect_hedge
+            # 被取消的原请求稍后结束并计费
+            expected_calls = calls + (2 if expect_hedge else 1)
+            for _ in range(20):
+                if get_usage_meter(project_dir).usage["project"]["calls"] == expected_calls:
+                    break
+                time.sleep(0.1)
+            assert get_usage_meter(project_dir).usage["project"]["calls"] == expected_calls
+            assert scheduler.in_flight == 0 and scheduler.waiting_count() == 0
+    finally:
+        rate_limiter._scheduler = saved
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+def test_call_timeout_and_hedge():
+    """测试单次调用超时、阶段截止时间取消进行中的调用，以及慢调用的对冲请求"""
+    def slow(cancel, hedge):
+        cancel.wait(2)
+        return "慢"
+
+    begin = time.time()
+    try:
+        run_call(slow, timeout=0.1)
+        assert False, "应抛出 LLMCallTimeout"
+    except LLMCallTimeout:
+        assert time.time() - begin < 0.5
+
+    # 原请求卡住时对冲请求先返回；原请求先失败时直接抛出，不再对冲
+    result, outcome = run_call(lambda cancel, hedge: "快" if hedge else slow(cancel, hedge), hedge_delay=0.05)
+    assert result == "快" and outcome == {"hedged": True, "hedge_won": True}
+    try:
+        run_call(lambda cancel, hedge: 1 / 0, hedge_delay=0.05)
+        assert False, "应抛出原请求的异常"
+    except ZeroDivisionError:
+        pass
+
+    monitor = CallMonitor(min_samples=5)
+    assert monitor.hedge_delay("m") is None
+    for seconds in (0.1, 0.2, 0.3, 0.4, 1.0):
+        monitor.observe("m", seconds)
+    assert monitor.hedge_delay("m") == 1.0
+
+    # 流式调用在阶段截止时间到达时取消
+    stats = dict(get_call_monitor().stats)
+    llm = GatewayLLM(model="gpt-4.1-mini", stream_mode="log")
+    llm._completion_fn = FakeCompletion(latency=2.0)
+    begin = time.time()
+    with deadline_scope("测试阶段", 0.2):
+        try:
+            llm.call("列出核心功能")
+            assert False, "应抛出 DeadlineExceeded"
+        except DeadlineExceeded:
+            assert time.time() - begin < 1.0
+    assert get_call_monitor().stats["cancelled"] == stats["cancelled"] + 1
+
+    # 第一个请求卡住，超过p95后发出的对冲请求先返回
+    latencies = iter([2.0] + [0.01] * 10)
+    llm = GatewayLLM(model="hedge-test-model", stream_mode="off", hedge=True)
+    llm._completion_fn = FakeCompletion(responder=lambda params: ("Final Answer: 对冲结果", next(latencies)))
+    for _ in range(20):
+        get_call_monitor().observe("hedge-test-model", 0.05)
+    begin = time.time()
+    assert "对冲结果" in llm.call("列出核心功能")
+    assert time.time() - begin < 1.0
+    assert get_call_monitor().stats["hedge_won"] == stats["hedge_won"] + 1
+
+if __name__ == "__main__":
+    test_failed_call_not_saved()
+    test_queue_wait_bounded()
+    test_hedge_uses_own_slot()
+    test_call_timeout_and_hedge()
+    print("调用时限测试通过")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+多Agent讨论测试脚本
+验证滚动摘要的Token预算、投票解析、共识停止条件和讨论断点
+"""
+
+import sys
+import shutil
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.discussion_summary import RollingSummary
+from src.consensus import ConsensusTracker, parse_vote, strip_vote
+from src.discussion_checkpoint import DiscussionCheckpoint, parse_resume_point
+from src.utils.token_utils import count_tokens
+
+ROLES = ["技术总监", "产品经理", "后端开发工程师"]
+
+def _statement(role: str, round_num: int) -> str:
+    return (f"## 【关键决策点】\n{role}第{round_num}轮认为应采用微服务架构。\n" + "补充说明细节。" * 80 +
+            f"\n## 【技术方案】\n使用FastAPI和PostgreSQL，第{round_num}轮补充缓存方案。\n" + "实施细节。" * 80 +
+            f"\n## 【最终确认】\n同意第{round_num}轮方案。")
+
+def test_rolling_summary_budget():
+    """测试摘要随轮次增长保持在预算内，且不包含指定轮次及之后的发言"""
+    summary = RollingSummary(token_budget=600)
+    sizes = []
+    for round_num in range(1, 11):
+        summary.add_round(round_num, [(role, _statement(role, round_num)) for role in ROLES])
+        sizes.append(count_tokens(summary.text()))
+    assert max(sizes) <= 600, sizes
+    # 最近的轮次保留章节要点，最早的轮次被省略
+    text = summary.text()
+    assert "第10轮：" in text and "省略" in text
+    assert "第10轮认为应采用微服务架构" in text
+
+    before = summary.text(before_round=10)
+    assert "第10轮：" not in before and "第9轮：" in before
+    assert RollingSummary().text() == ""
+
+def test_rolling_summary_token_counts_cached():
+    """测试生成摘要不再对已并入的发言重复计数Token"""
+    from src import discussion_summary
+    calls = []
+    original = discussion_summary.count_tokens
+    discussion_summary.count_tokens = lambda text: calls.append(text) or original(text)
+    try:
+        summary = RollingSummary(token_budget=600)
+        for round_num in range(1, 11):
+            summary.add_round(round_num, [(role, _statement(role, round_num)) for role in ROLES])
+        counted = len(calls)
+        text = summary.text()
+        # 只有省略提示行需要计数
+        assert "省略" in text and len(calls) - counted <= len(ROLES) * 10
+        assert all("省略" in call for call in calls[counted:])
+    finally:
+        discussion_summary.count_tokens = original
+
+def _vote(stance: str, agreed: str = "无", disagreed: str = "无", unclear: str = "无") -> str:
+    return f"\n【投票】\n立场: {stance}\n共识点: {agreed}\n分歧点: {disagreed}\n待澄清: {unclear}"
+
+def test_parse_vote():
+    """测试投票块解析：立场归一化、多项拆分、“无”视为空"""
+    vote = parse_vote("正文提到反对旧方案。" + _vote("不同意", "使用FastAPI；采用PostgreSQL", "部署方式", "无"))
+    assert vote.stance == "反对"
+    assert vote.agreed == ["使用FastAPI", "采用PostgreSQL"]
+    assert vote.disagreed == ["部署方式"] and vote.unclear == []
+    assert parse_vote("我同意这个方案").stance == "未投票"
+    assert parse_vote("- 立场：支持" + _vote("保留")).stance == "保留"
+    assert strip_vote("正文" + _vote("同意")) == "正文"
+
+def test_consensus_stops_on_votes_or_plateau():
+    """测试投票一致时停止、观点不再变化时停止，并汇总分歧点"""
+    tracker = ConsensusTracker(participants=3)
+    metrics = tracker.observe(1, [
+        ("技术总监", "采用微服务架构" + _vote("同意", "微服务架构")),
+        ("产品经理", "先做单体应用" + _vote("反对", "微服务架构", "部署方式")),
+        ("后端开发工程师", "数据库选型待定" + _vote("保留", "无", "无", "数据库选型")),
+    ])
+    assert tracker.stop_reason is None and metrics["convergence"] is None
+    assert metrics["votes"] == {"同意": 1, "反对": 1, "保留": 1, "未投票": 0}
+    status = tracker.status()
+    assert status["disagreed_points"] == ["部署方式"] and status["unclear_points"] == ["数据库选型"]
+    assert status["agreed_points"] == ["微服务架构"]
+
+    # 发言异常的Agent按未投票计算，不算一致
+    tracker.observe(2, [("技术总监", "全新观点一" + _vote("同意")), ("产品经理", "全新观点二" + _vote("同意"))])
+    assert tracker.stop_reason is None and tracker.metrics[-1]["votes"]["未投票"] == 1
+
+    tracker.observe(3, [(role, f"{role}同意采用微服务" + _vote("同意")) for role in ROLES])
+    assert tracker.stop_reason == "投票一致" and tracker.agreed
+
+    plateau = ConsensusTracker(participants=3)
+    for round_num in (1, 2):
+        plateau.observe(round_num, [(role, _statement(role, 1) + _vote("反对", "无", "部署方式")) for role in ROLES])
+    assert plateau.stop_reason == "观点收敛" and not plateau.agreed
+    assert plateau.metrics[-1]["convergence"] > 0.99
+
+def test_discussion_checkpoint_resume():
+    """测试讨论断点：已完成轮次和未完成轮次中的发言可恢复，失败的发言续跑时重试，按轮次截断，需求变化时丢弃"""
+    project_dir = "test_checkpoint_project"
+    fingerprint = DiscussionCheckpoint.make_fingerprint(ROLES, "在线商城")
+    try:
+        checkpoint = DiscussionCheckpoint(project_dir, "技术设计", fingerprint)
+        assert checkpoint.load() == ([], {})
+        checkpoint.start()
+        for round_num in (1, 2):
+            for role in ROLES:
+                checkpoint.record_turn(round_num, role, _statement(role, round_num))
+            checkpoint.record_round(round_num, {})
+        # 第3轮中途崩溃：只完成了一个发言，且最后一行写了一半
+        checkpoint.record_turn(3, "技术总监", "第3轮发言")
+        with open(checkpoint.path, 'a', encoding='utf-8') as f:
+            f.write('{"type": "turn", "round": 3, "ro')
+
+        completed, pending = DiscussionCheckpoint(project_dir, "技术设计", fingerprint).load()
+        assert [entry["round"] for entry in completed] == [1, 2]
+        assert completed[1]["turns"]["产品经理"] == _statement("产品经理", 2)
+        assert pending == {"技术总监": "第3轮发言"}
+        # 长发言在断点中只保存引用
+        with open(checkpoint.path, 'r', encoding='utf-8') as f:
+            assert "补充说明细节" not in f.read()
+
+        assert checkpoint.truncate(2) == 1
+        completed, pending = checkpoint.load()
+        assert len(completed) == 1 and pending == {}
+
+        changed = DiscussionCheckpoint(project_dir, "技术设计", DiscussionCheckpoint.make_fingerprint(ROLES, "在线论坛"))
+        assert changed.load() == ([], {}) and checkpoint.completed_rounds() == 0
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+    # 有发言失败的轮次不作为完成：续跑时从该轮开始，成功的发言复用，之后的轮次丢弃
+    try:
+        checkpoint = DiscussionCheckpoint(project_dir, "技术设计", fingerprint)
+        checkpoint.start()
+        for role in ROLES:
+            checkpoint.record_turn(1, role, _statement(role, 1))
+        checkpoint.record_round(1, {})
+        for role in ROLES[:-1]:
+            checkpoint.record_turn(2, role, _statement(role, 2))
+        checkpoint.record_round(2, {ROLES[-1]: "LLM调用超过 300 秒未返回"})
+        checkpoint.record_turn(3, ROLES[0], _statement(ROLES[0], 3))
+        checkpoint.record_round(3, {})
+
+        completed, pending = checkpoint.load()
+        assert [entry["round"] for entry in completed] == [1]
+        assert set(pending) == set(ROLES[:-1])
+        assert checkpoint.completed_rounds() == 1
+        completed, pending = checkpoint.load()
+        assert len(completed) == 1 and set(pending) == set(ROLES[:-1])
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+    assert parse_resume_point("technical_design") == ("technical_design", None)
+    assert parse_resume_point("technical_design:3") == ("technical_design", 3)
+    try:
+        parse_resume_point("technical_design:0")
+        assert False, "轮次应为正整数"
+    except ValueError:
+        pass
+
+if __name__ == "__main__":
+    test_rolling_summary_budget()
+    test_rolling_summary_token_counts_cached()
+    test_parse_vote()
+    test_consensus_stops_on_votes_or_plateau()
+    test_discussion_checkpoint_resume()
+    print("多Agent讨论测试通过")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+模拟接口测试脚本
+验证模拟回复脚本按任务名匹配模板、规则延迟，以及经网关透传任务名
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from crewai import Task
+
+from src.llm_gateway import GatewayLLM
+from src.fake_provider import FakeCompletion, ScriptedResponder
+
+def test_scripted_responder():
+    """默认脚本按任务名返回模板回复，并经网关透传任务名"""
+    responder = ScriptedResponder.from_file()
+    fake = FakeCompletion(responder=responder)
+
+    def reply(task_name: str, role: str = "产品经理") -> str:
+        params = {"model": "fake-model", "messages": [], "metadata": {"task_name": task_name, "agent_role": role}}
+        return fake(**params).choices[0].message.content
+
+    first = reply("需求分析_discussion_round1_产品经理")
+    assert "立场: 保留" in first and "产品经理建议" in first and first.startswith("Thought:")
+    assert "立场: 同意" in reply("需求分析_discussion_round2_架构师")
+    assert "# 需求分析共识文档" in reply("需求分析_consensus")
+    assert "```python" in reply("backend_development")
+    assert "负责人：测试工程师" in reply("testing", role="测试工程师")
+    assert responder.hits["讨论发言（首轮）"] == 1 and responder.hits["默认"] == 1
+
+    # 规则延迟覆盖默认延迟
+    slow = FakeCompletion(latency=0.0, responder=ScriptedResponder([{"task": ".*", "response": "ok", "latency": 0.05}]))
+    begin = time.time()
+    slow(messages=[])
+    assert time.time() - begin >= 0.05
+
+    task = Task(name="backend_development", description="实现后端接口", expected_output="后端代码")
+    llm = GatewayLLM(model="gpt-4.1-mini", stream_mode="off")
+    llm._completion_fn = FakeCompletion(responder=responder)
+    assert "```python" in llm.call("实现后端接口", from_task=task)
+
+if __name__ == "__main__":
+    test_scripted_responder()
+    print("模拟接口测试通过")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+LLM响应缓存测试脚本
+验证缓存命中、record/replay 模式、按大小淘汰，以及回放未命中时任务报错而不是返回结果
+"""
+
+import os
+import sys
+import shutil
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_cache import LLMResponseCache, LLMCacheMiss
+
+def _key(description: str) -> str:
+    return LLMResponseCache.make_key("gpt-4o-mini", "产品经理", "背景", description, "输出", "上下文", ["mcp_tool"])
+
+def test_cache_modes():
+    """测试读穿缓存、record 覆盖写入和 replay 未命中报错"""
+    cache_dir = "test_llm_cache_dir"
+    try:
+        cache = LLMResponseCache(cache_dir, mode="on")
+        assert cache.get(_key("需求分析")) is None
+        cache.put(_key("需求分析"), "第一版需求")
+        assert cache.get(_key("需求分析")) == "第一版需求"
+        assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+        # 工具集合顺序不影响缓存键，上下文不同则不命中
+        assert _key("需求分析") == LLMResponseCache.make_key("gpt-4o-mini", "产品经理", "背景", "需求分析", "输出", "上下文", ["mcp_tool"])
+        assert _key("需求分析") != LLMResponseCache.make_key("gpt-4o-mini", "产品经理", "背景", "需求分析", "输出", "新上下文", ["mcp_tool"])
+
+        recorder = LLMResponseCache(cache_dir, mode="record")
+        assert recorder.get(_key("需求分析")) is None
+        recorder.put(_key("需求分析"), "第二版需求")
+
+        replayer = LLMResponseCache(cache_dir, mode="replay")
+        assert replayer.get(_key("需求分析")) == "第二版需求"
+        try:
+            replayer.get(_key("技术设计"))
+            assert False, "replay 模式未命中应报错"
+        except LLMCacheMiss:
+            pass
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def test_cache_eviction():
+    """测试超过大小上限时淘汰最久未使用的条目"""
+    cache_dir = "test_llm_cache_evict_dir"
+    try:
+        cache = LLMResponseCache(cache_dir, mode="on", max_bytes=3000)
+        for i in range(10):
+            cache.put(_key(f"任务{i}"), "结果" * 200)
+            os.utime(cache._path(_key(f"任务{i}")), (i, i))
+        assert cache.stats["evictions"] > 0
+        assert cache.get(_key("任务9")) is not None
+        assert cache.get(_key("任务0")) is None
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def test_replay_miss_fails_task():
+    """测试 replay 模式未命中时Agent任务直接报错，不把错误文本当作结果"""
+    from src.crew import create_team
+
+    project_dir = "test_llm_cache_replay_project"
+    os.environ["AI_TEAM_LLM_CACHE"] = "replay"
+    try:
+        task = create_team("replay", project_dir).task("ui_design")
+        try:
+            task.agent.execute_task(task, context="请假系统")
+            assert False, "replay 模式未命中应报错"
+        except LLMCacheMiss:
+            pass
+    finally:
+        os.environ.pop("AI_TEAM_LLM_CACHE", None)
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_cache_modes()
+    test_cache_eviction()
+    test_replay_miss_fails_task()
+    print("LLM缓存测试通过")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+LLM网关测试脚本
+验证流式读取、首Token统计、空闲超时取消、中途出错、流式日志缓冲，以及失败调用的用量计费
+"""
+
+import os
+import sys
+import time
+import logging
+import shutil
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_gateway import StreamSink, LLMStreamStalled, LLMStreamInterrupted, consume_stream
+from src.llm_gateway import GatewayLLM
+from src.usage_meter import get_usage_meter
+from src.crew import LoggingAgent
+from src.llm_errors import LLMCallFailed
+
+def _chunks(text: str, delay: float = 0.0, stall_after: int = None):
+    for i in range(0, len(text), 4):
+        if stall_after is not None and i >= stall_after:
+            time.sleep(10)
+        time.sleep(delay)
+        yield {"choices": [{"delta": {"content": text[i:i + 4]}}]}
+    yield {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 8, "total_tokens": 20}}
+
+def test_stream_to_sink():
+    """测试流式内容按缓冲上限追加到日志，并统计首Token延迟和usage"""
+    log_dir = "test_stream_logs"
+    try:
+        log_path = os.path.join(log_dir, "streams", "技术总监.log")
+        sink = StreamSink("技术总监", log_path=log_path, echo=False, buffer_chars=16)
+        text = "## 技术方案\n采用FastAPI和PostgreSQL。\n" * 3
+        result, stats = consume_stream(_chunks(text, delay=0.01), sink)
+        assert result == text
+        assert stats["ttft"] is not None and stats["ttft"] < stats["duration"]
+        assert stats["usage"]["completion_tokens"] == 8
+        # 未关闭前缓冲区不超过上限，关闭后全部落盘
+        assert sink._buffered < 16
+        sink.close("done")
+        with open(log_path, encoding='utf-8') as f:
+            content = f.read()
+        assert text in content and "done" in content
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+def test_stalled_stream_cancelled():
+    """测试流式响应中途停滞超过空闲阈值时取消"""
+    begin = time.time()
+    try:
+        consume_stream(_chunks("需求分析" * 10, stall_after=8), idle_timeout=0.3)
+        assert False, "应当因空闲超时取消"
+    except LLMStreamStalled as e:
+        assert "已取消" in str(e) and e.partial_text == "需求分析" * 2
+    assert time.time() - begin < 2
+
+    def broken_stream():
+        yield from list(_chunks("需求分析"))[:1]
+        raise ConnectionError("连接被重置")
+    try:
+        consume_stream(broken_stream())
+        assert False, "中途出错应抛出 LLMStreamInterrupted"
+    except LLMStreamInterrupted as e:
+        assert e.partial_text == "需求分析" and isinstance(e.__cause__, ConnectionError)
+
+    # 网关不吞掉停滞异常，Agent任务按调用失败处理，不会把部分输出当作结果
+    llm = GatewayLLM(model="gpt-4.1-mini", stream_mode="log", idle_timeout=0.3)
+    llm._completion_fn = lambda **params: _chunks("需求分析" * 10, stall_after=3)
+    # 开始和失败事件在同一个调用上下文中发出，不会退回生成临时 call_id
+    messages = []
+    handler = logging.Handler()
+    handler.emit = lambda record: messages.append(record.getMessage())
+    logging.getLogger().addHandler(handler)
+    try:
+        llm.call("列出核心功能")
+        assert False, "应当因空闲超时取消"
+    except LLMCallFailed as e:
+        assert isinstance(e, LLMStreamStalled)
+    finally:
+        logging.getLogger().removeHandler(handler)
+    assert not any("outside call context" in message for message in messages)
+
+def test_failed_calls_metered():
+    """测试流式停滞和中途出错的调用按 prompt 和已收到的部分输出计入用量"""
+    project_dir = "test_failed_usage_project"
+    agent = LoggingAgent(role="测试角色", goal="测试", backstory="测试", project_dir=project_dir)
+    try:
+        def broken_stream(**params):
+            yield from list(_chunks("需求分析" * 4))[:2]
+            raise ConnectionError("连接被重置")
+        for completion_fn in (lambda **params: _chunks("需求分析" * 10, stall_after=8), broken_stream):
+            llm = GatewayLLM(model="gpt-4.1-mini", stream_mode="log", idle_timeout=0.3)
+            llm._completion_fn = completion_fn
+            try:
+                llm.call("列出核心功能", from_agent=agent)
+                assert False, "调用应失败"
+            except LLMCallFailed:
+                pass
+        usage = get_usage_meter(project_dir).usage
+        assert usage["project"]["calls"] == 2
+        assert usage["project"]["prompt_tokens"] > 0 and usage["project"]["completion_tokens"] > 0
+        assert usage["by_agent"]["测试角色"]["cost"] > 0
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_stream_to_sink()
+    test_stalled_stream_cancelled()
+    test_failed_calls_metered()
+    print("LLM网关测试通过")
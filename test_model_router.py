@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+模型路由测试脚本
+验证按角色默认模型和任务名规则路由，以及路由默认关闭
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.model_router import ModelRouter
+from src.llm_gateway import GatewayLLM
+from src.usage_meter import UsageMeter
+
+def test_model_routing():
+    """测试按角色参数和任务名规则路由：讨论发言用便宜模型，共识文档、代码生成和重复修复用强模型，其他任务沿用统一模型"""
+    # 默认开启；enabled 参数覆盖配置
+    assert ModelRouter.from_config() is not None
+    assert ModelRouter.from_config(enabled=False) is None
+    router = ModelRouter.from_config(enabled=True)
+    meter = UsageMeter("unused")
+    assert meter.cost(router.tiers["cheap"], 1000, 1000) < meter.cost("gpt-4o-mini", 1000, 1000)
+    # 角色只提供 temperature 和 max_tokens，不改用更贵的角色默认模型
+    settings = router.settings_for_role("tech_lead", "gpt-4o-mini")
+    assert settings["model"] == "gpt-4o-mini" and settings["max_tokens"] == 2000
+    assert router.settings_for_role("secretary", "gpt-4o-mini") == {"model": "gpt-4o-mini"}
+
+    llm = GatewayLLM(**settings)
+    llm._router = router
+    assert llm.model_for("需求分析_discussion_round3_技术总监") == router.tiers["cheap"]
+    assert llm.model_for("需求分析_consensus") == router.tiers["strong"]
+    assert llm.model_for("documentation") == "gpt-4o-mini"
+    # 第一次自动修复沿用统一模型，再次修复时升级
+    assert llm.model_for("auto_fix_npm_attempt1_agent1") == "gpt-4o-mini"
+    assert llm.model_for("auto_fix_npm_attempt2_agent1") == router.tiers["strong"]
+    assert llm.model_for("auto_fix_python_attempt3") == router.tiers["strong"]
+    params = llm._completion_params([{"role": "user", "content": "生成后端代码"}], False, llm.route("backend_development"))
+    assert params["model"] == router.tiers["strong"] and params["max_tokens"] == 4000
+    assert params["temperature"] == 0.2
+
+    # 原型Agent的LLM带有角色参数，模型沿用统一模型
+    from src.crew import AGENTS
+    assert AGENTS["tech_lead"].llm.model == os.getenv("OPENAI_MODEL", "gpt-4o-mini") and AGENTS["tech_lead"].llm.max_tokens == 2000
+
+if __name__ == "__main__":
+    test_model_routing()
+    print("模型路由测试通过")
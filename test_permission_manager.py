@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+权限管理测试脚本
+验证角色继承链、用户组授权、判定优先级、权限持久化和有效权限报告命令行
+"""
+
+import sys
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.permission_manager import PermissionManager
+
+TEST_DIR = Path("test_permission_dir")
+
+HIERARCHY = {
+    "roles": {
+        "boss": {"inherits": ["tech_lead", "secretary"]},
+        "tech_lead": {"inherits": ["backend_dev"]},
+        "backend_dev": {"inherits": []},
+        "secretary": {"inherits": []},
+        # 环形继承不应导致死循环
+        "cycle_a": {"inherits": ["cycle_b"]},
+        "cycle_b": {"inherits": ["cycle_a"]},
+    },
+    "groups": {
+        "all_staff": {"members": [], "roles": [], "inherits": []},
+        "dev_team": {"members": ["u001", "u002"], "roles": ["backend_dev"], "inherits": ["all_staff"]},
+    },
+}
+
+def _grant(subject: str, name: str, resource_id: str, action: str, allow: bool) -> dict:
+    entry = {"user_id": None, "role": None, "resource_type": "doc", "resource_id": resource_id,
+             "action": action, "allow": allow, "note": ""}
+    entry[subject] = name
+    return entry
+
+PERMISSIONS = [
+    _grant("role", "backend_dev", "api", "read", True),
+    _grant("role", "backend_dev", "deploy", "read", True),
+    _grant("role", "tech_lead", "deploy", "read", False),
+    _grant("role", "secretary", "minutes", "read", True),
+    # 同一层级内先出现者生效
+    _grant("role", "secretary", "minutes", "write", True),
+    _grant("role", "secretary", "minutes", "write", False),
+    _grant("role", "cycle_b", "loop", "read", True),
+    _grant("group", "all_staff", "wiki", "read", True),
+    _grant("group", "dev_team", "api", "write", False),
+    _grant("user_id", "u002", "api", "write", True),
+    _grant("user_id", "u003", "minutes", "read", False),
+]
+
+def _manager() -> PermissionManager:
+    """在临时目录写入权限表和继承定义，返回加载它们的管理器"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    TEST_DIR.mkdir()
+    with open(TEST_DIR / "permissions.json", "w", encoding="utf-8") as f:
+        json.dump(PERMISSIONS, f, ensure_ascii=False)
+    with open(TEST_DIR / "role_hierarchy.json", "w", encoding="utf-8") as f:
+        json.dump(HIERARCHY, f, ensure_ascii=False)
+    return PermissionManager(TEST_DIR / "permissions.json", TEST_DIR / "role_hierarchy.json")
+
+def test_role_inheritance_chain():
+    """测试多级角色继承：按距离展开闭包，距离近的角色权限优先，环形继承可终止"""
+    try:
+        pm = _manager()
+        assert pm.get_role_closure("boss") == ["boss", "tech_lead", "secretary", "backend_dev"]
+        # boss 经 tech_lead 两级继承 backend_dev 的权限
+        assert pm.has_permission("u100", "boss", "doc", "api", "read")
+        assert pm.has_permission("u100", "boss", "doc", "minutes", "read")
+        # tech_lead 的拒绝比更远的 backend_dev 的允许优先
+        assert pm.has_permission("u100", "backend_dev", "doc", "deploy", "read")
+        assert not pm.has_permission("u100", "tech_lead", "doc", "deploy", "read")
+        assert not pm.has_permission("u100", "boss", "doc", "deploy", "read")
+        # 继承是单向的
+        assert not pm.has_permission("u100", "backend_dev", "doc", "minutes", "read")
+        assert pm.get_role_closure("cycle_a") == ["cycle_a", "cycle_b"]
+        assert pm.has_permission("u100", "cycle_a", "doc", "loop", "read")
+        # 未定义的角色只包含自身
+        assert pm.get_role_closure("guest") == ["guest"]
+    finally:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+def test_group_grants():
+    """测试用户组授权：组直接授权、父组授权和组绑定角色的权限都对成员生效"""
+    try:
+        pm = _manager()
+        # u001 以 guest 身份访问，权限来自所在组
+        assert pm.has_permission("u001", "guest", "doc", "api", "read")
+        assert pm.has_permission("u001", "guest", "doc", "wiki", "read")
+        assert not pm.has_permission("u001", "guest", "doc", "api", "write")
+        # 非组成员没有这些权限
+        assert not pm.has_permission("u100", "guest", "doc", "api", "read")
+        assert not pm.has_permission("u100", "guest", "doc", "wiki", "read")
+        sources = {(p["resource_id"], p["action"]): p["source"] for p in pm.get_effective_permissions(user_id="u001")}
+        assert sources == {("api", "write"): "group:dev_team", ("wiki", "read"): "group:all_staff",
+                           ("api", "read"): "role:backend_dev", ("deploy", "read"): "role:backend_dev"}
+    finally:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+def test_precedence():
+    """测试判定优先级：个人特批 > 用户组 > 请求时的角色 > 默认拒绝"""
+    try:
+        pm = _manager()
+        # 个人特批覆盖所在组的拒绝
+        assert pm.has_permission("u002", "guest", "doc", "api", "write")
+        # 个人拒绝覆盖角色允许
+        assert not pm.has_permission("u003", "secretary", "doc", "minutes", "read")
+        # 组权限覆盖请求时角色的权限：dev_team 拒绝写 api，即使以 boss 身份请求
+        pm.add_permission(user_id=None, role="boss", resource_type="doc", resource_id="api", action="write", allow=True)
+        assert pm.has_permission("u100", "boss", "doc", "api", "write")
+        assert not pm.has_permission("u001", "boss", "doc", "api", "write")
+        # 同一角色内先出现的条目生效
+        assert pm.has_permission("u100", "secretary", "doc", "minutes", "write")
+        # 没有任何匹配时默认拒绝
+        assert not pm.has_permission("u100", "boss", "doc", "unknown", "read")
+
+        # 新增的权限立即生效并写入权限表，重新加载后保持一致
+        reloaded = PermissionManager(TEST_DIR / "permissions.json", TEST_DIR / "role_hierarchy.json")
+        assert reloaded.has_permission("u100", "boss", "doc", "api", "write")
+        assert len(reloaded.list_permissions(role="boss")) == 1
+    finally:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+def test_cli_report():
+    """测试有效权限报告命令行：输出角色继承链、合并后的权限及其来源"""
+    try:
+        _manager()
+        output = subprocess.run(
+            [sys.executable, str(project_root / "src/permission_manager.py"), "--user-id", "u001", "--role", "boss",
+             "--permission-file", str(TEST_DIR / "permissions.json"),
+             "--hierarchy-file", str(TEST_DIR / "role_hierarchy.json")],
+            capture_output=True, text=True, check=True).stdout
+        lines = output.splitlines()
+        assert lines[0] == "角色继承链: boss -> tech_lead -> secretary -> backend_dev"
+        assert "doc/api write: 拒绝 (来源 group:dev_team)" in lines
+        assert "doc/wiki read: 允许 (来源 group:all_staff)" in lines
+        # 用户组经 backend_dev 获得的允许优先于 boss 继承链上 tech_lead 的拒绝
+        assert "doc/deploy read: 允许 (来源 role:backend_dev)" in lines
+        assert "doc/minutes read: 允许 (来源 role:secretary)" in lines
+        assert len(lines) == 1 + 6
+    finally:
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_role_inheritance_chain()
+    test_group_grants()
+    test_precedence()
+    test_cli_report()
+    print("权限管理测试通过")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+请求调度测试脚本
+验证限额解析、令牌桶、并发上限与优先级、按模型排队、限流识别和退避重试
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_gateway import GatewayLLM
+from src.rate_limiter import (RequestScheduler, TokenBucket, LLMRateLimited, parse_rate_limit, is_rate_limit_error,
+                              PRIORITY_CONSENSUS, PRIORITY_NORMAL)
+from src.fake_provider import FakeCompletion, FakeRateLimitError
+
+def test_rate_limit_pacing():
+    """测试限额解析和令牌桶：超过每分钟额度的请求需要等待"""
+    assert parse_rate_limit("1000 RPM") == {"rpm": 1000}
+    assert parse_rate_limit("500 RPM, 200K TPM") == {"rpm": 500, "tpm": 200000}
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60) == 0
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+    bucket.refund(30)
+    assert bucket.wait_time(30) == 0
+
+    scheduler = RequestScheduler({"fake-model": {"rpm": 600}}, max_in_flight=4)
+    scheduler._bucket("fake-model", "rpm").tokens = 1
+    begin = time.time()
+    for _ in range(3):
+        scheduler.run(lambda: "ok", "fake-model")
+    # 第一个请求立即执行，之后每0.1秒补充一个
+    assert 0.15 < time.time() - begin < 0.5
+
+def test_priority_and_in_flight():
+    """测试同时进行的请求数不超过上限，排队请求中共识文档优先"""
+    fake = FakeCompletion(latency=0.05)
+    scheduler = RequestScheduler(max_in_flight=2)
+    gate = threading.Event()
+    order = []
+
+    def request(label, priority):
+        # 取得执行名额的顺序即调度顺序
+        scheduler.run(lambda: (gate.wait(5), order.append(label), fake(messages=[])), "fake-model", priority=priority)
+
+    def wait_queued(count):
+        deadline = time.time() + 5
+        while scheduler.waiting_count() < count and time.time() < deadline:
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=request, args=(f"发言{i}", PRIORITY_NORMAL)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_queued(2)
+    # 共识请求最后到达，但排在等待中的普通发言之前
+    threads.append(threading.Thread(target=request, args=("共识", PRIORITY_CONSENSUS)))
+    threads[-1].start()
+    wait_queued(3)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert fake.stats["max_concurrent"] == 2
+    assert order.index("共识") == 2
+    assert scheduler.stats["requests"] == 5 and scheduler.stats["queued"] == 3
+
+def test_per_model_queues():
+    """测试一个模型的令牌桶耗尽时，其他模型的请求不被排在前面的请求卡住"""
+    scheduler = RequestScheduler({"slow-model": {"rpm": 60}}, max_in_flight=4)
+    scheduler._bucket("slow-model", "rpm").tokens = 0
+    blocked = threading.Thread(target=scheduler.run, args=(lambda: "ok", "slow-model"), kwargs={"priority": PRIORITY_CONSENSUS})
+    blocked.start()
+    deadline = time.time() + 5
+    while scheduler.waiting_count() < 1 and time.time() < deadline:
+        time.sleep(0.005)
+    begin = time.time()
+    assert scheduler.run(lambda: "ok", "fast-model") == "ok"
+    assert time.time() - begin < 0.5
+    assert scheduler.waiting_count() == 1
+    blocked.join()
+
+def test_rate_limit_detection():
+    """测试只按状态码和异常类型识别限流，错误文本中出现429不算"""
+    class RateLimitError(Exception):
+        pass
+    assert is_rate_limit_error(RateLimitError("slow down"))
+    assert is_rate_limit_error(FakeRateLimitError())
+    assert not is_rate_limit_error(ValueError("订单号 429 不存在"))
+    assert not is_rate_limit_error(RuntimeError("rate limit exceeded in user content"))
+
+def test_rate_limit_retry():
+    """测试模拟接口返回429时退避重试，重试用尽后抛出 LLMRateLimited"""
+    fake = FakeCompletion(rate_limit_ratio=0.5, seed=7)
+    scheduler = RequestScheduler(max_retries=8, base_delay=0.01, max_delay=0.05)
+    for _ in range(5):
+        response = scheduler.run(lambda: fake(messages=[{"role": "user", "content": "你好"}]), "fake-model")
+        assert "Final Answer" in response.choices[0].message.content
+    assert scheduler.stats["throttled"] == fake.stats["rate_limited"] > 0
+
+    scheduler = RequestScheduler(max_retries=2, base_delay=0.01)
+    try:
+        scheduler.run(lambda: FakeCompletion(rate_limit_ratio=1.0)(messages=[]), "fake-model")
+        assert False, "应抛出 LLMRateLimited"
+    except LLMRateLimited:
+        assert scheduler.stats["retries"] == 2 and scheduler.in_flight == 0
+
+    # 网关经调度器调用模拟接口，流式输出正常
+    llm = GatewayLLM(model="gpt-4.1-mini", stream_mode="log")
+    llm._completion_fn = FakeCompletion(latency=0.01)
+    assert "Final Answer" in llm.call("列出核心功能")
+
+if __name__ == "__main__":
+    test_rate_limit_pacing()
+    test_priority_and_in_flight()
+    test_per_model_queues()
+    test_rate_limit_detection()
+    test_rate_limit_retry()
+    print("请求调度测试通过")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+阶段依赖图调度测试脚本
+验证拓扑顺序、独立阶段并发执行、失败处理，以及实际流水线的阶段依赖
+"""
+
+import sys
+import time
+import shutil
+import threading
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.stage_scheduler import StageGraph
+
+DEPENDENCIES = {
+    "requirement_analysis": ["initial"],
+    "technical_design": ["requirement_analysis"],
+    "ui_design": ["requirement_analysis", "technical_design"],
+    "backend_development": ["requirement_analysis", "technical_design"],
+    "data_analysis": ["requirement_analysis", "technical_design"],
+    "acceptance": ["ui_design", "backend_development", "data_analysis"]
+}
+
+def test_parallel_stages_follow_critical_path():
+    """测试独立阶段并发执行，总耗时接近关键路径"""
+    graph = StageGraph(DEPENDENCIES)
+    assert graph.order[:2] == ["requirement_analysis", "technical_design"]
+    assert graph.order[-1] == "acceptance"
+
+    finished = []
+    lock = threading.Lock()
+
+    def run_stage(stage):
+        # 依赖必须先完成
+        with lock:
+            assert all(dep in finished for dep in graph.dependencies[stage])
+        time.sleep(0.2)
+        with lock:
+            finished.append(stage)
+
+    begin = time.time()
+    completed = graph.run(run_stage, max_workers=3)
+    elapsed = time.time() - begin
+    assert sorted(completed) == sorted(DEPENDENCIES)
+    # 关键路径为4个阶段（0.8秒），串行执行需要1.2秒
+    assert elapsed < 1.1, elapsed
+    total, path = graph.critical_path({stage: 0.2 for stage in DEPENDENCIES})
+    assert len(path) == 4 and abs(total - 0.8) < 1e-9
+
+def test_failed_stage_blocks_dependents():
+    """测试阶段失败后不再调度依赖它的阶段，并抛出异常"""
+    graph = StageGraph(DEPENDENCIES)
+    started = []
+
+    def run_stage(stage):
+        started.append(stage)
+        if stage == "backend_development":
+            raise RuntimeError("后端讨论失败")
+
+    try:
+        graph.run(run_stage, max_workers=3)
+        assert False, "应当抛出异常"
+    except RuntimeError as e:
+        assert "后端讨论失败" in str(e)
+    assert "acceptance" not in started
+
+def test_cycle_detection():
+    """测试依赖成环时报错"""
+    try:
+        StageGraph({"a": ["b"], "b": ["a"]})
+        assert False, "应当检测到环"
+    except ValueError as e:
+        assert "环" in str(e)
+
+def test_pipeline_stage_order():
+    """测试实际流水线的阶段依赖：代码生成在设计和开发讨论之后，每个阶段都在其依赖完成后才开始"""
+    from src.crew import AiTeamCrew, STAGE_SPECS
+
+    project_dir = "test_stage_order_project"
+    try:
+        dependencies = AiTeamCrew(project_dir=project_dir)._stage_dependencies()
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+    graph = StageGraph(dependencies)
+    assert set(graph.order) == set(STAGE_SPECS)
+    position = {stage: index for index, stage in enumerate(graph.order)}
+    for stage, deps in graph.dependencies.items():
+        assert all(position[dep] < position[stage] for dep in deps), stage
+    assert graph.order[0] == "requirement_analysis"
+    for stage, required in (("frontend_code", ["technical_design", "ui_design", "frontend_development"]),
+                            ("backend_code", ["technical_design", "backend_development"])):
+        assert set(required) <= set(graph.dependencies[stage]), stage
+
+    # 并发调度时同样不会提前开始
+    finished = []
+    lock = threading.Lock()
+
+    def run_stage(stage):
+        with lock:
+            assert all(dep in finished for dep in graph.dependencies[stage]), stage
+        time.sleep(0.01)
+        with lock:
+            finished.append(stage)
+
+    graph.run(run_stage, max_workers=4)
+    assert len(finished) == len(STAGE_SPECS)
+
+if __name__ == "__main__":
+    test_parallel_stages_follow_critical_path()
+    test_failed_stage_blocks_dependents()
+    test_cycle_detection()
+    test_pipeline_stage_order()
+    print("阶段调度测试通过")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+运行实例工厂测试脚本
+验证每次运行复制出的Agent和任务互相隔离，与原型共享只读定义，且创建开销在微秒级
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.crew import AGENTS, TASKS, AiTeamCrew, create_team
+
+def test_runs_are_isolated():
+    """测试两个运行的Agent绑定各自的项目目录，任务指向本运行的Agent，原型不被修改"""
+    first = create_team("甲", "projects/甲")
+    second = create_team("乙", "projects/乙")
+    assert first.agents["tech_lead"]._project_dir == "projects/甲"
+    assert second.agents["tech_lead"]._project_dir == "projects/乙"
+    assert AGENTS["tech_lead"]._project_dir == ""
+    assert first.agents["tech_lead"] is not second.agents["tech_lead"]
+    assert first.agents["tech_lead"]._execution_lock is not second.agents["tech_lead"]._execution_lock
+    assert first.agents["tech_lead"].tools_handler is not AGENTS["tech_lead"].tools_handler
+
+    # 只读定义与原型共享，不重新创建LLM和工具
+    assert first.agents["tech_lead"].llm is AGENTS["tech_lead"].llm
+    assert first.agents["tech_lead"].tools[0] is AGENTS["tech_lead"].tools[0]
+
+    testing = first.task("testing")
+    assert testing.agent is first.agents["qa_engineer"]
+    assert testing is not next(t for t in TASKS if t.name == "testing")
+    assert len(first.tasks) == len(TASKS)
+
+    crew = AiTeamCrew(project_dir="projects/丙")
+    assert crew.team.agents["product_manager"]._project_dir == "projects/丙"
+    assert first.agents["product_manager"]._project_dir == "projects/甲"
+
+def test_team_creation_is_cheap():
+    """测试创建一次运行的全部Agent和任务不超过2毫秒（11个Agent和11个任务）"""
+    create_team()
+    runs = 100
+    begin = time.perf_counter()
+    for i in range(runs):
+        create_team(str(i), f"projects/{i}")
+    elapsed = (time.perf_counter() - begin) / runs
+    assert elapsed < 0.002, f"{elapsed * 1e6:.0f}us"
+
+if __name__ == "__main__":
+    test_runs_are_isolated()
+    test_team_creation_is_cheap()
+    print("运行实例工厂测试通过")
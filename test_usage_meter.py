@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+用量计量测试脚本
+验证按阶段、轮次、Agent汇总用量，重新打开时累加，批量写盘，以及软硬预算
+"""
+
+import os
+import sys
+import json
+import shutil
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.usage_meter import UsageMeter, BudgetExceeded, load_model_prices, usage_scope
+
+def test_usage_rollup_and_budget():
+    """测试按阶段、轮次、Agent汇总用量，重新打开时累加，以及软硬预算"""
+    project_dir = "test_usage_project"
+    try:
+        prices = load_model_prices()
+        assert prices["gpt-4o-mini"]["input"] > 0
+        meter = UsageMeter(project_dir, prices={"gpt-4.1-mini": {"input": 1.0, "output": 2.0}},
+                           soft_budget=2.0, hard_budget=5.0)
+        with usage_scope(stage="technical_design"):
+            with usage_scope(round=1):
+                assert meter.record("openai/gpt-4.1-mini", "技术总监", 1000, 500, 1.5) == 2.0
+            meter.record("gpt-4.1-mini", "产品经理", 500, 0, 0.5, round_num="consensus")
+        meter.record("unknown-model", "测试工程师", 100, 100, 0.1)
+        assert meter.budget_state() == "soft"
+        assert meter.usage["by_round"]["technical_design#1"]["cost"] == 2.0
+        assert meter.usage["by_stage"]["technical_design"]["calls"] == 2
+        assert meter.usage["by_agent"]["测试工程师"]["cost"] == 0.0
+        meter.check("需求分析阶段")
+
+        # 间隔内的记录合并写盘：只有第一次记录已落盘，flush 后写入全部
+        assert json.load(open(meter.usage_file, encoding='utf-8'))["project"]["calls"] == 1
+        meter.flush()
+        assert json.load(open(meter.usage_file, encoding='utf-8'))["project"]["calls"] == 3
+
+        reopened = UsageMeter(project_dir, prices=meter.prices, hard_budget=5.0)
+        reopened.record("gpt-4.1-mini", "技术总监", 1000, 1000, 1.0)
+        assert reopened.usage["project"]["calls"] == 4 and reopened.budget_state() == "hard"
+        # 项目目录被删除后，后台定时写盘不会重建目录
+        shutil.rmtree(project_dir)
+        reopened.record("gpt-4.1-mini", "技术总监", 10, 10, 0.1)
+        reopened.flush(create_dir=False)
+        assert not os.path.exists(project_dir)
+        try:
+            reopened.check("验收阶段")
+            assert False, "达到硬上限应暂停"
+        except BudgetExceeded as e:
+            assert "验收阶段" in str(e)
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_usage_rollup_and_budget()
+    print("用量计量测试通过")